@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmark comparing the CitrixHoneypot and Rdpy filters of
+# configFiles/logstash.conf.template against the grok-based filters they replaced
+# (fixtures/legacyParsers.conf). Runs both through Logstash in docker on the fixture
+# log lines, checks that they parse every line into the same fields, apart from the
+# lines listed in NEWLY_PARSED, and reports events/sec for each. Run from anywhere
+# with `python3 benchmarks/benchmarkParsers.py`
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(BENCH_DIR, "..", "configFiles", "logstash.conf.template")
+LEGACY_PATH = os.path.join(BENCH_DIR, "fixtures", "legacyParsers.conf")
+
+# honeypot type -> (fixture file, logstash codec), same as the template's inputs
+FIXTURES = {
+    "CitrixHoneypot": ("citrixhoneypot.json", "json"),
+    "Rdpy": ("rdpy.log", "plain"),
+}
+
+# login attempts the legacy grok dropped because CISCO_REASON only matches words, but
+# the dissect parser indexes on purpose. Matched by these fields, each exactly once
+NEWLY_PARSED = [
+    {"type": "Rdpy", "username": "administrator", "password": "P@ssw0rd"},
+    {"type": "Rdpy", "username": "user", "password": "qwerty,123"},
+]
+
+# fields added by the file input itself, which differ between runs
+IGNORED_FIELDS = ["path", "host", "@version", "log", "event", "message"]
+
+PIPELINE = """input {{
+{inputs}
+}}
+
+{filters}
+
+filter {{
+  if "_grokparsefailure" in [tags] or "_dissectfailure" in [tags] {{ drop {{}} }}
+  if [src_port] {{ mutate {{ convert => {{ "src_port" => "integer" }} }} }}
+}}
+
+output {{
+  file {{
+    path => "/bench/output.json"
+    codec => json_lines
+  }}
+}}
+"""
+
+FILE_INPUT = """  file {{
+    path => ["/bench/{fileName}"]
+    codec => {codec}
+    type => "{honeypotType}"
+    mode => "read"
+    exit_after_read => true
+    sincedb_path => "/dev/null"
+    file_completed_action => "log"
+    file_completed_log_path => "/dev/null"
+  }}"""
+
+
+def extractTypeFilter(templateText, honeypotType):
+    """Extract the conditional filter block of one honeypot type from logstash.conf
+
+    :templateText: text of logstash.conf.template
+    :honeypotType: honeypot type, as in the type field of the file inputs
+    :returns: text of the `if [type] == "honeypotType" { ... }` block
+
+    """
+    start = templateText.index(f'  if [type] == "{honeypotType}" {{')
+    depth = 0
+
+    for index in range(templateText.index("{", start), len(templateText)):
+        if templateText[index] == "{":
+            depth += 1
+        elif templateText[index] == "}":
+            depth -= 1
+
+            if depth == 0:
+                return templateText[start : index + 1]
+
+
+def runLogstash(workDir, filters, repetitions, image):
+    """Run fixture lines through Logstash with the given filters
+
+    :workDir: temporary directory mounted as /bench in the Logstash container
+    :filters: text of the filter section(s) to benchmark
+    :repetitions: number of times to repeat each fixture file
+    :image: Logstash docker image to use
+    :returns: tuple of the form (parsed events, seconds taken)
+
+    """
+    inputs = []
+
+    for honeypotType, (fileName, codec) in FIXTURES.items():
+        with open(os.path.join(BENCH_DIR, "fixtures", fileName)) as f:
+            lines = f.read()
+
+        with open(os.path.join(workDir, fileName), "w") as f:
+            f.write(lines * repetitions)
+
+        inputs.append(
+            FILE_INPUT.format(fileName=fileName, codec=codec, honeypotType=honeypotType)
+        )
+
+    with open(os.path.join(workDir, "pipeline.conf"), "w") as f:
+        f.write(PIPELINE.format(inputs="\n".join(inputs), filters=filters))
+
+    outputPath = os.path.join(workDir, "output.json")
+
+    if os.path.exists(outputPath):
+        os.remove(outputPath)
+
+    startTime = time.time()
+    subprocess.run(
+        [
+            "docker",
+            "run",
+            "--rm",
+            "-v",
+            f"{workDir}:/bench",
+            image,
+            "logstash",
+            "-f",
+            "/bench/pipeline.conf",
+            "--pipeline.workers",
+            "1",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    elapsed = time.time() - startTime
+
+    with open(outputPath) as f:
+        events = [json.loads(line) for line in f]
+
+    return events, elapsed
+
+
+def normalizeEvents(events):
+    """Drop fields that differ between runs and sort events to compare them
+
+    :events: list of parsed events
+    :returns: sorted list of events as JSON strings
+
+    """
+    return sorted(
+        json.dumps(
+            {key: val for key, val in event.items() if key not in IGNORED_FIELDS},
+            sort_keys=True,
+        )
+        for event in events
+    )
+
+
+def splitNewlyParsed(events):
+    """Separate the events listed in NEWLY_PARSED from the others
+
+    :events: list of events parsed by the current filters
+    :returns: tuple of the form (other events, number of events matching each entry
+              of NEWLY_PARSED)
+
+    """
+    counts = [0] * len(NEWLY_PARSED)
+    otherEvents = []
+
+    for event in events:
+        for index, expected in enumerate(NEWLY_PARSED):
+            if expected.items() <= event.items():
+                counts[index] += 1
+                break
+        else:
+            otherEvents.append(event)
+
+    return otherEvents, counts
+
+
+def benchmarkParsers(repetitions, image):
+    """Compare current and legacy parsers for correctness and speed
+
+    :repetitions: number of times to repeat each fixture file in the timed run
+    :image: Logstash docker image to use
+    :returns: True if both parsers produce the same fields, False otherwise
+
+    """
+    with open(TEMPLATE_PATH) as f:
+        templateText = f.read()
+
+    with open(LEGACY_PATH) as f:
+        legacyFilters = f.read()
+
+    currentFilters = "filter {\n%s\n}\n" % "\n".join(
+        extractTypeFilter(templateText, honeypotType) for honeypotType in FIXTURES
+    )
+
+    identical = True
+
+    with tempfile.TemporaryDirectory() as workDir:
+        # single pass over the fixtures to compare parsed fields line by line
+        legacyEvents, _ = runLogstash(workDir, legacyFilters, 1, image)
+        currentEvents, _ = runLogstash(workDir, currentFilters, 1, image)
+        currentEvents, newlyParsedCounts = splitNewlyParsed(currentEvents)
+
+        for expected, count in zip(NEWLY_PARSED, newlyParsedCounts):
+            if count != 1:
+                identical = False
+                print(f"MISMATCH: {count} events match newly parsed {expected}")
+
+        for legacyEvent, currentEvent in zip(
+            normalizeEvents(legacyEvents), normalizeEvents(currentEvents)
+        ):
+            if legacyEvent != currentEvent:
+                identical = False
+                print(f"MISMATCH\n  legacy:  {legacyEvent}\n  current: {currentEvent}")
+
+        if len(legacyEvents) != len(currentEvents):
+            identical = False
+            print(
+                f"MISMATCH: legacy parsed {len(legacyEvents)} events,"
+                f" current parsed {len(currentEvents)}"
+            )
+
+        # empty run to subtract JVM and pipeline startup from the timed runs
+        _, startupTime = runLogstash(workDir, currentFilters, 0, image)
+
+        for name, filters in [("legacy", legacyFilters), ("current", currentFilters)]:
+            events, elapsed = runLogstash(workDir, filters, repetitions, image)
+            eventsPerSec = len(events) / max(elapsed - startupTime, 1e-3)
+            print(f"{name}: {len(events)} events, {eventsPerSec:.0f} events/sec")
+
+    print("Parsed fields identical" if identical else "Parsed fields differ")
+
+    return identical
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare current and legacy CitrixHoneypot/Rdpy Logstash parsers"
+    )
+    parser.add_argument(
+        "--repetitions",
+        type=int,
+        default=20000,
+        help="number of times to repeat each fixture file in the timed runs",
+    )
+    parser.add_argument(
+        "--image",
+        default="docker.elastic.co/logstash/logstash:7.17.0",
+        help="Logstash docker image to run the pipelines with",
+    )
+    args = parser.parse_args()
+
+    sys.exit(0 if benchmarkParsers(args.repetitions, args.image) else 1)
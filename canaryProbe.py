@@ -0,0 +1,335 @@
+import argparse
+import json
+import math
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.exceptions import HTTPError
+
+from configFuncs import loadHoneypotProfiles, profileHoneypots
+from deploymentHelpers import CANARY_FIELD, dataStreamName
+from errors import BadAPIRequestError
+from fleet import connectHost, runCommand
+from latencyReport import PERCENTS
+from utils import findPassword
+
+# Script measuring how long an attack takes to become searchable: it appends a
+# synthetic event with a unique id to a honeypot log on every sensor, polls
+# Elasticsearch until the event is indexed and records the latency in canary.jsonl.
+# Canary events are marked by CANARY_FIELD, which dashboards and summary transforms
+# filter out.
+# Run by fabfile.deployNetwork once sensors are set up and from cron afterwards.
+# Run `python3 canaryProbe.py <workspace> --report` for percentiles
+
+# honeypot type -> (log file its sensors ship, field holding the canary id in the
+# log, field holding it once parsed), in order of preference. Fields are kept by
+# configFiles/fieldAllowlist.json
+CANARY_EVENTS = {
+    "Cowrie": ("/data/cowrie/log/cowrie.json", "session", "session"),
+    "ElasticPot": (
+        "/data/elasticpot/log/elasticpot.json",
+        "user_agent",
+        "http_user_agent",
+    ),
+    # Logstash and Filebeat pick up new files matching /data/conpot/log/*.json
+    "ConPot": ("/data/conpot/log/canary.json", "session_id", "session_id"),
+}
+CANARY_LOG = "canary.jsonl"
+# never a real attacker
+CANARY_SOURCE_IP = "127.0.0.1"
+
+
+def chooseCanaryType(sensorObj):
+    """Choose honeypot whose log gets the canary event of a sensor
+
+    :sensorObj: JSON object representing sensor server
+    :returns: honeypot type (key of CANARY_EVENTS), or None if the sensor's profile
+    runs none of them
+
+    """
+    enabled = profileHoneypots(loadHoneypotProfiles(), sensorObj.get("profile"))
+
+    return next((htype for htype in CANARY_EVENTS if htype in enabled), None)
+
+
+def writeCanary(connection, honeypotType, canaryId, timestamp):
+    """Append a canary event to a honeypot log on a sensor
+
+    :connection: fabric.Connection object to sensor server
+    :honeypotType: honeypot type (key of CANARY_EVENTS)
+    :canaryId: unique id of canary event
+    :timestamp: datetime of canary event, which becomes its @timestamp
+    :returns: True if the event got written, False otherwise
+
+    """
+    logPath, logField, _ = CANARY_EVENTS[honeypotType]
+    event = {
+        "timestamp": timestamp.isoformat(),
+        "src_ip": CANARY_SOURCE_IP,
+        CANARY_FIELD: True,
+        logField: canaryId,
+    }
+    # JSON has no single quotes, so it survives the shell as is
+    exitCode, _ = runCommand(
+        connection,
+        f"sh -c 'echo {json.dumps(json.dumps(event))} >> {logPath}'",
+        useSudo=True,
+        timeout=30,
+    )
+
+    return exitCode == 0
+
+
+def findCanary(hostPort, userName, password, honeypotType, canaryId):
+    """Search for a canary event in the data stream of its honeypot type
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :honeypotType: honeypot type (key of CANARY_EVENTS)
+    :canaryId: unique id of canary event
+    :returns: JSON object of event, or None if it isn't searchable yet
+
+    """
+    searchResp = requests.post(
+        f"https://{hostPort}/{dataStreamName(honeypotType)}/_search",
+        auth=(userName, password),
+        # the data stream only exists once its first event is indexed
+        params={"ignore_unavailable": "true"},
+        json={"query": {"match": {CANARY_EVENTS[honeypotType][2]: canaryId}}},
+    )
+
+    try:
+        searchResp.raise_for_status()
+    except HTTPError:
+        raise BadAPIRequestError(
+            f"{searchResp.text}\nBad API request. See response above."
+        )
+
+    hits = searchResp.json()["hits"]["hits"]
+
+    return hits[0]["_source"] if hits else None
+
+
+def probeSensor(
+    connection, sensorObj, hostPort, userName, password, timeout=120, pollInterval=2
+):
+    """Write a canary event on a sensor and wait until it is searchable
+
+    :connection: fabric.Connection object to sensor server
+    :sensorObj: JSON object representing sensor server
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :timeout: optional, seconds to wait for the event, including retries of writing
+    it while the sensor is unreachable. Defaults to 120
+    :pollInterval: optional, seconds between two searches. Defaults to 2
+    :returns: dictionary with time, host and type keys, and either searchableMs
+    (milliseconds between writing the event and finding it) and ingestLatencyMs (as
+    recorded by the tpot-ingest-latency pipeline), or error
+
+    """
+    result = {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "host": sensorObj["host"],
+        "type": chooseCanaryType(sensorObj),
+    }
+
+    if result["type"] is None:
+        return {**result, "error": "no canary honeypot in profile"}
+
+    canaryId = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+
+    # sensors can still be rebooting after installTPot
+    while True:
+        startTime = time.monotonic()
+
+        if writeCanary(
+            connection, result["type"], canaryId, datetime.now(timezone.utc)
+        ):
+            break
+
+        if time.monotonic() > deadline:
+            return {**result, "error": "could not write canary event"}
+
+        time.sleep(pollInterval)
+
+    while time.monotonic() < deadline:
+        event = findCanary(hostPort, userName, password, result["type"], canaryId)
+
+        if event is not None:
+            return {
+                **result,
+                "searchableMs": round((time.monotonic() - startTime) * 1000),
+                "ingestLatencyMs": event.get("ingest_latency_ms"),
+            }
+
+        time.sleep(pollInterval)
+
+    return {**result, "error": f"not searchable after {timeout}s"}
+
+
+def probeFleet(
+    connections,
+    sensorObjs,
+    hostPort,
+    userName,
+    password,
+    timeout=120,
+    logPath=CANARY_LOG,
+):
+    """Probe every sensor in parallel and append the results to logPath
+
+    :connections: list of fabric.Connection objects to sensor servers, in the same
+    order as sensorObjs
+    :sensorObjs: array of JSON objects representing sensor servers
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :timeout: optional, seconds to wait for each canary event. Defaults to 120
+    :logPath: optional, path of JSON lines file to append results to, in the
+    network's workspace. Defaults to CANARY_LOG
+    :returns: list of results (as returned by probeSensor)
+
+    """
+    with ThreadPoolExecutor(max_workers=max(len(sensorObjs), 1)) as executor:
+        futures = [
+            executor.submit(
+                probeSensor, conn, sensor, hostPort, userName, password, timeout
+            )
+            for conn, sensor in zip(connections, sensorObjs)
+        ]
+
+    results = [future.result() for future in futures]
+
+    with open(logPath, "a") as f:
+        f.writelines(f"{json.dumps(result)}\n" for result in results)
+
+    return results
+
+
+def percentile(values, percent):
+    """Get a percentile of values with the nearest-rank method
+
+    :values: non-empty list of numbers
+    :percent: percentile to get, between 0 and 100
+    :returns: smallest value with at least percent% of values less or equal to it
+
+    """
+    sortedValues = sorted(values)
+
+    return sortedValues[max(math.ceil(percent * len(sortedValues) / 100) - 1, 0)]
+
+
+def summarizeProbes(results, hours=24):
+    """Get searchable latency percentiles of every sensor from probe results
+
+    :results: list of results (as returned by probeSensor, or read from CANARY_LOG)
+    :hours: optional, only keep results of the last hours. Defaults to 24
+    :returns: dictionary of the form {host: {"probes": count, "failed": count,
+    50: ms, 95: ms, 99: ms}}, with None percentiles for sensors without successes
+
+    """
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    latencies = {}
+    summary = {}
+
+    for result in results:
+        if datetime.fromisoformat(result["time"]) < since:
+            continue
+
+        hostSummary = summary.setdefault(result["host"], {"probes": 0, "failed": 0})
+        hostSummary["probes"] += 1
+
+        if "error" in result:
+            hostSummary["failed"] += 1
+        else:
+            latencies.setdefault(result["host"], []).append(result["searchableMs"])
+
+    for host, hostSummary in summary.items():
+        for percent in PERCENTS:
+            hostSummary[percent] = (
+                percentile(latencies[host], percent) if host in latencies else None
+            )
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure how long honeypot events take to become searchable"
+    )
+    parser.add_argument(
+        "workspace", help="path to workspace directory of the network (see README)"
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help=f"print latency percentiles from {CANARY_LOG} instead of probing",
+    )
+    parser.add_argument(
+        "--hours", type=int, default=24, help="number of hours of probes to report on"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=120,
+        help="seconds to wait for each canary event to become searchable",
+    )
+    args = parser.parse_args()
+
+    canaryLog = os.path.join(args.workspace, CANARY_LOG)
+
+    with open(os.path.join(args.workspace, "credentials.json")) as f:
+        credentials = json.load(f)
+
+    if args.report:
+        with open(canaryLog) as f:
+            summary = summarizeProbes(map(json.loads, f), args.hours)
+
+        print(
+            f"{'SENSOR':40} {'PROBES':>7} {'FAILED':>7}"
+            + "".join(f" {f'P{percent} MS':>10}" for percent in PERCENTS)
+        )
+
+        for host, hostSummary in sorted(summary.items()):
+            percentiles = "".join(
+                f" {'-' if hostSummary[percent] is None else hostSummary[percent]:>10}"
+                for percent in PERCENTS
+            )
+            print(
+                f"{host:40} {hostSummary['probes']:7} {hostSummary['failed']:7}"
+                f"{percentiles}"
+            )
+    else:
+        with open(os.path.join(args.workspace, "passwords.txt")) as f:
+            elasticPass = findPassword(f.read(), "elastic")
+
+        sensorCreds = credentials["sensors"]
+        sensorConns = [
+            connectHost(sensor, "sensor", credentials["sudouser"])
+            for sensor in sensorCreds
+        ]
+        results = probeFleet(
+            sensorConns,
+            sensorCreds,
+            f"{credentials['logging']['host']}:64298",
+            "elastic",
+            elasticPass,
+            args.timeout,
+            canaryLog,
+        )
+
+        for conn in sensorConns:
+            conn.close()
+
+        for result in results:
+            if "error" in result:
+                print(f"{result['host']}: {result['error']}")
+            else:
+                print(f"{result['host']}: searchable after {result['searchableMs']} ms")
@@ -0,0 +1,261 @@
+import argparse
+import json
+import math
+import os
+
+import requests
+from requests.exceptions import HTTPError
+
+from errors import BadAPIRequestError
+from utils import (findPassword, getLoggingNodes, nodeHasRole, splitDomain,
+                   tPotHostname, usesFilebeat)
+from vmManagement import hostSize
+
+# Script recommending droplet sizes for the sensors and logging nodes in
+# credentials.json from the event rates and resource usage measured by the logging
+# server. Run from the project directory with `python3 capacityPlanner.py`
+
+# rough sustained events/sec each droplet size handles per server role, smallest size
+# first. These are conservative estimates, adjust them to your own measurements
+SIZE_TIERS = {
+    "sensor": [("s-2vcpu-4gb", 300), ("s-4vcpu-8gb", 800), ("s-8vcpu-16gb", 2000)],
+    "shipper": [("s-1vcpu-2gb", 1000), ("s-2vcpu-4gb", 3000)],
+    "logger": [("s-4vcpu-8gb", 1500), ("s-8vcpu-16gb", 4000), ("g-8vcpu-32gb", 10000)],
+}
+# peak events/sec are multiplied by this to leave room for bursts
+HEADROOM = 2
+# logging node usage percentages above which it gets one size bigger
+USAGE_LIMITS = {"cpu": 80, "heap": 85, "disk": 85}
+# most date histogram buckets per sensor (24 hours of minutes), and most buckets per
+# search, below Elasticsearch's default search.max_buckets of 65536
+MAX_SENSOR_BUCKETS = 1440
+MAX_SEARCH_BUCKETS = 60000
+
+
+def getSensorRates(hostPort, userName, password, hours=24):
+    """Get average and peak events/sec of every sensor over the last hours, from the
+    t-pot_hostname field of honeypot events
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :hours: optional, number of hours to measure over. Defaults to 24
+    :returns: dictionary of the form {hostname: (average events/sec, peak events/sec)}
+    where the peak is the busiest minute, or the busiest few minutes when measuring
+    over more than a day
+
+    """
+    # widen the histogram interval so no sensor gets more than MAX_SENSOR_BUCKETS
+    intervalMinutes = math.ceil(hours * 60 / MAX_SENSOR_BUCKETS)
+    # page through sensors so a search never gets more than MAX_SEARCH_BUCKETS
+    sensorsPerPage = max(
+        MAX_SEARCH_BUCKETS // (math.ceil(hours * 60 / intervalMinutes) + 2), 1
+    )
+    query = {
+        "size": 0,
+        "query": {"range": {"@timestamp": {"gte": f"now-{hours}h"}}},
+        "aggs": {
+            "sensors": {
+                "composite": {
+                    "size": sensorsPerPage,
+                    "sources": [
+                        {"sensor": {"terms": {"field": "t-pot_hostname.keyword"}}}
+                    ],
+                },
+                "aggs": {
+                    "perInterval": {
+                        "date_histogram": {
+                            "field": "@timestamp",
+                            "fixed_interval": f"{intervalMinutes}m",
+                        }
+                    },
+                    "peakInterval": {
+                        "max_bucket": {"buckets_path": "perInterval._count"}
+                    },
+                },
+            }
+        },
+    }
+    rates = {}
+
+    while True:
+        searchResp = requests.post(
+            f"https://{hostPort}/tpot-*/_search", auth=(userName, password), json=query
+        )
+
+        try:
+            searchResp.raise_for_status()
+        except HTTPError:
+            raise BadAPIRequestError(
+                f"{searchResp.text}\nBad API request. See response above."
+            )
+
+        sensorsAgg = searchResp.json()["aggregations"]["sensors"]
+
+        for bucket in sensorsAgg["buckets"]:
+            rates[bucket["key"]["sensor"]] = (
+                bucket["doc_count"] / (hours * 3600),
+                bucket["peakInterval"]["value"] / (intervalMinutes * 60),
+            )
+
+        # the last page has no after_key, or no buckets
+        if not sensorsAgg["buckets"] or "after_key" not in sensorsAgg:
+            return rates
+
+        query["aggs"]["sensors"]["composite"]["after"] = sensorsAgg["after_key"]
+
+
+def getNodeUsage(hostPort, userName, password):
+    """Get CPU, JVM heap and disk usage of every elasticsearch node
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :returns: dictionary of the form {node name: {"cpu": %, "heap": %, "disk": %}}
+
+    """
+    statsResp = requests.get(
+        f"https://{hostPort}/_nodes/stats/os,jvm,fs", auth=(userName, password)
+    )
+
+    try:
+        statsResp.raise_for_status()
+    except HTTPError:
+        raise BadAPIRequestError(
+            f"{statsResp.text}\nBad API request. See response above."
+        )
+
+    usage = {}
+
+    for node in statsResp.json()["nodes"].values():
+        fsTotal = node["fs"]["total"]
+        freePercent = fsTotal["available_in_bytes"] * 100 / fsTotal["total_in_bytes"]
+        usage[node["name"]] = {
+            "cpu": node["os"]["cpu"]["percent"],
+            "heap": node["jvm"]["mem"]["heap_used_percent"],
+            "disk": 100 - freePercent,
+        }
+
+    return usage
+
+
+def recommendSize(eventsPerSec, tiers, overloaded=False):
+    """Recommend smallest droplet size handling an event rate with HEADROOM
+
+    :eventsPerSec: peak events/sec the droplet has to handle
+    :tiers: list of tuples of the form (size slug, events/sec), smallest first (one of
+    the lists in SIZE_TIERS)
+    :overloaded: optional, whether the droplet is already over one of USAGE_LIMITS,
+    in which case the next size up is recommended. Defaults to False
+    :returns: size slug, or the biggest size of tiers if none is big enough
+
+    """
+    for index, (_, capacity) in enumerate(tiers):
+        if capacity >= eventsPerSec * HEADROOM:
+            return tiers[min(index + overloaded, len(tiers) - 1)][0]
+
+    return tiers[-1][0]
+
+
+def planCapacity(loggingObj, sensorObjs, sensorRates, nodeUsage):
+    """Recommend droplet sizes for all servers in credentials.json
+
+    :loggingObj: JSON object representing logging server
+    :sensorObjs: array of JSON objects representing sensor servers
+    :sensorRates: event rates of sensors (as returned by getSensorRates)
+    :nodeUsage: resource usage of logging nodes (as returned by getNodeUsage)
+    :returns: list of dictionaries with host, role, current size, average and peak
+    events/sec, recommended size and notes keys
+
+    """
+    plan = []
+
+    for sensor in sensorObjs:
+        averageRate, peakRate = sensorRates.get(tPotHostname(sensor["host"]), (0, 0))
+        role = "shipper" if usesFilebeat(sensor) else "sensor"
+        plan.append(
+            {
+                "host": sensor["host"],
+                "role": role,
+                "current": hostSize(sensor),
+                "average": averageRate,
+                "peak": peakRate,
+                "recommended": recommendSize(peakRate, SIZE_TIERS[role]),
+                "notes": "" if averageRate else "no events measured",
+            }
+        )
+
+    # indexing load is spread over the data nodes
+    loggingNodes = getLoggingNodes(loggingObj)
+    dataNodes = [node for node in loggingNodes if nodeHasRole(node, "data")]
+    totalAverage = sum(averageRate for averageRate, _ in sensorRates.values())
+    totalPeak = sum(peakRate for _, peakRate in sensorRates.values())
+
+    for node in loggingNodes:
+        isDataNode = node in dataNodes
+        share = len(dataNodes) if isDataNode else 1
+        usage = nodeUsage.get(splitDomain(node["host"])[0], {})
+        overLimits = [
+            f"{name} {usage[name]:.0f}%"
+            for name, limit in USAGE_LIMITS.items()
+            if usage.get(name, 0) > limit
+        ]
+        plan.append(
+            {
+                "host": node["host"],
+                "role": "logger",
+                "current": hostSize(node, loggingNode=True),
+                "average": totalAverage / share,
+                "peak": totalPeak / share,
+                "recommended": recommendSize(
+                    totalPeak / share, SIZE_TIERS["logger"], bool(overLimits)
+                ),
+                "notes": ", ".join(overLimits),
+            }
+        )
+
+    return plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recommend droplet sizes from measured honeypot event rates"
+    )
+    parser.add_argument(
+        "--hours",
+        type=int,
+        default=24,
+        help="number of hours of honeypot data to measure event rates over",
+    )
+    parser.add_argument(
+        "--workspace",
+        default=".",
+        help="path to workspace directory of the network (see README)",
+    )
+    args = parser.parse_args()
+
+    with open(os.path.join(args.workspace, "credentials.json")) as f:
+        credentials = json.load(f)
+
+    with open(os.path.join(args.workspace, "passwords.txt")) as f:
+        elasticPass = findPassword(f.read(), "elastic")
+
+    hostPort = f"{credentials['logging']['host']}:64298"
+    plan = planCapacity(
+        credentials["logging"],
+        credentials["sensors"],
+        getSensorRates(hostPort, "elastic", elasticPass, args.hours),
+        getNodeUsage(hostPort, "elastic", elasticPass),
+    )
+
+    print(
+        f"{'HOST':40} {'ROLE':8} {'CURRENT':14} {'AVG/S':>8} {'PEAK/S':>8}"
+        f" {'RECOMMENDED':14} NOTES"
+    )
+
+    for row in plan:
+        print(
+            f"{row['host']:40} {row['role']:8} {row['current']:14}"
+            f" {row['average']:8.1f} {row['peak']:8.1f} {row['recommended']:14}"
+            f" {row['notes']}"
+        )
@@ -1,119 +1,664 @@
-def createElasticsearchYml(pathToPrivKey, pathToHostCert, pathToFullCert):
-    """Create elasticsearch.yml file for logging server from
-    configFiles/elasticsearch.yml.template
+import json
+import os
+import re
+from functools import lru_cache
+
+from deploymentHelpers import ENRICH_PIPELINE, TPOT_USER
+from errors import UnknownProfileError, UnresolvedPlaceholderError
+from utils import (centralLogstashHost, dropletMemoryMb, findRelay,
+                   getIngestHosts, getLoggingNodes, nodeHasRole, privateHost,
+                   replaceComposeService, splitDomain, usesFilebeat)
+
+# scripts and templates are read from the project directory, wherever they run from
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_DIR = os.path.join(PROJECT_DIR, "configFiles")
+# largest heap still using compressed object pointers
+MAX_HEAP_MB = 31 * 1024
+# placeholders in configFiles templates, such as {{LOGSTASH_HOST}}
+PLACEHOLDER_REGEX = re.compile(r"\{\{(\w+)\}\}")
+# config directories on the servers, where fabfile.py writes the rendered files and
+# reconfigure.py compares them
+ELASTIC_PATH = "/etc/elasticsearch"
+KIBANA_PATH = "/etc/kibana"
+LOGSTASH_PATH = "/etc/logstash"
+SENSOR_DATA_PATH = "/data/elk"
+
+
+def applyTemplateBlocks(text, removedBlocks):
+    """Remove optional blocks from template text. Blocks are delimited by
+    "# BEGIN_BLOCK name" and "# END_BLOCK name" lines, which are stripped from the
+    blocks that are kept
+
+    :text: template text
+    :removedBlocks: list of names of blocks to remove along with their content
+    :returns: template text with blocks applied
+
+    """
+    for blockName in removedBlocks:
+        text = re.sub(
+            rf"^# BEGIN_BLOCK {blockName}\n.*?^# END_BLOCK {blockName}\n",
+            "",
+            text,
+            flags=re.MULTILINE | re.DOTALL,
+        )
+
+    return re.sub(r"^# (BEGIN|END)_BLOCK \S+\n", "", text, flags=re.MULTILINE)
 
-    :pathToPrivKey: path to SSL private key on logging server
-    :pathToHostCert: path to host SSL certificate on logging server
-    :pathToFullCert: path to full SSL certificate on logging server
-    :returns: path to newly-created elasticsearch.yml file
+
+@lru_cache(maxsize=None)
+def compileTemplate(templatePath, removedBlocks=()):
+    """Read a template and split it on its placeholders, once per template and set of
+    removed blocks
+
+    :templatePath: path to template file
+    :removedBlocks: optional, tuple of names of blocks to remove (see
+    applyTemplateBlocks). Defaults to keeping every block
+    :returns: tuple alternating literal text and placeholder names, starting and
+    ending with literal text
 
     """
-    with open("configFiles/elasticsearch.yml.template") as f:
-        elasticYml = f.read()
+    with open(templatePath) as f:
+        text = applyTemplateBlocks(f.read(), removedBlocks)
 
-    elasticYml = elasticYml.replace("PATH_TO_PRIV_KEY", pathToPrivKey)
-    elasticYml = elasticYml.replace("PATH_TO_HOST_CERT", pathToHostCert)
-    elasticYml = elasticYml.replace("PATH_TO_FULL_CERT", pathToFullCert)
+    return tuple(PLACEHOLDER_REGEX.split(text))
 
-    destFile = "configFiles/elasticsearch.yml"
 
-    with open(destFile, "w") as f:
-        f.write(elasticYml)
+def renderTemplate(templatePath, values, removedBlocks=()):
+    """Render a template in memory, substituting all of its placeholders in one pass
 
-    return destFile
+    :templatePath: path to template file
+    :values: dictionary mapping placeholder names to their values. Values are
+    inserted as is, so they can't introduce new placeholders
+    :removedBlocks: optional, iterable of names of blocks to remove (see
+    applyTemplateBlocks). Placeholders in removed blocks don't need values
+    :returns: rendered text
 
+    """
+    parts = compileTemplate(templatePath, tuple(sorted(removedBlocks)))
+    unresolved = sorted(set(parts[1::2]) - set(values))
 
-def createKibanaYml(domainName, kibanaSystemPwd, pathToPrivKey, pathToFullCert):
-    """Create kibana.yml file for logging server from configFiles/kibana.yml.template
+    if unresolved:
+        raise UnresolvedPlaceholderError(
+            f"{templatePath} has no value for {', '.join(unresolved)}"
+        )
 
-    :domainName: FQDN of logging server
-    :kibanaSystemPwd: password to kibana_system user (created by
-    elasticsearch-setup-passwords)
-    :pathToPrivKey: path to SSL private key on logging server
-    :pathToFullCert: path to full SSL certificate on logging server
-    :returns: path to newly-created kibana.yml file
+    # placeholder names are at odd indices
+    return "".join(
+        str(values[part]) if index % 2 else part for index, part in enumerate(parts)
+    )
+
+
+def loadFieldAllowlist(allowlistPath=f"{CONFIG_DIR}/fieldAllowlist.json"):
+    """Load per-honeypot field allowlist applied to events before sensors ship them
+
+    :allowlistPath: optional, path to allowlist file. Defaults to
+    configFiles/fieldAllowlist.json
+    :returns: dictionary mapping honeypot types to lists of top-level fields to keep,
+    with fields kept for every type under the "common" key
 
     """
-    with open("configFiles/kibana.yml.template") as f:
-        kibanaYml = f.read()
+    with open(allowlistPath) as f:
+        return json.load(f)
 
-    kibanaYml = kibanaYml.replace("PATH_TO_FULL_CERT", pathToFullCert)
-    kibanaYml = kibanaYml.replace("PATH_TO_PRIV_KEY", pathToPrivKey)
-    kibanaYml = kibanaYml.replace("LOGGING_FQDN_HERE", domainName)
-    kibanaYml = kibanaYml.replace("KIBANA_SYSTEM_PASSWORD", kibanaSystemPwd)
 
-    destFile = "configFiles/kibana.yml"
+def loadHoneypotProfiles(profilesPath=f"{CONFIG_DIR}/honeypotProfiles.json"):
+    """Load honeypot profiles choosing which honeypots sensors run
 
-    with open(destFile, "w") as f:
-        f.write(kibanaYml)
+    :profilesPath: optional, path to profiles file. Defaults to
+    configFiles/honeypotProfiles.json
+    :returns: dictionary with a services key mapping honeypot types to their T-Pot
+    docker-compose services, and a profiles key mapping profile names to lists of
+    honeypot types
 
-    return destFile
+    """
+    with open(profilesPath) as f:
+        return json.load(f)
 
 
-def createLogstashConf(domainName, certPath, user, password):
-    """Create logstash.conf file for sensor servers from
-    configFiles/logstash.conf.template
+def profileHoneypots(honeypotProfiles, profile):
+    """Get honeypot types enabled by a profile
+
+    :honeypotProfiles: honeypot profiles (as returned by loadHoneypotProfiles)
+    :profile: name of profile (profile key of sensor in credentials.json). None
+    enables every honeypot
+    :returns: list of honeypot types
+
+    """
+    if profile is None:
+        return list(honeypotProfiles["services"])
+
+    try:
+        return honeypotProfiles["profiles"][profile]
+    except KeyError:
+        raise UnknownProfileError(
+            f"{profile} profile not found in configFiles/honeypotProfiles.json"
+        )
+
+
+def createSensorCompose(composeText, profile=None, shipper="logstash"):
+    """Trim T-Pot's docker-compose file to the honeypots of a profile, swapping its
+    Logstash service for Filebeat if needed
+
+    :composeText: text of docker-compose file of T-Pot flavor being installed
+    :profile: optional, name of honeypot profile. Defaults to every honeypot
+    :shipper: optional, logstash or filebeat. Defaults to logstash
+    :returns: text of trimmed docker-compose file
+
+    """
+    honeypotProfiles = loadHoneypotProfiles()
+    enabled = profileHoneypots(honeypotProfiles, profile)
+
+    for honeypotType, services in honeypotProfiles["services"].items():
+        if honeypotType in enabled:
+            continue
+
+        for service in services:
+            # not every T-Pot flavor runs every honeypot
+            if re.search(rf"^  {re.escape(service)}:$", composeText, re.MULTILINE):
+                composeText = replaceComposeService(composeText, service)
+
+    if shipper == "filebeat":
+        with open(f"{CONFIG_DIR}/filebeat.service.yml") as f:
+            composeText = replaceComposeService(composeText, "logstash", f.read())
+
+    return composeText
+
+
+def findUncoveredFields(usedFields, fieldAllowlist):
+    """Find fields used by Kibana saved objects which the allowlist would prune
+
+    :usedFields: dictionary mapping honeypot types (None for objects limited to no
+    type) to used field names (as returned by utils.findSavedObjectFields)
+    :fieldAllowlist: field allowlist (as returned by loadFieldAllowlist)
+    :returns: dictionary mapping honeypot types to sorted lists of fields their events
+    don't keep, empty if every used field is kept. Fields under None only need to be
+    kept for some type
+
+    """
+    commonFields = fieldAllowlist.get("common", [])
+    anyTypeFields = {field for fields in fieldAllowlist.values() for field in fields}
+    uncoveredFields = {}
+
+    for honeypotType, fields in usedFields.items():
+        if honeypotType is None:
+            keptFields = anyTypeFields
+        elif honeypotType in fieldAllowlist:
+            keptFields = commonFields + fieldAllowlist[honeypotType]
+        else:
+            # types without an allowlist aren't pruned
+            continue
+
+        # keeping a top-level object keeps all of its subfields
+        missingFields = sorted(
+            field
+            for field in fields
+            if not any(
+                field == kept or field.startswith(f"{kept}.") for kept in keptFields
+            )
+        )
+
+        if missingFields:
+            uncoveredFields[honeypotType] = missingFields
+
+    return uncoveredFields
+
+
+def createPruneFilters(fieldAllowlist):
+    """Create Logstash prune filters keeping only allowlisted fields of each honeypot
+    type
+
+    :fieldAllowlist: field allowlist (as returned by loadFieldAllowlist)
+    :returns: text of prune filters to place at the end of the filter section
+
+    """
+    commonFields = fieldAllowlist.get("common", [])
+    filters = ["# Drop every field the Kibana dashboards don't use before shipping"]
+
+    for honeypotType, fields in fieldAllowlist.items():
+        if honeypotType == "common":
+            continue
+
+        # whitelist_names are regular expressions matched against top-level fields
+        patterns = ", ".join(
+            '"^%s$"' % field.replace(".", r"\.") for field in commonFields + fields
+        )
+        filters.append(
+            f'  if [type] == "{honeypotType}" {{\n'
+            "    prune {\n"
+            f"      whitelist_names => [{patterns}]\n"
+            "    }\n"
+            "  }"
+        )
+
+    return "\n".join(filters)
+
+
+def createElasticsearchYml(
+    pathToPrivKey,
+    pathToHostCert,
+    pathToFullCert,
+    nodeObj,
+    loggingNodes,
+    privateNetwork=False,
+):
+    """Render elasticsearch.yml file for a logging node from
+    configFiles/elasticsearch.yml.template
+
+    :pathToPrivKey: path to SSL private key on logging node
+    :pathToHostCert: path to host SSL certificate on logging node
+    :pathToFullCert: path to full SSL certificate on logging node
+    :nodeObj: JSON object representing logging node to create file for
+    :loggingNodes: list of JSON objects representing all logging nodes (as returned
+    by utils.getLoggingNodes)
+    :privateNetwork: optional, whether nodes talk to each other over the VPC (using
+    the names from utils.privateHost). Defaults to False
+    :returns: text of elasticsearch.yml file
+
+    """
+    # nodes without roles in credentials.json keep elasticsearch's default roles
+    if nodeObj.get("roles") is None:
+        rolesLine = ""
+    else:
+        roles = [role for role in nodeObj["roles"] if role != "coordinating"]
+
+        # the summary transforms run on data nodes
+        if "data" in roles and "transform" not in roles:
+            roles.append("transform")
+
+        rolesLine = f"node.roles: [{', '.join(roles)}]"
+
+    masterNodes = [node for node in loggingNodes if nodeHasRole(node, "master")]
+    masterNames = [f'"{splitDomain(node["host"])[0]}"' for node in masterNodes]
+    nodeHost = privateHost if privateNetwork else lambda host: host
+    seedHosts = [f'"{nodeHost(node["host"])}"' for node in masterNodes]
+
+    return renderTemplate(
+        f"{CONFIG_DIR}/elasticsearch.yml.template",
+        {
+            "PRIV_KEY_PATH": pathToPrivKey,
+            "HOST_CERT_PATH": pathToHostCert,
+            "FULL_CERT_PATH": pathToFullCert,
+            "NODE_NAME": splitDomain(nodeObj["host"])[0],
+            "NODE_ROLES": rolesLine,
+            "NODE_FQDN": nodeHost(nodeObj["host"]),
+            "SEED_HOSTS": f"[{', '.join(seedHosts)}]",
+            "MASTER_NODES": f"[{', '.join(masterNames)}]",
+        },
+    )
+
+
+def createKibanaYml(domainName, kibanaSystemPwd, pathToPrivKey, pathToFullCert):
+    """Render kibana.yml file for logging server from configFiles/kibana.yml.template
 
     :domainName: FQDN of logging server
+    :kibanaSystemPwd: password to kibana_system user (created by
+    elasticsearch-setup-passwords)
+    :pathToPrivKey: path to SSL private key on logging server
+    :pathToFullCert: path to full SSL certificate on logging server
+    :returns: text of kibana.yml file
+
+    """
+    return renderTemplate(
+        f"{CONFIG_DIR}/kibana.yml.template",
+        {
+            "FULL_CERT_PATH": pathToFullCert,
+            "PRIV_KEY_PATH": pathToPrivKey,
+            "LOGGING_FQDN": domainName,
+            "KIBANA_SYSTEM_PASSWORD": kibanaSystemPwd,
+        },
+    )
+
+
+def createLogstashConf(
+    loggingHosts,
+    certPath,
+    user,
+    password,
+    ingestPipeline=None,
+    fieldAllowlist=None,
+    beatsCerts=None,
+    profile=None,
+):
+    """Render logstash.conf file for sensor servers, or for the central Logstash on
+    the logging server receiving raw events from Filebeat sensors, from
+    configFiles/logstash.conf.template
+
+    :loggingHosts: list of FQDNs of logging nodes to send data to
     :certPath: path to full SSL certificate on sensor server
     :user: user who has t_pot_writer elasticsearch role (usually t_pot_internal)
     :password: password to above user
-    :returns: path to newly-created logstash.conf file
+    :ingestPipeline: optional, name of ingest pipeline enriching events on the logging
+    server (central enrichment mode). If left blank, sensors do their own GeoIP/ASN
+    lookups
+    :fieldAllowlist: optional, field allowlist (as returned by loadFieldAllowlist).
+    If left blank, events are shipped with all of their fields
+    :beatsCerts: optional, tuple of the form (path to full SSL certificate, path to
+    SSL private key) on logging server. If given, renders the central Logstash's
+    config with a beats input instead of the sensors' file inputs
+    :profile: optional, name of honeypot profile of sensors. If given, only keeps
+    the inputs and filters of its honeypots
+    :returns: text of logstash.conf file
 
     """
-    with open("configFiles/logstash.conf.template") as f:
-        logConf = f.read()
+    values = {
+        "LOGGING_HOSTS": ", ".join(f'"https://{host}:64298"' for host in loggingHosts),
+        "LOGGING_CERT_PATH": certPath,
+        "LOGGING_USER": user,
+        "LOGGING_PASSWORD": password,
+    }
+
+    if ingestPipeline is None:
+        removedBlocks = ["centralEnrichment"]
+    else:
+        removedBlocks = ["sensorGeoip"]
+        values["INGEST_PIPELINE"] = ingestPipeline
+
+    if beatsCerts is None:
+        removedBlocks += ["beatsInput", "beatsDecode", "bundledDatabases"]
+        # environment variables of the sensor's Logstash container
+        values.update(
+            {
+                "EXT_IP": "${MY_EXTIP}",
+                "INT_IP": "${MY_INTIP}",
+                "HOSTNAME": "${MY_HOSTNAME}",
+            }
+        )
+    else:
+        # GeoLite2 databases are at paths specific to T-Pot's Logstash image, so use
+        # the ones bundled with the geoip filter instead
+        removedBlocks += ["fileInputs", "sensorHostFields", "tpotDatabases"]
+        values["BEATS_CERT_PATH"], values["BEATS_KEY_PATH"] = beatsCerts
+        # Filebeat adds the sensor's IPs and hostname to every event instead of
+        # them being environment variables of the sensor's Logstash container
+        values.update(
+            {
+                "EXT_IP": "%{t-pot_ip_ext}",
+                "INT_IP": "%{t-pot_ip_int}",
+                "HOSTNAME": "%{t-pot_hostname}",
+            }
+        )
+
+    if profile is not None:
+        honeypotProfiles = loadHoneypotProfiles()
+        enabled = profileHoneypots(honeypotProfiles, profile)
+
+        # inputs and filters of each honeypot are in a block named after its type
+        removedBlocks += [
+            honeypotType
+            for honeypotType in honeypotProfiles["services"]
+            if honeypotType not in enabled
+        ]
+
+    if fieldAllowlist is None:
+        removedBlocks.append("fieldPruning")
+    else:
+        values["FIELD_PRUNING"] = createPruneFilters(fieldAllowlist)
+
+    return renderTemplate(f"{CONFIG_DIR}/logstash.conf.template", values, removedBlocks)
+
+
+def parseFileInputs(templateText):
+    """Parse the file inputs of configFiles/logstash.conf.template
+
+    :templateText: text of logstash.conf.template
+    :returns: list of tuples of the form (honeypot type, list of paths, codec)
 
-    logConf = logConf.replace("LOGGING_FQDN_HERE", domainName)
-    logConf = logConf.replace("LOGGING_CERT_PATH_HERE", certPath)
-    logConf = logConf.replace("LOGGING_USER_HERE", user)
-    logConf = logConf.replace("LOGGING_PASSWORD_HERE", password)
+    """
+    inputRegex = re.compile(
+        r"^  file \{\n"
+        r"    path => \[(?P<paths>[^\]]*)\]\n"
+        r"(?:    codec => (?P<codec>\w+)\n)?"
+        r'    type => "(?P<type>\w+)"\n',
+        flags=re.MULTILINE,
+    )
+
+    return [
+        (
+            inputMatch["type"],
+            re.findall(r'"([^"]+)"', inputMatch["paths"]),
+            inputMatch["codec"] or "plain",
+        )
+        for inputMatch in inputRegex.finditer(templateText)
+    ]
+
+
+def createFilebeatYml(logstashHost, profile=None):
+    """Render filebeat.yml file for Filebeat sensor servers from
+    configFiles/filebeat.yml.template, with one input per file input of
+    configFiles/logstash.conf.template
 
-    with open("configFiles/logstash.conf", "w") as f:
-        f.write(logConf)
+    :logstashHost: FQDN of logging server running the central Logstash
+    :profile: optional, name of honeypot profile of sensors. If given, only keeps
+    the inputs of its honeypots
+    :returns: text of filebeat.yml file
 
+    """
+    with open(f"{CONFIG_DIR}/logstash.conf.template") as f:
+        fileInputs = parseFileInputs(f.read())
+
+    if profile is not None:
+        enabled = profileHoneypots(loadHoneypotProfiles(), profile)
+        fileInputs = [fileInput for fileInput in fileInputs if fileInput[0] in enabled]
+
+    # type and codec tell the central Logstash how to parse each raw line
+    inputs = [
+        "  - type: log\n"
+        f"    paths: {json.dumps(paths)}\n"
+        "    fields:\n"
+        f"      type: {honeypotType}\n"
+        f"      codec: {codec}\n"
+        "    fields_under_root: true"
+        for honeypotType, paths, codec in fileInputs
+    ]
+
+    return renderTemplate(
+        f"{CONFIG_DIR}/filebeat.yml.template",
+        {"FILEBEAT_INPUTS": "\n".join(inputs), "LOGSTASH_HOST": logstashHost},
+    )
+
+
+def createRelayConf(logstashHost, certPath, keyPath):
+    """Render relay.conf file for regional relays forwarding Filebeat sensors' events
+    to the central Logstash, from configFiles/relay.conf.template
+
+    :logstashHost: FQDN of logging server running the central Logstash
+    :certPath: path to full SSL certificate on relay
+    :keyPath: path to SSL private key on relay
+    :returns: text of relay.conf file
 
-def createUpdateCertsSh(projectPath, sudoUser):
-    """Create updateCerts.sh file for deployment server from
+    """
+    return renderTemplate(
+        f"{CONFIG_DIR}/relay.conf.template",
+        {
+            "LOGSTASH_HOST": logstashHost,
+            "RELAY_CERT_PATH": certPath,
+            "RELAY_KEY_PATH": keyPath,
+        },
+    )
+
+
+def createUpdateCertsSh(projectPath, sudoUser, workspacePath, certName):
+    """Render updateCerts.sh file for deployment server from
     configFiles/updateCerts.sh.template
 
     :projectPath: path to directory holding fabric scripts (dirty workaround)
     :sudoUser: name of non-roon sudo user running whole deployment
-    :returns: path to newly-created updateCerts.sh file
+    :workspacePath: path to workspace directory of the network (holding its
+    credentials.json)
+    :certName: name of the network's certificate (FQDN of logging server), the only
+    one whose renewal runs the script
+    :returns: text of updateCerts.sh file
 
     """
-    with open("configFiles/updateCerts.sh.template") as f:
-        updatesh = f.read()
+    return renderTemplate(
+        f"{CONFIG_DIR}/updateCerts.sh.template",
+        {
+            "SUDO_USER": sudoUser,
+            "DEPLOYMENT_SCRIPTS_PATH": projectPath,
+            "WORKSPACE_PATH": workspacePath,
+            "CERT_NAME": certName,
+        },
+    )
+
 
-    updatesh = updatesh.replace("SUDO_USER_HERE", sudoUser)
-    updatesh = updatesh.replace("DEPLOYMENT_SCRIPTS_PATH", projectPath)
+def createHostTuningProfile(dropletSize):
+    """Render host tuning files for logging server (JVM heap options, systemd limits
+    and sysctls) from its droplet size
 
-    destFile = "configFiles/updateCerts.sh"
+    :dropletSize: size slug of logging server droplet (such as "s-4vcpu-8gb")
+    :returns: dictionary mapping destination paths of files on the logging server to
+    their text
 
-    with open(destFile, "w") as f:
-        f.write(updatesh)
+    """
+    # give half of memory to elasticsearch heap, rest goes to Kibana and file cache
+    heapMb = min(dropletMemoryMb(dropletSize) // 2, MAX_HEAP_MB)
+    tuningProfile = {
+        "/etc/elasticsearch/jvm.options.d/heap.options": renderTemplate(
+            f"{CONFIG_DIR}/heap.options.template", {"HEAP_SIZE": f"{heapMb}m"}
+        )
+    }
+
+    for localPath, remotePath in [
+        (
+            f"{CONFIG_DIR}/elasticsearch.service.override.conf",
+            "/etc/systemd/system/elasticsearch.service.d/override.conf",
+        ),
+        (f"{CONFIG_DIR}/99-elasticsearch.conf", "/etc/sysctl.d/99-elasticsearch.conf"),
+    ]:
+        with open(localPath) as f:
+            tuningProfile[remotePath] = f.read()
+
+    return tuningProfile
+
+
+def renderElasticsearchYml(nodeObj, loggingNodes, privateNetwork=False):
+    """Render elasticsearch.yml of a logging node with the certificate paths the
+    deployment uses (see createElasticsearchYml)
+
+    :nodeObj: JSON object representing logging node to create file for
+    :loggingNodes: list of JSON objects representing all logging nodes (as returned
+    by utils.getLoggingNodes)
+    :privateNetwork: optional, whether nodes talk to each other over the VPC.
+    Defaults to False
+    :returns: text of elasticsearch.yml file
+
+    """
+    certsPath = f"{ELASTIC_PATH}/certs"
 
-    return destFile
+    return createElasticsearchYml(
+        f"{certsPath}/privkey.pem",
+        f"{certsPath}/cert.pem",
+        f"{certsPath}/fullchain.pem",
+        nodeObj,
+        loggingNodes,
+        privateNetwork,
+    )
 
 
-def createCuratorConfigYml(loggingDomain, elasticPass):
-    """Create curatorConfig.yml for logging server from
-    configFiles/curatorConfig.yml.template
+def renderKibanaYml(loggingHost, kibanaSystemPwd):
+    """Render kibana.yml of the logging server with the certificate paths the
+    deployment uses (see createKibanaYml)
 
-    :loggingDomain: FQDN of logging server
-    :elasticPass: password for elastic user
-    :returns: path to newly-created curatorConfig.yml file
+    :loggingHost: FQDN of logging server
+    :kibanaSystemPwd: password to kibana_system user
+    :returns: text of kibana.yml file
 
     """
-    with open("configFiles/curatorConfig.yml.template") as f:
-        curatorConfig = f.read()
+    certsPath = f"{KIBANA_PATH}/certs"
+
+    return createKibanaYml(
+        loggingHost,
+        kibanaSystemPwd,
+        f"{certsPath}/privkey.pem",
+        f"{certsPath}/fullchain.pem",
+    )
+
+
+def renderCentralLogstashConf(
+    loggingNodes, tPotPass, centralEnrichment=False, privateNetwork=False
+):
+    """Render logstash.conf of the central Logstash on the logging server, parsing raw
+    events from Filebeat sensors and relays
+
+    :loggingNodes: list of JSON objects representing all logging nodes (as returned
+    by utils.getLoggingNodes)
+    :tPotPass: password of t_pot_internal user, which the central Logstash indexes as
+    :centralEnrichment: optional, whether events go through the GeoIP/ASN ingest
+    pipeline on the logging server. Defaults to False
+    :privateNetwork: optional, whether to index to the logging nodes' private names.
+    Defaults to False
+    :returns: text of logstash.conf file
+
+    """
+    certsPath = f"{LOGSTASH_PATH}/certs"
+
+    return createLogstashConf(
+        getIngestHosts(loggingNodes, privateNetwork),
+        f"{certsPath}/fullchain.pem",
+        TPOT_USER,
+        tPotPass,
+        ENRICH_PIPELINE if centralEnrichment else None,
+        loadFieldAllowlist(),
+        (f"{certsPath}/fullchain.pem", f"{certsPath}/privkey.pem"),
+    )
 
-    curatorConfig = curatorConfig.replace("LOGGING_FQDN_HERE", loggingDomain)
-    curatorConfig = curatorConfig.replace("ELASTIC_PASSWORD", elasticPass)
 
-    destFile = "configFiles/curatorConfig.yml"
+def renderRelayConf(logstashHost):
+    """Render relay.conf of a regional relay with the certificate paths the
+    deployment uses (see createRelayConf)
 
-    with open(destFile, "w") as f:
-        f.write(curatorConfig)
+    :logstashHost: FQDN of the central Logstash (as returned by
+    utils.centralLogstashHost)
+    :returns: text of relay.conf file
+
+    """
+    return createRelayConf(
+        logstashHost,
+        f"{LOGSTASH_PATH}/certs/fullchain.pem",
+        f"{LOGSTASH_PATH}/certs/privkey.pem",
+    )
 
-    return destFile
+
+def shipperConfPath(shipper="logstash"):
+    """Get path of the shipper config on a sensor server, where T-Pot's docker-compose
+    stack mounts it from
+
+    :shipper: optional, logstash or filebeat (see fabfile.installTPotBase). Defaults
+    to logstash
+    :returns: absolute path of logstash.conf, or filebeat.yml with Filebeat
+
+    """
+    fileName = "filebeat.yml" if shipper == "filebeat" else "logstash.conf"
+
+    return f"{SENSOR_DATA_PATH}/{fileName}"
+
+
+def renderShipperConf(sensor, logCreds, relayObjs, tPotPass):
+    """Render the shipper config of a sensor server, logstash.conf or filebeat.yml
+    with Filebeat
+
+    :sensor: JSON object representing sensor server
+    :logCreds: JSON object representing logging server (logging in credentials.json)
+    :relayObjs: array of JSON objects representing regional relays
+    :tPotPass: password of t_pot_internal user, which sensors index as
+    :returns: text of shipper config
+
+    """
+    # Filebeat sensors in a region with a relay ship through it
+    if usesFilebeat(sensor):
+        relay = findRelay(sensor, relayObjs)
+
+        return createFilebeatYml(
+            centralLogstashHost(logCreds) if relay is None else relay["host"],
+            sensor.get("profile"),
+        )
+
+    return createLogstashConf(
+        getIngestHosts(getLoggingNodes(logCreds), logCreds.get("vpc", False)),
+        f"{SENSOR_DATA_PATH}/fullchain.pem",
+        TPOT_USER,
+        tPotPass,
+        ENRICH_PIPELINE if logCreds.get("centralEnrichment") else None,
+        loadFieldAllowlist(),
+        profile=sensor.get("profile"),
+    )
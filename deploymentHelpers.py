@@ -1,14 +1,114 @@
+import hashlib
+import json
 import os
 import secrets
 import string
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from zipfile import ZipFile
 
 import requests
+from cryptography import x509
 from requests.exceptions import HTTPError
 
-from configFuncs import createCuratorConfigYml
-from errors import BadAPIRequestError, NotCreatedError
-from utils import findPassword
+from errors import BadAPIRequestError, HostTuningError, NotCreatedError
+from utils import findPassword, tPotHostname
+
+# default index lifecycle and disk retention settings if none are given in
+# credentials.json
+DEFAULT_RETENTION = {
+    "rolloverSize": "10gb",
+    "rolloverAge": "1d",
+    "deleteAfter": "7d",
+    "diskTargetPercent": 75,
+    "minDays": 2,
+    "summaryMaxAge": "30d",
+}
+
+# honeypot types as set by the type field of the sensors' Logstash inputs, each of
+# which gets its own data stream
+HONEYPOT_TYPES = [
+    "Adbhoney",
+    "Ciscoasa",
+    "CitrixHoneypot",
+    "ConPot",
+    "Cowrie",
+    "Dicompot",
+    "Dionaea",
+    "ElasticPot",
+    "Glutton",
+    "Heralding",
+    "Honeypy",
+    "Honeysap",
+    "Honeytrap",
+    "Ipphoney",
+    "Mailoney",
+    "Medpot",
+    "Rdpy",
+    "Tanner",
+]
+
+# mappings shared by all honeypot data streams, following T-Pot's own index template
+# so the imported Kibana dashboards keep finding their .keyword fields
+TPOT_MAPPINGS = {
+    "dynamic_templates": [
+        {
+            "message_field": {
+                "path_match": "message",
+                "match_mapping_type": "string",
+                "mapping": {"type": "text", "norms": False},
+            }
+        },
+        {
+            "string_fields": {
+                "match": "*",
+                "match_mapping_type": "string",
+                "mapping": {
+                    "type": "text",
+                    "norms": False,
+                    "fields": {"keyword": {"type": "keyword", "ignore_above": 256}},
+                },
+            }
+        },
+    ],
+    "properties": {
+        "@timestamp": {"type": "date"},
+        "geoip": {
+            "dynamic": True,
+            "properties": {
+                "ip": {"type": "ip"},
+                "location": {"type": "geo_point"},
+                "latitude": {"type": "half_float"},
+                "longitude": {"type": "half_float"},
+            },
+        },
+        "src_port": {"type": "integer"},
+        "dest_port": {"type": "integer"},
+        # set by the LATENCY_PIPELINE final pipeline of every data stream
+        "event_ingested": {"type": "date"},
+        "ingest_latency_ms": {"type": "long"},
+        # set on synthetic events written by canaryProbe.py
+        "tpot_canary": {"type": "boolean"},
+    },
+}
+LATENCY_PIPELINE = "tpot-ingest-latency"
+# field marking canary events, and query leaving them out of dashboards and
+# summaries
+CANARY_FIELD = "tpot_canary"
+EXCLUDE_CANARY_QUERY = {"bool": {"must_not": [{"term": {CANARY_FIELD: True}}]}}
+KIBANA_OBJECTS_URL = (
+    "https://raw.githubusercontent.com/ezacl/tpotce-light/"
+    "master/etc/objects/kibana_export.ndjson.zip"
+)
+KIBANA_CACHE_DIR = os.path.expanduser("~/.cache/deploy-t-pot")
+# index recording what the deployment already set up, such as imported objects
+STATE_INDEX = "deploy-t-pot-state"
+# elasticsearch user sensors and the central Logstash index events as
+TPOT_USER = "t_pot_internal"
+# ingest pipeline adding GeoIP/ASN info in central enrichment mode
+ENRICH_PIPELINE = "t_pot_geoip"
+# existing Let's Encrypt certificates expiring sooner than this get issued again
+CERT_MIN_DAYS = 30
 
 
 def createSudoUser(rootConnection, username, sudopass):
@@ -46,6 +146,43 @@ def createSudoUser(rootConnection, username, sudopass):
     rootConnection.run("systemctl restart sshd", hide="stdout")
 
 
+def addElasticRepository(connection):
+    """Add Elastic's signing keys and 7.x apt repository to a server
+
+    :connection: fabric.Connection object to server
+    :returns: None
+
+    """
+    # download public signing keys
+    artifactsKey = "elasticsearchArtifactsKey"
+    packagesKey = "elasticsearchPackagesKey"
+    connection.run(
+        "wget -qO - https://artifacts.elastic.co/GPG-KEY-elasticsearch"
+        f" > {artifactsKey}",
+        hide="stdout",
+    )
+    connection.run(
+        "wget -qO - https://packages.elastic.co/GPG-KEY-elasticsearch"
+        f" > {packagesKey}",
+        hide="stdout",
+    )
+    # install public signing keys
+    # this gives
+    # "Warning: apt-key output should not be parsed (stdout is not a terminal)"
+    # can add pty=True to suppress it, but should find a fundamentally better way
+    connection.sudo(f"apt-key add {artifactsKey}", pty=True, hide=True)
+    connection.sudo(f"apt-key add {packagesKey}", pty=True, hide=True)
+    connection.run(f"rm {artifactsKey} {packagesKey}", hide="stdout")
+
+    # save repository definitions
+    connection.run(
+        'echo "deb https://artifacts.elastic.co/packages/7.x/apt stable main"'
+        " > elastic-7.x.list",
+        hide="stdout",
+    )
+    connection.sudo("mv elastic-7.x.list /etc/apt/sources.list.d/", hide=True)
+
+
 def installPackages(connection, packageList):
     """Install packages on server using apt-get
 
@@ -60,32 +197,177 @@ def installPackages(connection, packageList):
     connection.sudo(f"apt-get --yes install {packageStr}", hide=True)
 
 
-def generateSSLCerts(localConn, email, loggingHost, apiTokenPath):
-    """Generate SSL certificates on logging server using Certbot
+def putFile(connection, text, remotePath, owner=None, mode=None):
+    """Upload text to a file on a server straight from memory, without writing it to
+    a local file first
+
+    :connection: fabric.Connection object to server
+    :text: content of file
+    :remotePath: absolute path of file on server, whose directory gets created if
+    missing
+    :owner: optional, user:group to give the file to. Defaults to the connection's
+    user
+    :mode: optional, permissions of the file in octal (such as 640). Defaults to the
+    server's umask
+    :returns: None
+
+    """
+    fileName = os.path.basename(remotePath)
+    connection.put(BytesIO(text.encode()), remote=fileName)
+    connection.sudo(f"mkdir -p {os.path.dirname(remotePath)}", hide=True)
+    connection.sudo(f"mv {fileName} {remotePath}", hide=True)
+
+    if owner is not None:
+        connection.sudo(f"chown {owner} {remotePath}", hide=True)
+
+    if mode is not None:
+        connection.sudo(f"chmod {mode} {remotePath}", hide=True)
+
+
+def setTPotHostname(connection, fqdn):
+    """Replace the random hostname T-Pot's install.sh gives a sensor with its
+    subdomain, so its events can be told apart by t-pot_hostname. Takes effect in
+    t-pot_hostname once the sensor reboots
+
+    :connection: fabric.Connection object to sensor server
+    :fqdn: FQDN of sensor server
+    :returns: None
+
+    """
+    hostname = tPotHostname(fqdn)
+
+    # same two steps install.sh uses to set its own hostname
+    connection.sudo(f"hostnamectl set-hostname {hostname}", hide=True)
+    connection.sudo(
+        f"sed -i 's#127.0.1.1.*#127.0.1.1\\t{hostname}#g' /etc/hosts", hide=True
+    )
+
+
+def restrictPorts(connection, ports, allowedSources):
+    """Close ports of a logging node to everyone but the given sources with ufw, leaving
+    every other port open
+
+    :connection: fabric.Connection object to logging node
+    :ports: list of TCP ports to restrict
+    :allowedSources: list of IP addresses or CIDR ranges still allowed to connect
+    :returns: None
+
+    """
+    installPackages(connection, ["ufw"])
+
+    # ufw matches rules in the order they were added, so allow before denying
+    for port in ports:
+        for source in allowedSources:
+            connection.sudo(
+                f"ufw allow proto tcp from {source} to any port {port}", hide=True
+            )
+
+        connection.sudo(f"ufw deny proto tcp from any to any port {port}", hide=True)
+
+    connection.sudo("ufw default allow incoming", hide=True)
+    connection.sudo("ufw --force enable", hide=True)
+
+
+def readSSLCert(localConn, certName):
+    """Read an existing Certbot SSL certificate of the deployment server
+
+    :localConn: fabric.Connection object to deployment server
+    :certName: name of certificate (FQDN of logging server)
+    :returns: PEM text of certificate, or None if there is none
+
+    """
+    certResult = localConn.sudo(
+        f"cat /etc/letsencrypt/live/{certName}/cert.pem", hide=True, warn=True
+    )
+
+    return certResult.stdout if certResult.ok else None
+
+
+def certCoversHosts(certPem, certHosts, minDays=CERT_MIN_DAYS, now=None):
+    """Check whether an SSL certificate can be reused for a deployment
+
+    :certPem: PEM text of certificate (as returned by readSSLCert), or None
+    :certHosts: list of domain names the certificate needs to cover
+    :minDays: optional, number of days the certificate needs to stay valid for.
+    Defaults to CERT_MIN_DAYS
+    :now: optional, timezone-aware datetime to check validity at. Defaults to now
+    :returns: True if certificate covers every host and doesn't expire in the next
+    minDays days, False otherwise
+
+    """
+    if certPem is None:
+        return False
+
+    cert = x509.load_pem_x509_certificate(certPem.encode())
+
+    try:
+        sanExtension = cert.extensions.get_extension_for_class(
+            x509.SubjectAlternativeName
+        )
+    except x509.ExtensionNotFound:
+        return False
+
+    certNames = set(sanExtension.value.get_values_for_type(x509.DNSName))
+    # not_valid_after is a naive UTC datetime (not_valid_after_utc needs cryptography
+    # 42, see requirements.txt)
+    expiresIn = cert.not_valid_after.replace(tzinfo=timezone.utc) - (
+        now or datetime.now(timezone.utc)
+    )
+
+    return set(certHosts) <= certNames and expiresIn >= timedelta(days=minDays)
+
+
+def generateSSLCerts(localConn, email, certHosts, apiTokenPath, tempCertDir="certs"):
+    """Generate SSL certificates on logging server using Certbot, unless the
+    deployment server already has a certificate covering certHosts that stays valid
+    for CERT_MIN_DAYS
 
     :localConn: fabric.Connection object to deployment server
     :email: email address to receive Certbot notifications
-    :loggingHost: domain name for logging server
+    :certHosts: list of domain names for logging nodes (logging server first). The
+    certificate is saved under the first one and covers all of them
     :apiTokenPath: path to digitalocean API key ini file
-    :returns: path to temporary directory holding SSL certificates
+    :tempCertDir: optional, path of temporary directory to copy SSL certificates to
+    (see copySSLCerts). Defaults to certs
+    :returns: tuple of the form (path to temporary directory holding SSL
+    certificates, whether a new certificate was issued)
 
     """
+    # certbot is already installed if there is a certificate
+    if certCoversHosts(readSSLCert(localConn, certHosts[0]), certHosts):
+        return copySSLCerts(localConn, certHosts[0], tempCertDir), False
+
     certbotPackages = ["certbot", "python3-certbot-dns-digitalocean"]
     installPackages(localConn, certbotPackages)
     localConn.run(f"chmod 600 {apiTokenPath}", hide="stdout")
+    domainArgs = " ".join(f"-d {host}" for host in certHosts)
     localConn.sudo(
-        f"certbot certonly --non-interactive --agree-tos --email {email}"
+        f"certbot certonly --non-interactive --agree-tos --expand --email {email}"
         f" --dns-digitalocean --dns-digitalocean-credentials {apiTokenPath}"
-        f" -d {loggingHost}",
+        f" --cert-name {certHosts[0]} {domainArgs}",
         hide=True,
     )
 
+    return copySSLCerts(localConn, certHosts[0], tempCertDir), True
+
+
+def copySSLCerts(localConn, certName, tempCertDir="certs"):
+    """Copy existing Certbot SSL certificates of the deployment server to a temporary
+    directory
+
+    :localConn: fabric.Connection object to deployment server
+    :certName: name of certificate (FQDN of logging server)
+    :tempCertDir: optional, path of temporary directory to create, inside the
+    network's workspace when several networks are deployed at once. Defaults to certs
+    :returns: path to temporary directory holding SSL certificates
+
+    """
     # need to copy certs into temporary directory that doesn't need sudo access
     # in order to later transfer certs to other servers
-    tempCertDir = "certs"
     localConn.run(f"mkdir {tempCertDir}", hide="stdout")
     localConn.sudo(
-        f"sh -c 'cp /etc/letsencrypt/live/{loggingHost}/* {tempCertDir}/'", hide=True
+        f"sh -c 'cp /etc/letsencrypt/live/{certName}/* {tempCertDir}/'",
+        hide=True,
     )
     localConn.sudo(f"chmod +r {tempCertDir}/privkey.pem", hide=True)
 
@@ -102,6 +384,7 @@ def transferSSLCerts(
     kibanaPath=None,
     kibanaCertsPath=None,
     dataPath=None,
+    logstashPath=None,
 ):
     """Transfer SSL certificates to either logging or sensor server
 
@@ -113,10 +396,13 @@ def transferSSLCerts(
     (logging server)
     :elasticCertsPath: optional, path to elasticsearch SSL certificate
     directory (logging server)
-    :kibanaPath: optional, path to kibana configuration directory (logging server)
+    :kibanaPath: optional, path to kibana configuration directory (logging server).
+    Leave out for logging nodes which don't run kibana
     :kibanaCertsPath: optional, path to kibana SSL certificate directory
     (logging server)
     :dataPath: optional, path to elk data directory (sensor server)
+    :logstashPath: optional, path to central logstash configuration directory
+    (logging server). Leave out if the logging server doesn't run Logstash
     :returns: None
 
     """
@@ -131,40 +417,861 @@ def transferSSLCerts(
         connection.sudo(f"mv {tempCertsPath} {elasticPath}/", hide=True)
         connection.sudo(f"chown -R root:elasticsearch {elasticCertsPath}", hide=True)
         connection.sudo(f"chmod 644 {elasticCertsPath}/privkey.pem", hide=True)
-        connection.sudo(f"rm -rf {kibanaCertsPath}", hide=True)
-        connection.sudo(f"cp -r {elasticCertsPath} {kibanaPath}/", hide=True)
+
+        if kibanaPath is not None:
+            connection.sudo(f"rm -rf {kibanaCertsPath}", hide=True)
+            connection.sudo(f"cp -r {elasticCertsPath} {kibanaPath}/", hide=True)
+
+        if logstashPath is not None:
+            connection.sudo(f"rm -rf {logstashPath}/certs", hide=True)
+            connection.sudo(f"cp -r {elasticCertsPath} {logstashPath}/", hide=True)
+            connection.sudo(f"chown -R root:logstash {logstashPath}/certs", hide=True)
     else:
         # if need to transfer certs to sensor server
         connection.put(f"{certDir}/fullchain.pem")
         connection.sudo(f"mv fullchain.pem {dataPath}/", hide=True)
 
 
-def setupCurator(connection, configPath, elasticPass):
-    """Set up elasticsearch-curator service to delete old elasticsearch indices
+def setupCentralLogstash(connection, logstashConf, elasticCertsPath):
+    """Install and start Logstash on logging server to parse and enrich raw events
+    sent by Filebeat sensors
 
     :connection: fabric.Connection object to logging server
-    :configPath: path to curator configuration directory
-    :elasticPass: password for user elastic
+    :logstashConf: text of central logstash.conf (rendered by
+    configFuncs.createLogstashConf with beatsCerts)
+    :elasticCertsPath: path to elasticsearch SSL certificate directory, whose
+    certificates the beats input reuses
     :returns: None
 
     """
-    # commands to set up elasticsearch-curator to delete old indices
-    connection.sudo("mkdir /var/log/curator", hide=True)
+    logstashPath = "/etc/logstash"
+
+    # the elastic apt repository is already set up for elasticsearch
+    connection.sudo("apt-get --yes install logstash", hide=True)
+
+    connection.sudo(f"rm -rf {logstashPath}/certs", hide=True)
+    connection.sudo(f"cp -r {elasticCertsPath} {logstashPath}/", hide=True)
+    connection.sudo(f"chown -R root:logstash {logstashPath}/certs", hide=True)
 
-    curatorConfigPath = createCuratorConfigYml(connection.host, elasticPass)
-    connection.put(curatorConfigPath)
-    connection.put("configFiles/curatorActions.yml")
+    # IP reputation list used by the translate filter, which T-Pot's own Logstash
+    # image downloads itself
+    listbotCommand = (
+        "curl -s https://listbot.sicherheitstacho.eu/iprep.yaml.bz2"
+        " | bunzip2 > /etc/listbot/iprep.yaml"
+    )
+    connection.sudo("mkdir -p /etc/listbot", hide=True)
+    connection.sudo(f"sh -c '{listbotCommand}'", hide=True)
     connection.sudo(
-        f"mv {os.path.basename(curatorConfigPath)} curatorActions.yml {configPath}",
+        f"sh -c 'echo \"0 4 * * * root {listbotCommand}\" > /etc/cron.d/listbot'",
         hide=True,
     )
 
-    # add cronjob to run curator every day at midnight (curator needs root)
-    curatorCommand = (
-        f"0 0 * * * root curator --config {configPath}curatorConfig.yml"
-        f" {configPath}curatorActions.yml"
+    putFile(
+        connection,
+        logstashConf,
+        f"{logstashPath}/conf.d/tpot.conf",
+        owner="root:logstash",
+        mode=640,
+    )
+
+    connection.sudo("systemctl enable logstash.service", hide=True)
+    connection.sudo("systemctl restart logstash.service", hide=True)
+
+
+def transferRelayCerts(connection, certDir):
+    """Transfer SSL certificate and private key to a regional relay's Logstash
+
+    :connection: fabric.Connection object to relay
+    :certDir: path to temporary directory containing SSL certificates
+    :returns: None
+
+    """
+    relayCertsPath = "/etc/logstash/certs"
+    connection.sudo(f"mkdir -p {relayCertsPath}", hide=True)
+
+    for certFile in ["fullchain.pem", "privkey.pem"]:
+        connection.put(f"{certDir}/{certFile}")
+        connection.sudo(f"mv {certFile} {relayCertsPath}/", hide=True)
+
+    connection.sudo(f"chown -R root:logstash {relayCertsPath}", hide=True)
+    connection.sudo(f"chmod 640 {relayCertsPath}/privkey.pem", hide=True)
+
+
+def setupRelay(connection, relayConf, certDir):
+    """Install and start Logstash on a regional relay forwarding the events of the
+    Filebeat sensors in its region to the central Logstash
+
+    :connection: fabric.Connection object to relay
+    :relayConf: text of relay.conf (rendered by configFuncs.renderRelayConf)
+    :certDir: path to temporary directory containing SSL certificates
+    :returns: None
+
+    """
+    logstashPath = "/etc/logstash"
+
+    addElasticRepository(connection)
+    installPackages(connection, ["logstash"])
+    transferRelayCerts(connection, certDir)
+
+    putFile(
+        connection,
+        relayConf,
+        f"{logstashPath}/conf.d/relay.conf",
+        owner="root:logstash",
     )
-    connection.sudo(f"sh -c 'echo \"{curatorCommand}\" >> /etc/crontab'", hide=True)
+
+    connection.sudo("systemctl enable logstash.service", hide=True)
+    connection.sudo("systemctl restart logstash.service", hide=True)
+
+
+def dataStreamName(honeypotType):
+    """Get name of the data stream holding events of a honeypot type
+
+    :honeypotType: honeypot type, as in the type field of events
+    :returns: data stream name (such as tpot-cowrie)
+
+    """
+    return f"tpot-{honeypotType.lower()}"
+
+
+def createILMPolicy(
+    hostPort, creatorUser, creatorPwd, retention=None, policyName="t_pot_ilm_policy"
+):
+    """Create elasticsearch ILM policy rolling over honeypot indices by primary shard
+    size/age, force-merging them once read-only and deleting them after retention
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :creatorUser: user with which to make API requests (usually elastic)
+    :creatorPwd: password to above user
+    :retention: optional, dictionary with any of the rolloverSize, rolloverAge and
+    deleteAfter keys (usually logging.retention in credentials.json). Missing keys
+    fall back to DEFAULT_RETENTION
+    :policyName: optional, name of policy to create. Defaults to t_pot_ilm_policy
+    :returns: name of policy created
+
+    """
+    settings = {**DEFAULT_RETENTION, **(retention or {})}
+
+    policyData = {
+        "policy": {
+            "phases": {
+                "hot": {
+                    "min_age": "0ms",
+                    "actions": {
+                        "rollover": {
+                            "max_primary_shard_size": settings["rolloverSize"],
+                            "max_age": settings["rolloverAge"],
+                        }
+                    },
+                },
+                # warm phase starts as soon as an index is rolled over, so merge
+                # it down to one segment once nothing writes to it anymore
+                "warm": {
+                    "min_age": "0ms",
+                    "actions": {
+                        "readonly": {},
+                        "forcemerge": {"max_num_segments": 1},
+                    },
+                },
+                "delete": {
+                    "min_age": settings["deleteAfter"],
+                    "actions": {"delete": {}},
+                },
+            }
+        }
+    }
+
+    policyResp = requests.put(
+        f"https://{hostPort}/_ilm/policy/{policyName}",
+        auth=(creatorUser, creatorPwd),
+        json=policyData,
+    )
+
+    try:
+        policyResp.raise_for_status()
+    except HTTPError:
+        # Usually if API request is made before elasticsearch service is ready
+        raise BadAPIRequestError(
+            f"{policyResp.text}\nBad API request. See response above."
+        )
+
+    if not policyResp.json()["acknowledged"]:
+        raise NotCreatedError(f"{policyName} ILM policy not created.")
+
+    return policyName
+
+
+def createLatencyPipeline(hostPort, creatorUser, creatorPwd):
+    """Create LATENCY_PIPELINE ingest pipeline recording when each event got indexed
+    and how long after its @timestamp, run as final pipeline of every data stream
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :creatorUser: user with which to make API requests (usually elastic)
+    :creatorPwd: password to above user
+    :returns: name of ingest pipeline
+
+    """
+    latencyScript = (
+        "ctx.ingest_latency_ms = ZonedDateTime.parse(ctx.event_ingested).toInstant()"
+        ".toEpochMilli() - ZonedDateTime.parse(ctx['@timestamp']).toInstant()"
+        ".toEpochMilli()"
+    )
+    pipelineData = {
+        "description": "Record ingest time and latency of T-Pot honeypot data",
+        "processors": [
+            {"set": {"field": "event_ingested", "value": "{{{_ingest.timestamp}}}"}},
+            {
+                "script": {
+                    "if": "ctx['@timestamp'] != null",
+                    "source": latencyScript,
+                    "ignore_failure": True,
+                }
+            },
+        ],
+    }
+
+    pipelineResp = requests.put(
+        f"https://{hostPort}/_ingest/pipeline/{LATENCY_PIPELINE}",
+        auth=(creatorUser, creatorPwd),
+        json=pipelineData,
+    )
+
+    try:
+        pipelineResp.raise_for_status()
+    except HTTPError:
+        # Usually if API request is made before elasticsearch service is ready
+        raise BadAPIRequestError(
+            f"{pipelineResp.text}\nBad API request. See response above."
+        )
+
+    if not pipelineResp.json()["acknowledged"]:
+        raise NotCreatedError(f"{LATENCY_PIPELINE} ingest pipeline not created.")
+
+    return LATENCY_PIPELINE
+
+
+def createDataStreamTemplates(hostPort, creatorUser, creatorPwd, retention=None):
+    """Create one index template and ILM policy per honeypot type so that each type
+    is written to its own data stream with its own mappings and retention
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :creatorUser: user with which to make API requests (usually elastic)
+    :creatorPwd: password to above user
+    :retention: optional, dictionary of retention settings (usually logging.retention
+    in credentials.json, see createILMPolicy). Its optional perType key maps
+    lowercase honeypot types to settings overriding the others for that type only
+    :returns: list of names of data streams the templates apply to
+
+    """
+    authTup = (creatorUser, creatorPwd)
+    retention = retention or {}
+    perType = retention.get("perType", {})
+
+    # every index of the templates below runs it, so it has to exist first
+    latencyPipeline = createLatencyPipeline(hostPort, creatorUser, creatorPwd)
+
+    componentResp = requests.put(
+        f"https://{hostPort}/_component_template/tpot-mappings",
+        auth=authTup,
+        json={"template": {"mappings": TPOT_MAPPINGS}},
+    )
+
+    try:
+        componentResp.raise_for_status()
+    except HTTPError:
+        # Usually if API request is made before elasticsearch service is ready
+        raise BadAPIRequestError(
+            f"{componentResp.text}\nBad API request. See response above."
+        )
+
+    if not componentResp.json()["acknowledged"]:
+        raise NotCreatedError("tpot-mappings component template not created.")
+
+    streams = []
+
+    for honeypotType in HONEYPOT_TYPES:
+        streamName = dataStreamName(honeypotType)
+        typeKey = honeypotType.lower()
+
+        policyName = createILMPolicy(
+            hostPort,
+            creatorUser,
+            creatorPwd,
+            {**retention, **perType.get(typeKey, {})},
+            f"t_pot_{typeKey}_ilm_policy",
+        )
+
+        templateData = {
+            "index_patterns": [streamName],
+            "data_stream": {},
+            "composed_of": ["tpot-mappings"],
+            # above the built-in logs-*-* template and any leftover legacy templates
+            "priority": 200,
+            "template": {
+                "settings": {
+                    "index.lifecycle.name": policyName,
+                    "index.number_of_shards": 1,
+                    "index.final_pipeline": latencyPipeline,
+                }
+            },
+        }
+
+        templateResp = requests.put(
+            f"https://{hostPort}/_index_template/{streamName}",
+            auth=authTup,
+            json=templateData,
+        )
+
+        try:
+            templateResp.raise_for_status()
+        except HTTPError:
+            raise BadAPIRequestError(
+                f"{templateResp.text}\nBad API request. See response above."
+            )
+
+        if not templateResp.json()["acknowledged"]:
+            raise NotCreatedError(f"{streamName} index template not created.")
+
+        # create empty stream right away so index patterns and transforms reading
+        # from it work before the first event arrives
+        streamResp = requests.put(
+            f"https://{hostPort}/_data_stream/{streamName}", auth=authTup
+        )
+
+        if "resource_already_exists_exception" not in streamResp.text:
+            try:
+                streamResp.raise_for_status()
+            except HTTPError:
+                raise BadAPIRequestError(
+                    f"{streamResp.text}\nBad API request. See response above."
+                )
+
+        streams.append(streamName)
+
+    return streams
+
+
+def createSummaryTransforms(hostPort, creatorUser, creatorPwd, retention=None):
+    """Create and start continuous transforms summarizing all honeypot data streams
+    into per-minute attack and credential counts, which dashboards can aggregate far
+    faster than raw events
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :creatorUser: user with which to make API requests (usually elastic)
+    :creatorPwd: password to above user
+    :retention: optional, dictionary with a summaryMaxAge key (usually
+    logging.retention in credentials.json). Summary documents older than it are
+    deleted. Falls back to DEFAULT_RETENTION
+    :returns: list of names of summary indices the transforms write to
+
+    """
+    authTup = (creatorUser, creatorPwd)
+    settings = {**DEFAULT_RETENTION, **(retention or {})}
+    minuteGroup = {
+        "@timestamp": {
+            "date_histogram": {"field": "@timestamp", "fixed_interval": "1m"}
+        },
+        "type": {"terms": {"field": "type.keyword"}},
+    }
+
+    # summary index (and transform ID) -> extra group_by fields and source query.
+    # Summary indices don't start with tpot- so the tpot-* index pattern skips them
+    summaries = {
+        "tpotsummary-attacks": (
+            {
+                "country": {"terms": {"field": "geoip.country_name.keyword"}},
+                "asn": {"terms": {"field": "geoip.asn"}},
+                "as_org": {"terms": {"field": "geoip.as_org.keyword"}},
+                "dest_port": {"terms": {"field": "dest_port"}},
+            },
+            {"match_all": {}},
+        ),
+        "tpotsummary-credentials": (
+            {
+                "username": {"terms": {"field": "username.keyword"}},
+                "password": {"terms": {"field": "password.keyword"}},
+            },
+            {"exists": {"field": "username"}},
+        ),
+    }
+
+    for summaryIndex, (groupBy, query) in summaries.items():
+        # events missing a field (e.g. no GeoIP info) still get counted
+        for group in groupBy.values():
+            group["terms"]["missing_bucket"] = True
+
+        transformData = {
+            "source": {
+                "index": ["tpot-*"],
+                # canary events aren't attacks
+                "query": {"bool": {"filter": [query, EXCLUDE_CANARY_QUERY]}},
+            },
+            "dest": {"index": summaryIndex},
+            "frequency": "1m",
+            # leave events time to get from sensors to the logging server
+            "sync": {"time": {"field": "@timestamp", "delay": "60s"}},
+            "pivot": {
+                "group_by": {**minuteGroup, **groupBy},
+                "aggregations": {"attacks": {"value_count": {"field": "@timestamp"}}},
+            },
+            "retention_policy": {
+                "time": {"field": "@timestamp", "max_age": settings["summaryMaxAge"]}
+            },
+        }
+
+        transformResp = requests.put(
+            f"https://{hostPort}/_transform/{summaryIndex}",
+            auth=authTup,
+            json=transformData,
+        )
+
+        try:
+            transformResp.raise_for_status()
+        except HTTPError:
+            # Usually if API request is made before elasticsearch service is ready
+            raise BadAPIRequestError(
+                f"{transformResp.text}\nBad API request. See response above."
+            )
+
+        if not transformResp.json()["acknowledged"]:
+            raise NotCreatedError(f"{summaryIndex} transform not created.")
+
+        startResp = requests.post(
+            f"https://{hostPort}/_transform/{summaryIndex}/_start", auth=authTup
+        )
+
+        try:
+            startResp.raise_for_status()
+        except HTTPError:
+            raise BadAPIRequestError(
+                f"{startResp.text}\nBad API request. See response above."
+            )
+
+    return list(summaries)
+
+
+def createSummaryDashboardObjects(attacksPattern, credentialsPattern):
+    """Create Kibana saved objects for a dashboard showing the same attack statistics
+    as T-Pot's dashboards, read from the summary indices of createSummaryTransforms
+
+    :attacksPattern: ID of index pattern of attacks summary index
+    :credentialsPattern: ID of index pattern of credentials summary index
+    :returns: text of saved objects in ndjson format, ready for importKibanaObjects
+
+    """
+    histogramParams = {
+        "type": "histogram",
+        "grid": {"categoryLines": False},
+        "categoryAxes": [
+            {
+                "id": "CategoryAxis-1",
+                "type": "category",
+                "position": "bottom",
+                "show": True,
+                "style": {},
+                "scale": {"type": "linear"},
+                "labels": {"show": True, "filter": True, "truncate": 100},
+                "title": {},
+            }
+        ],
+        "valueAxes": [
+            {
+                "id": "ValueAxis-1",
+                "name": "LeftAxis-1",
+                "type": "value",
+                "position": "left",
+                "show": True,
+                "style": {},
+                "scale": {"type": "linear", "mode": "normal"},
+                "labels": {"show": True, "rotate": 0, "filter": False, "truncate": 100},
+                "title": {"text": "Attacks"},
+            }
+        ],
+        "seriesParams": [
+            {
+                "show": True,
+                "type": "histogram",
+                "mode": "stacked",
+                "data": {"label": "Attacks", "id": "1"},
+                "valueAxis": "ValueAxis-1",
+            }
+        ],
+        "addTooltip": True,
+        "addLegend": True,
+        "legendPosition": "right",
+        "times": [],
+        "addTimeMarker": False,
+    }
+    tableParams = {
+        "perPage": 10,
+        "showPartialRows": False,
+        "showMetricsAtAllLevels": False,
+        "showTotal": False,
+        "totalFunc": "sum",
+        "percentageCol": "",
+    }
+    attacksMetric = {
+        "id": "1",
+        "enabled": True,
+        "type": "sum",
+        "params": {"field": "attacks", "customLabel": "Attacks"},
+        "schema": "metric",
+    }
+
+    def termsAgg(aggId, field, schema, label):
+        return {
+            "id": aggId,
+            "enabled": True,
+            "type": "terms",
+            "params": {
+                "field": field,
+                "size": 10,
+                "order": "desc",
+                "orderBy": "1",
+                "customLabel": label,
+            },
+            "schema": schema,
+        }
+
+    # visualization ID -> (title, type, params, buckets, index pattern ID)
+    visualizations = {
+        "tpotsummary-histogram": (
+            "Attacks per Honeypot (Summary)",
+            "histogram",
+            histogramParams,
+            [
+                {
+                    "id": "2",
+                    "enabled": True,
+                    "type": "date_histogram",
+                    "params": {"field": "@timestamp", "interval": "auto"},
+                    "schema": "segment",
+                },
+                termsAgg("3", "type", "group", "Honeypot"),
+            ],
+            attacksPattern,
+        ),
+        "tpotsummary-countries": (
+            "Attacker Countries (Summary)",
+            "table",
+            tableParams,
+            [termsAgg("2", "country", "bucket", "Country")],
+            attacksPattern,
+        ),
+        "tpotsummary-asns": (
+            "Attacker ASNs (Summary)",
+            "table",
+            tableParams,
+            [
+                termsAgg("2", "asn", "bucket", "ASN"),
+                termsAgg("3", "as_org", "bucket", "AS Organization"),
+            ],
+            attacksPattern,
+        ),
+        "tpotsummary-ports": (
+            "Destination Ports (Summary)",
+            "table",
+            tableParams,
+            [termsAgg("2", "dest_port", "bucket", "Port")],
+            attacksPattern,
+        ),
+        "tpotsummary-usernames": (
+            "Usernames (Summary)",
+            "table",
+            tableParams,
+            [termsAgg("2", "username", "bucket", "Username")],
+            credentialsPattern,
+        ),
+        "tpotsummary-passwords": (
+            "Passwords (Summary)",
+            "table",
+            tableParams,
+            [termsAgg("2", "password", "bucket", "Password")],
+            credentialsPattern,
+        ),
+    }
+
+    searchSource = {
+        "query": {"query": "", "language": "kuery"},
+        "filter": [],
+        "indexRefName": "kibanaSavedObjectMeta.searchSourceJSON.index",
+    }
+    savedObjects = []
+    panels = []
+    dashboardRefs = []
+
+    for panelNum, (visId, (title, visType, params, buckets, patternId)) in enumerate(
+        visualizations.items()
+    ):
+        visState = {
+            "title": title,
+            "type": visType,
+            "params": params,
+            "aggs": [attacksMetric] + buckets,
+        }
+        savedObjects.append(
+            {
+                "id": visId,
+                "type": "visualization",
+                "attributes": {
+                    "title": title,
+                    "visState": json.dumps(visState),
+                    "uiStateJSON": "{}",
+                    "description": "",
+                    "version": 1,
+                    "kibanaSavedObjectMeta": {
+                        "searchSourceJSON": json.dumps(searchSource)
+                    },
+                },
+                "references": [
+                    {
+                        "name": "kibanaSavedObjectMeta.searchSourceJSON.index",
+                        "type": "index-pattern",
+                        "id": patternId,
+                    }
+                ],
+            }
+        )
+
+        # full-width histogram on top, then tables two per row
+        if panelNum == 0:
+            gridData = {"x": 0, "y": 0, "w": 48, "h": 15}
+        else:
+            gridData = {
+                "x": 24 * ((panelNum - 1) % 2),
+                "y": 15 + 15 * ((panelNum - 1) // 2),
+                "w": 24,
+                "h": 15,
+            }
+
+        panelIndex = str(panelNum + 1)
+        panels.append(
+            {
+                "panelIndex": panelIndex,
+                "gridData": {**gridData, "i": panelIndex},
+                "embeddableConfig": {},
+                "panelRefName": f"panel_{panelNum}",
+            }
+        )
+        dashboardRefs.append(
+            {"name": f"panel_{panelNum}", "type": "visualization", "id": visId}
+        )
+
+    savedObjects.append(
+        {
+            "id": "tpotsummary-dashboard",
+            "type": "dashboard",
+            "attributes": {
+                "title": "T-Pot Summary",
+                "description": "Per-minute attack and credential counts from the"
+                " tpotsummary-* transform indices",
+                "panelsJSON": json.dumps(panels),
+                "optionsJSON": json.dumps(
+                    {"useMargins": True, "hidePanelTitles": False}
+                ),
+                "timeRestore": False,
+                "version": 1,
+                "kibanaSavedObjectMeta": {
+                    "searchSourceJSON": json.dumps(
+                        {"query": {"query": "", "language": "kuery"}, "filter": []}
+                    )
+                },
+            },
+            "references": dashboardRefs,
+        }
+    )
+
+    return "".join(f"{json.dumps(savedObject)}\n" for savedObject in savedObjects)
+
+
+def applyHostTuning(connection, tuningProfile):
+    """Apply host tuning profile (rendered by configFuncs.createHostTuningProfile) to
+    logging server and disable swap. Elasticsearch must be (re)started afterwards
+
+    :connection: fabric.Connection object to logging server
+    :tuningProfile: dictionary mapping destination paths of files to their text
+    :returns: None
+
+    """
+    for remotePath, text in tuningProfile.items():
+        putFile(connection, text, remotePath, owner="root:root")
+
+    connection.sudo("sysctl --system", hide=True)
+
+    # swapping out the heap kills elasticsearch performance, so turn it off for good
+    connection.sudo("swapoff -a", hide=True)
+    connection.sudo("sed -i '/\\sswap\\s/ s/^#*/#/' /etc/fstab", hide=True)
+
+    connection.sudo("systemctl daemon-reload", hide=True)
+
+
+def checkHostTuning(hostPort, userName, password, minFileDescriptors=65535):
+    """Check that host tuning took effect on every elasticsearch node
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :minFileDescriptors: optional, minimum number of file descriptors elasticsearch
+    should be allowed to open. Defaults to 65535
+    :returns: None
+
+    """
+    nodesResp = requests.get(
+        f"https://{hostPort}/_nodes/process", auth=(userName, password)
+    )
+
+    try:
+        nodesResp.raise_for_status()
+    except HTTPError:
+        # Usually if API request is made before elasticsearch service is ready
+        raise BadAPIRequestError(
+            f"{nodesResp.text}\nBad API request. See response above."
+        )
+
+    problems = []
+
+    for node in nodesResp.json()["nodes"].values():
+        process = node["process"]
+
+        if not process["mlockall"]:
+            problems.append(f"{node['name']}: memory is not locked")
+
+        if process["max_file_descriptors"] < minFileDescriptors:
+            problems.append(
+                f"{node['name']}: only {process['max_file_descriptors']} file"
+                " descriptors allowed"
+            )
+
+    if problems:
+        raise HostTuningError("\n".join(problems))
+
+
+def createEnrichPipeline(hostPort, creatorUser, creatorPwd):
+    """Create elasticsearch ingest pipeline adding GeoIP and ASN info to honeypot
+    events on the logging server, in the same fields as the sensors' Logstash geoip
+    filters (used in central enrichment mode)
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :creatorUser: user with which to make API requests (usually elastic)
+    :creatorPwd: password to above user
+    :returns: name of pipeline created
+
+    """
+    pipelineName = ENRICH_PIPELINE
+
+    # rename ingest geoip fields to the ones Logstash uses, as dashboards expect them
+    renamedFields = {
+        "geoip.country_iso_code": "geoip.country_code2",
+        "geoip.region_iso_code": "geoip.region_code",
+        "geoip_asn.asn": "geoip.asn",
+        "geoip_asn.organization_name": "geoip.as_org",
+    }
+    copiedFields = {
+        "src_ip": "geoip.ip",
+        "geoip.location.lat": "geoip.latitude",
+        "geoip.location.lon": "geoip.longitude",
+    }
+
+    pipelineData = {
+        "description": "Add GeoIP and ASN info to T-Pot honeypot events",
+        "processors": [
+            {
+                "geoip": {
+                    "field": "src_ip",
+                    "target_field": "geoip",
+                    "ignore_missing": True,
+                    # some honeypots log IPs geoip can't parse, keep those events
+                    "ignore_failure": True,
+                }
+            },
+            {
+                "geoip": {
+                    "field": "src_ip",
+                    "target_field": "geoip_asn",
+                    "database_file": "GeoLite2-ASN.mmdb",
+                    "properties": ["asn", "organization_name"],
+                    "ignore_missing": True,
+                    "ignore_failure": True,
+                }
+            },
+        ]
+        + [
+            {"rename": {"field": source, "target_field": dest, "ignore_missing": True}}
+            for source, dest in renamedFields.items()
+        ]
+        + [
+            {
+                "set": {
+                    "if": "ctx.geoip != null",
+                    "field": dest,
+                    "copy_from": source,
+                    "ignore_empty_value": True,
+                    "ignore_failure": True,
+                }
+            }
+            for source, dest in copiedFields.items()
+        ]
+        + [{"remove": {"field": "geoip_asn", "ignore_missing": True}}],
+    }
+
+    pipelineResp = requests.put(
+        f"https://{hostPort}/_ingest/pipeline/{pipelineName}",
+        auth=(creatorUser, creatorPwd),
+        json=pipelineData,
+    )
+
+    try:
+        pipelineResp.raise_for_status()
+    except HTTPError:
+        # Usually if API request is made before elasticsearch service is ready
+        raise BadAPIRequestError(
+            f"{pipelineResp.text}\nBad API request. See response above."
+        )
+
+    if not pipelineResp.json()["acknowledged"]:
+        raise NotCreatedError(f"{pipelineName} ingest pipeline not created.")
+
+    return pipelineName
+
+
+def waitForClusterNodes(
+    hostPort, userName, password, nodeCount, timeout=300, status=None
+):
+    """Block until all elasticsearch nodes of the logging tier have joined the cluster
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :nodeCount: number of nodes expected in the cluster
+    :timeout: optional, number of seconds to wait for. Defaults to 300
+    :status: optional, cluster health (yellow or green) to also wait for, i.e. until
+    shards are recovered. Defaults to not waiting for any
+    :returns: None
+
+    """
+    params = {"wait_for_nodes": nodeCount, "timeout": f"{timeout}s"}
+
+    if status is not None:
+        params["wait_for_status"] = status
+
+    healthResp = requests.get(
+        f"https://{hostPort}/_cluster/health", auth=(userName, password), params=params
+    )
+
+    # elasticsearch answers with 408 status code if nodes didn't join before timeout
+    if healthResp.status_code == 408:
+        raise NotCreatedError(
+            f"Not all {nodeCount} nodes joined the cluster"
+            + (f" or cluster health isn't {status}" if status else "")
+        )
+
+    try:
+        healthResp.raise_for_status()
+    except HTTPError:
+        # Usually if API request is made before elasticsearch service is ready
+        raise BadAPIRequestError(
+            f"{healthResp.text}\nBad API request. See response above."
+        )
 
 
 def createTPotRole(hostPort, creatorUser, creatorPwd):
@@ -182,18 +1289,18 @@ def createTPotRole(hostPort, creatorUser, creatorPwd):
     # permissions needed to send honeypot data
     roleData = {
         "cluster": [
-            "manage_index_templates",
             "monitor",
         ],
         "indices": [
             {
+                # sensors only append to data streams, whose templates and ILM
+                # policies are created on the logging server
                 "names": [
-                    "logstash-*",
+                    "tpot-*",
                 ],
                 "privileges": [
-                    "write",
-                    "delete",
-                    "create_index",
+                    "create_doc",
+                    "auto_configure",
                 ],
                 "allow_restricted_indices": False,
             }
@@ -245,7 +1352,7 @@ def createTPotUser(hostPort, creatorUser, creatorPwd=None, createdPwd=None):
         with open("passwords.txt") as f:
             creatorPwd = findPassword(f.read(), creatorUser)
 
-    userName = "t_pot_internal"
+    userName = TPOT_USER
     # first create role to assign to user
     roleName = createTPotRole(hostPort, creatorUser, creatorPwd)
 
@@ -287,39 +1394,210 @@ def createTPotUser(hostPort, creatorUser, creatorPwd=None, createdPwd=None):
     return userName, createdPwd
 
 
-def importKibanaObjects(hostPort, userName, password):
-    """Convenience function to programmatically import nice T-Pot attack visualizations
-    in kibana as well as set dark mode. Note that the /api/saved_objects/_import
-    endpoint is experimental in ELK 7.11, so this may not work with future versions.
+def downloadKibanaObjects(cacheDir=KIBANA_CACHE_DIR):
+    """Download T-Pot's Kibana saved objects (dashboards, visualizations and index
+    pattern) from the tpotce-light repository, reusing the cached export in cacheDir
+    as long as GitHub reports it unchanged (through its ETag)
+
+    :cacheDir: optional, directory holding downloaded exports by SHA-256 and the ETag
+    of the latest one. Defaults to KIBANA_CACHE_DIR
+    :returns: text of saved objects export in ndjson format
+
+    """
+    metaPath = os.path.join(cacheDir, "kibana_export.json")
+
+    try:
+        with open(metaPath) as f:
+            cacheMeta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        cacheMeta = {}
+
+    cachedPath = os.path.join(cacheDir, f"{cacheMeta.get('sha256')}.zip")
+    headers = {}
+
+    if os.path.exists(cachedPath):
+        headers["If-None-Match"] = cacheMeta["etag"]
+
+    zipResp = requests.get(KIBANA_OBJECTS_URL, headers=headers)
+
+    if zipResp.status_code == 304:
+        with open(cachedPath, "rb") as f:
+            zipContent = f.read()
+    else:
+        zipResp.raise_for_status()
+        zipContent = zipResp.content
+        zipHash = hashlib.sha256(zipContent).hexdigest()
+
+        os.makedirs(cacheDir, exist_ok=True)
+
+        with open(os.path.join(cacheDir, f"{zipHash}.zip"), "wb") as f:
+            f.write(zipContent)
+
+        with open(metaPath, "w") as f:
+            json.dump({"etag": zipResp.headers.get("ETag"), "sha256": zipHash}, f)
+
+    # extract .ndjson file from zip without touching the disk
+    with ZipFile(BytesIO(zipContent)) as zf:
+        return zf.read(zf.namelist()[0]).decode()
+
+
+def getDeploymentState(hostPort, userName, password, key):
+    """Get value recorded by setDeploymentState in the deploy-t-pot-state index
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :key: name of state value
+    :returns: recorded value, or None if none was recorded yet
+
+    """
+    stateResp = requests.get(
+        f"https://{hostPort}/{STATE_INDEX}/_doc/{key}", auth=(userName, password)
+    )
+
+    if stateResp.status_code == 404:
+        return None
+
+    try:
+        stateResp.raise_for_status()
+    except HTTPError:
+        raise BadAPIRequestError(
+            f"{stateResp.text}\nBad API request. See response above."
+        )
+
+    return stateResp.json()["_source"]["value"]
+
+
+def setDeploymentState(hostPort, userName, password, key, value):
+    """Record a value about the deployment in the deploy-t-pot-state index
 
     :hostPort: elasticsearch FQDN and port, in form FQDN:port
     :userName: user with which to make API requests (usually elastic)
     :password: password to above user
+    :key: name of state value
+    :value: JSON-serializable value to record
     :returns: None
 
     """
-    # get kibana_export.ndjson from tpotce-light repository
-    zipResp = requests.get(
-        "https://raw.githubusercontent.com/ezacl/tpotce-light/"
-        "master/etc/objects/kibana_export.ndjson.zip"
+    stateResp = requests.put(
+        f"https://{hostPort}/{STATE_INDEX}/_doc/{key}",
+        auth=(userName, password),
+        json={"value": value},
+    )
+
+    try:
+        stateResp.raise_for_status()
+    except HTTPError:
+        raise BadAPIRequestError(
+            f"{stateResp.text}\nBad API request. See response above."
+        )
+
+
+def installedObjectsHash(hostPort, userName, password, objectsText):
+    """Hash the saved objects of an ndjson set as they are installed in Kibana, so
+    objects deleted or edited since their import are noticed
+
+    :hostPort: kibana FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :objectsText: saved objects in ndjson format, whose installed copies to hash
+    :returns: SHA-256 hex digest of the installed objects' attributes and references,
+    or None if any of them is missing
+
+    """
+    objectRefs = [
+        {"type": savedObject["type"], "id": savedObject["id"]}
+        for savedObject in (
+            json.loads(line) for line in objectsText.splitlines() if line.strip()
+        )
+        # exports end with a line counting the exported objects
+        if "id" in savedObject
+    ]
+    exportResp = requests.post(
+        f"https://{hostPort}/api/saved_objects/_export",
+        headers={"kbn-xsrf": "true"},
+        auth=(userName, password),
+        json={"objects": objectRefs, "excludeExportDetails": True},
     )
-    zipResp.raise_for_status()
 
-    zipName = "kibanaObjects.zip"
+    # Kibana refuses to export objects that don't exist
+    if exportResp.status_code != 200:
+        return None
+
+    # updated_at and version change on every import, even of identical objects
+    installedObjects = sorted(
+        (
+            {
+                "type": savedObject["type"],
+                "id": savedObject["id"],
+                "attributes": savedObject.get("attributes"),
+                "references": savedObject.get("references", []),
+            }
+            for savedObject in (
+                json.loads(line)
+                for line in exportResp.text.splitlines()
+                if line.strip()
+            )
+        ),
+        key=lambda savedObject: (savedObject["type"], savedObject["id"]),
+    )
 
-    with open(zipName, "wb") as f:
-        f.write(zipResp.content)
+    if len(installedObjects) != len(objectRefs):
+        return None
+
+    return hashlib.sha256(
+        json.dumps(installedObjects, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def importKibanaObjects(
+    hostPort,
+    userName,
+    password,
+    objectsText=None,
+    objectsName="kibana_export",
+    elasticHostPort=None,
+):
+    """Convenience function to programmatically import nice T-Pot attack visualizations
+    in kibana as well as set dark mode. Note that the /api/saved_objects/_import
+    endpoint is experimental in ELK 7.11, so this may not work with future versions.
 
-    # extract .ndjson file from zip
-    with ZipFile(zipName) as zf:
-        zf.extractall()
-        objectFile = zf.namelist()[0]
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :objectsText: optional, saved objects to import in ndjson format. If left blank,
+    they are downloaded with downloadKibanaObjects
+    :objectsName: optional, name of saved objects set, under which the hashes of the
+    last imported set are recorded. Defaults to kibana_export
+    :elasticHostPort: optional, elasticsearch FQDN and port. If given, the import is
+    skipped when the same objects were already imported, according to the hashes
+    recorded in the deploy-t-pot-state index, and are still installed unchanged in
+    Kibana (see installedObjectsHash)
+    :returns: True if objects were imported, False if skipped
 
-    objFileHandle = open(objectFile)
-    importFile = {"file": objFileHandle}
+    """
+    if objectsText is None:
+        objectsText = downloadKibanaObjects()
 
     authTup = (userName, password)
     headers = {"kbn-xsrf": "true"}
+    objectsBytes = objectsText.encode()
+    objectsHash = hashlib.sha256(objectsBytes).hexdigest()
+    stateKey = f"kibana-objects-{objectsName}"
+
+    if elasticHostPort is not None:
+        importState = getDeploymentState(elasticHostPort, userName, password, stateKey)
+
+        # the recorded hash alone misses objects deleted or edited in Kibana since
+        if isinstance(importState, dict) and importState.get("objects") == objectsHash:
+            installedHash = installedObjectsHash(
+                hostPort, userName, password, objectsText
+            )
+
+            if installedHash is not None and installedHash == importState.get(
+                "installed"
+            ):
+                return False
 
     # import all objects in file through API
     importResp = requests.post(
@@ -327,13 +1605,9 @@ def importKibanaObjects(hostPort, userName, password):
         params={"overwrite": "true"},
         headers=headers,
         auth=authTup,
-        files=importFile,
+        files={"file": (f"{objectsName}.ndjson", BytesIO(objectsBytes))},
     )
 
-    objFileHandle.close()
-    os.remove(zipName)
-    os.remove(objectFile)
-
     try:
         importResp.raise_for_status()
     except HTTPError:
@@ -342,6 +1616,14 @@ def importKibanaObjects(hostPort, userName, password):
             f"{importResp.text}\nBad API request. See response above."
         )
 
+    # objects that fail to import don't fail the request, so never record them as
+    # imported
+    if not importResp.json()["success"]:
+        raise BadAPIRequestError(
+            f"{importResp.text}\nSome Kibana objects failed to import. See response"
+            " above."
+        )
+
     # enable kibaana dark mode
     darkModeResp = requests.post(
         f"https://{hostPort}/api/kibana/settings/theme:darkMode",
@@ -357,3 +1639,49 @@ def importKibanaObjects(hostPort, userName, password):
         raise BadAPIRequestError(
             f"{darkModeResp.text}\nBad API request. See response above."
         )
+
+    if elasticHostPort is not None:
+        setDeploymentState(
+            elasticHostPort,
+            userName,
+            password,
+            stateKey,
+            {
+                "objects": objectsHash,
+                "installed": installedObjectsHash(
+                    hostPort, userName, password, objectsText
+                ),
+            },
+        )
+
+    return True
+
+
+def createIndexPatterns(hostPort, userName, password, titles):
+    """Create Kibana index patterns (with @timestamp as time field) through the saved
+    objects API, overwriting any with the same title
+
+    :hostPort: kibana FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :titles: list of index patterns to create, such as tpot-cowrie. Each is also used
+    as the ID of its saved object
+    :returns: None
+
+    """
+    for title in titles:
+        patternResp = requests.post(
+            f"https://{hostPort}/api/saved_objects/index-pattern/{title}",
+            params={"overwrite": "true"},
+            headers={"kbn-xsrf": "true"},
+            auth=(userName, password),
+            json={"attributes": {"title": title, "timeFieldName": "@timestamp"}},
+        )
+
+        try:
+            patternResp.raise_for_status()
+        except HTTPError:
+            # Usually if API request is made before kibana service is ready
+            raise BadAPIRequestError(
+                f"{patternResp.text}\nBad API request. See response above."
+            )
@@ -1,24 +1,29 @@
 import json
+import os
+import sys
 
 from errors import NoCredentialsFileError
 from vmManagement import APIRemoveNetwork
 
 
-def destroyNetwork(credsFile="credentials.json", DOApiKeyFile="digitalocean.ini"):
+def destroyNetwork(workspace="."):
     """Automatically and completely tear down T-Pot network through DigitalOcean API
 
-    :credsFile: optional, path to credentials JSON file. Defaults to credentials.json
-    :DOApiKeyFile: optional, path to file containing DigitalOcean API key. Defaults to
-    digitalocean.ini
+    :workspace: optional, path to workspace directory of the network (see
+    fabfile.deployNetwork). Defaults to the current directory
     :returns: None
 
     """
+    credsFile = os.path.join(workspace, "credentials.json")
+    DOApiKeyFile = os.path.join(workspace, "digitalocean.ini")
+
     try:
         # get server credentials from credentials file
         with open(credsFile) as f:
             credentials = json.load(f)
             logCreds = credentials["logging"]
             sensorCreds = credentials["sensors"]
+            relayCreds = credentials.get("relays", [])
     except FileNotFoundError:
         raise NoCredentialsFileError(
             f"{credsFile} not found. Did you copy credentials.json.template?"
@@ -28,10 +33,11 @@ def destroyNetwork(credsFile="credentials.json", DOApiKeyFile="digitalocean.ini"
     with open(DOApiKeyFile) as f:
         apiKey = f.read().strip().split()[-1]
 
-    APIRemoveNetwork(apiKey, logCreds, sensorCreds)
+    APIRemoveNetwork(apiKey, logCreds, sensorCreds, relayCreds)
 
     print("T-Pot network successfully destroyed.")
 
 
 if __name__ == "__main__":
-    destroyNetwork()
+    # optional command-line argument is the network's workspace directory
+    destroyNetwork(sys.argv[1] if len(sys.argv) > 1 else ".")
@@ -41,3 +41,86 @@ class NoSubdomainError(BaseException):
     """
 
     pass
+
+
+class UnknownSizeError(BaseException):
+    """Error class to indicate that the amount of memory of a DigitalOcean droplet
+    could not be read from its size slug (such as s-4vcpu-8gb) or found in
+    utils.DROPLET_MEMORY_MB (such as c-4) in utils.dropletMemoryMb
+
+    """
+
+    pass
+
+
+class HostTuningError(BaseException):
+    """Error class for when Elasticsearch reports that the host tuning applied by
+    deploymentHelpers.applyHostTuning (memory lock, file descriptors) did not take
+    effect
+
+    """
+
+    pass
+
+
+class VPCRegionError(BaseException):
+    """Error class for when a server in credentials.json sets a region other than the
+    logging server's while logging.vpc is on, since a VPC can't span regions
+
+    """
+
+    pass
+
+
+class UnknownProfileError(BaseException):
+    """Error class for when a sensor names a honeypot profile missing from
+    configFiles/honeypotProfiles.json
+
+    """
+
+    pass
+
+
+class UnresolvedPlaceholderError(BaseException):
+    """Error class for when a template in configFiles is rendered without a value for
+    one of its {{NAME}} placeholders
+
+    """
+
+    pass
+
+
+class CanaryTimeoutError(BaseException):
+    """Error class for when a canary event written on a sensor by canaryProbe.py
+    doesn't become searchable in Elasticsearch
+
+    """
+
+    pass
+
+
+class StepGraphError(BaseException):
+    """Error class for when the steps given to stepScheduler.runSteps don't form a
+    valid dependency graph
+
+    """
+
+    pass
+
+
+class UncoveredFieldsError(BaseException):
+    """Error class for when Kibana saved objects use fields which
+    configFiles/fieldAllowlist.json prunes from the events of a honeypot type
+
+    """
+
+    pass
+
+
+class NoIngestNodeError(BaseException):
+    """Error class for when no logging node in credentials.json has the data or
+    ingest role, leaving sensors nowhere to send events
+
+    """
+
+    pass
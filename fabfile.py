@@ -1,8 +1,10 @@
+import base64
 import json
 import logging
 import os
 import sys
 import time
+from contextlib import contextmanager
 
 from fabric import Config, Connection
 from invoke import Responder
@@ -10,33 +12,100 @@ from invoke.config import Config as InvokeConfig
 from invoke.context import Context
 from invoke.exceptions import UnexpectedExit
 
-from configFuncs import (createElasticsearchYml, createKibanaYml,
-                         createLogstashConf, createUpdateCertsSh)
-from deploymentHelpers import (createSudoUser, createTPotUser,
-                               generateSSLCerts, importKibanaObjects,
-                               installPackages, setupCurator, transferSSLCerts)
-from errors import BadAPIRequestError, NoCredentialsFileError
-from utils import findPassword, waitForService
-from vmManagement import createAllVMs
+from canaryProbe import CANARY_LOG, probeFleet
+from configFuncs import (CONFIG_DIR, ELASTIC_PATH, KIBANA_PATH, PROJECT_DIR,
+                         SENSOR_DATA_PATH, createHostTuningProfile,
+                         createSensorCompose, createUpdateCertsSh,
+                         findUncoveredFields, loadFieldAllowlist,
+                         renderCentralLogstashConf, renderElasticsearchYml,
+                         renderKibanaYml, renderRelayConf, renderShipperConf,
+                         shipperConfPath)
+from deploymentHelpers import (EXCLUDE_CANARY_QUERY, TPOT_USER,
+                               addElasticRepository, applyHostTuning,
+                               checkHostTuning, createDataStreamTemplates,
+                               createEnrichPipeline, createIndexPatterns,
+                               createSudoUser, createSummaryDashboardObjects,
+                               createSummaryTransforms, createTPotUser,
+                               downloadKibanaObjects, generateSSLCerts,
+                               importKibanaObjects, installPackages, putFile,
+                               restrictPorts, setTPotHostname,
+                               setupCentralLogstash, setupRelay,
+                               transferSSLCerts, waitForClusterNodes)
+from errors import (BadAPIRequestError, CanaryTimeoutError,
+                    NoCredentialsFileError, UncoveredFieldsError)
+from fleet import connectHost
+from stepScheduler import (createStep, criticalPath, findDependencies,
+                           formatCriticalPath, runSteps)
+from utils import (addSearchFilter, centralLogstashHost, findPassword,
+                   findSavedObjectFields, findTPotFlavor, getIngestHosts,
+                   getLoggingNodes, privateHost, replaceIndexPatternTitle,
+                   tPotHostname, usesFilebeat, waitForService)
+from vmManagement import LOGGER_SIZE, createAllVMs, hostSize
 
 logFile = "deployment.log"
+# most steps of a deployment to run at once, each can hold SSH sessions to servers
+stepWorkers = 16
 
-logging.basicConfig(
-    filename=logFile,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
 logger = logging.getLogger(__name__)
-# log to both stdout and log file
+logger.setLevel(logging.INFO)
+# log to both stdout and the log file of the workspace (see logToWorkspace)
 logger.addHandler(logging.StreamHandler(sys.stdout))
 
 
-def installTPot(number, connection, certDir):
-    """Install custom T-Pot Sensor type on connection server
+@contextmanager
+def logToWorkspace(workspace):
+    """Write logs to deployment.log in the workspace directory of a network while in
+    the with block, so deployments of several networks from one server or one process
+    keep separate logs
 
-    :number: index of sensor in deployNetwork for loop (for logging purposes)
-    :connection: fabric.Connection object with connection to sensor server (4 GB RAM)
-    :certDir: path to temporary directory containing SSL certificates
+    :workspace: path to workspace directory of the network
+    :returns: context manager removing and closing the log file's handler on exit
+
+    """
+    fileHandler = logging.FileHandler(os.path.join(workspace, logFile))
+    fileHandler.setFormatter(
+        logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    )
+    logger.addHandler(fileHandler)
+
+    try:
+        yield
+    finally:
+        logger.removeHandler(fileHandler)
+        fileHandler.close()
+
+
+def addCronJob(localConn, schedule, script, workspace):
+    """Add cron job on deployment server running one of the project's scripts for a
+    network, replacing the job added by an earlier deployment of the same network
+
+    :localConn: fabric.Connection object to deployment server
+    :schedule: cron schedule expression, such as */10 * * * *
+    :script: file name of script in the project directory, which takes the
+    workspace directory as its first argument
+    :workspace: absolute path to workspace directory of the network
+    :returns: None
+
+    """
+    command = f"{schedule} python3 {PROJECT_DIR}/{script} {workspace}"
+    localConn.run(
+        f"(crontab -l 2>/dev/null | grep -v '{script} {workspace}$';"
+        f' echo "{command}") | crontab -',
+        hide="stdout",
+    )
+
+
+def installTPotBase(number, connection, shipper="logstash", profile=None):
+    """Install custom T-Pot Sensor type on connection server, without its shipper
+    config and certificate (see finishTPot), which need the logging server
+
+    :number: index of sensor in credentials.json (for logging purposes)
+    :connection: fabric.Connection object with connection to sensor server (4 GB RAM,
+    or 2 GB with Filebeat)
+    :shipper: optional, logstash to parse events on the sensor or filebeat to ship
+    raw events to the central Logstash on the logging server. Defaults to logstash
+    :profile: optional, name of honeypot profile in configFiles/honeypotProfiles.json
+    choosing which honeypots to run. Defaults to every honeypot
     :returns: None
 
     """
@@ -45,7 +114,7 @@ def installTPot(number, connection, certDir):
     logger.info(f"Sensor {number}: Updated packages and installed git")
 
     # copy vimrc over for convenience
-    vimrcPath = "configFiles/.vimrc"
+    vimrcPath = f"{CONFIG_DIR}/.vimrc"
     connection.put(vimrcPath)
     connection.sudo(f"cp {os.path.basename(vimrcPath)} /root/", hide=True)
 
@@ -57,6 +126,20 @@ def installTPot(number, connection, certDir):
     )
     logger.info(f"Sensor {number}: Cloned T-Pot into {tPotPath}")
 
+    # trim compose file of the flavor chosen in tpot.conf before install.sh copies it
+    # to /opt/tpot/etc/tpot.yml, so only the profile's containers get pulled and run
+    tPotConf = connection.run(f"cat {tPotPath}/iso/installer/tpot.conf", hide=True)
+    flavor = findTPotFlavor(tPotConf.stdout)
+    composePath = f"{tPotPath}/etc/compose/{flavor.lower()}.yml"
+    composeText = connection.run(f"cat {composePath}", hide=True).stdout
+    composeText = createSensorCompose(composeText, profile, shipper)
+
+    putFile(connection, composeText, composePath)
+    logger.info(
+        f"Sensor {number}: Trimmed {flavor} compose file to"
+        f" {profile or 'all'} honeypots with {shipper}"
+    )
+
     # can add hide="stdout" as always but good to see real time output of
     # T-Pot installation
     connection.sudo(
@@ -65,16 +148,39 @@ def installTPot(number, connection, certDir):
     )
     logger.info(f"Sensor {number}: Installed T-Pot on sensor server")
 
-    dataPath = "/data/elk"
+    # the watchdog, latency report and capacity planner look sensors up by
+    # t-pot_hostname, which T-Pot records at boot (finishTPot reboots)
+    setTPotHostname(connection, connection.host)
+    logger.info(f"Sensor {number}: Set hostname to {tPotHostname(connection.host)}")
+
+
+def finishTPot(number, connection, certDir, shipperConf, shipper="logstash"):
+    """Copy shipper config and SSL certificate to a sensor server with T-Pot installed
+    (by installTPotBase) and reboot it to start shipping
+
+    :number: index of sensor in credentials.json (for logging purposes)
+    :connection: fabric.Connection object with connection to sensor server
+    :certDir: path to temporary directory containing SSL certificates
+    :shipperConf: text of the sensor's logstash.conf, or filebeat.yml with Filebeat
+    (as returned by configFuncs.renderShipperConf)
+    :shipper: optional, logstash or filebeat (see installTPotBase). Defaults to
+    logstash
+    :returns: None
+
+    """
+    dataPath = SENSOR_DATA_PATH
 
-    # copy custom logstash.conf into location where tpot.yml expects a docker volume
-    logstashPath = "configFiles/logstash.conf"
-    connection.put(logstashPath)
-    connection.sudo(f"mv {os.path.basename(logstashPath)} {dataPath}/", hide=True)
+    if shipper == "filebeat":
+        connection.sudo(f"mkdir -p {dataPath}/filebeat", hide=True)
+        putFile(connection, shipperConf, shipperConfPath(shipper))
+        logger.info(f"Sensor {number}: Copied filebeat.yml for central Logstash")
+    else:
+        # copy custom logstash.conf to where tpot.yml expects a docker volume
+        putFile(connection, shipperConf, shipperConfPath(shipper))
 
-    # copy SSL certificate over to sensor server
-    transferSSLCerts(connection, certDir, loggingServer=False, dataPath=dataPath)
-    logger.info(f"Sensor {number}: Copied SSL certificate from deployment server")
+        # copy SSL certificate over to sensor server
+        transferSSLCerts(connection, certDir, loggingServer=False, dataPath=dataPath)
+        logger.info(f"Sensor {number}: Copied SSL certificate from deployment server")
 
     # rebooting server always throws an exception, so ignore
     try:
@@ -83,67 +189,79 @@ def installTPot(number, connection, certDir):
         logger.info(f"Sensor {number}: Installed T-Pot and rebooted sensor server")
 
 
+def installTPot(
+    number, connection, certDir, shipperConf, shipper="logstash", profile=None
+):
+    """Install custom T-Pot Sensor type on connection server
+
+    :number: index of sensor in credentials.json (for logging purposes)
+    :connection: fabric.Connection object with connection to sensor server (4 GB RAM,
+    or 2 GB with Filebeat)
+    :certDir: path to temporary directory containing SSL certificates
+    :shipperConf: text of the sensor's logstash.conf, or filebeat.yml with Filebeat
+    (as returned by configFuncs.renderShipperConf)
+    :shipper: optional, logstash to parse events on the sensor or filebeat to ship
+    raw events to the central Logstash on the logging server. Defaults to logstash
+    :profile: optional, name of honeypot profile in configFiles/honeypotProfiles.json
+    choosing which honeypots to run. Defaults to every honeypot
+    :returns: None
+
+    """
+    installTPotBase(number, connection, shipper, profile)
+    finishTPot(number, connection, certDir, shipperConf, shipper)
+
+
 def installConfigureElasticsearch(
-    conn, elasticPath, elasticCertsPath, kibanaPath, kibanaCertsPath, localCertDir
+    conn,
+    elasticPath,
+    elasticCertsPath,
+    kibanaPath,
+    kibanaCertsPath,
+    localCertDir,
+    nodeObj,
+    loggingNodes,
+    dropletSize=LOGGER_SIZE,
+    privateNetwork=False,
 ):
-    """Install ELK stack and configure Elasticsearch on logging server
+    """Install ELK stack and configure Elasticsearch on a logging node
 
-    :conn: fabric.Connection object with connection to logging server (8 GB RAM)
+    :conn: fabric.Connection object with connection to logging node (8 GB RAM)
     :elasticPath: path to elasticsearch configuration directory
     :elasticCertsPath: path to elasticsearch SSL certificate directory
-    :kibanaPath: path to kibana configuration directory
+    :kibanaPath: path to kibana configuration directory. None to skip installing
+    kibana (on every logging node but the logging server itself)
     :kibanaCertsPath: path to kibana SSL certificate directory
     :localCertDir: path to temporary directory containing SSL certificates
+    :nodeObj: JSON object representing logging node from credentials.json
+    :loggingNodes: list of JSON objects representing all logging nodes
+    :dropletSize: optional, size slug of logging node droplet used to size the JVM
+    heap (as returned by vmManagement.hostSize). Defaults to vmManagement.LOGGER_SIZE
+    :privateNetwork: optional, whether logging nodes talk to each other over the
+    VPC. Defaults to False
     :returns: None
 
     """
+    label = "Logger" if kibanaPath is not None else f"Logger node {conn.host}"
+
     elkDeps = ["gnupg", "apt-transport-https"]
     installPackages(conn, elkDeps)
 
     # copy vimrc over for convenience
-    vimrcPath = "configFiles/.vimrc"
+    vimrcPath = f"{CONFIG_DIR}/.vimrc"
     conn.put(vimrcPath)
     conn.sudo(f"cp {os.path.basename(vimrcPath)} /root/", hide=True)
 
-    logger.info("Logger: Updated packages and installed ELK dependencies")
+    logger.info(f"{label}: Updated packages and installed ELK dependencies")
 
-    # download public signing keys
-    artifactsKey = "elasticsearchArtifactsKey"
-    packagesKey = "elasticsearchPackagesKey"
-    conn.run(
-        "wget -qO - https://artifacts.elastic.co/GPG-KEY-elasticsearch"
-        f" > {artifactsKey}",
-        hide="stdout",
-    )
-    conn.run(
-        "wget -qO - https://packages.elastic.co/GPG-KEY-elasticsearch"
-        f" > {packagesKey}",
-        hide="stdout",
-    )
-    # install public signing keys
-    # this gives
-    # "Warning: apt-key output should not be parsed (stdout is not a terminal)"
-    # can add pty=True to suppress it, but should find a fundamentally better way
-    conn.sudo(f"apt-key add {artifactsKey}", pty=True, hide=True)
-    conn.sudo(f"apt-key add {packagesKey}", pty=True, hide=True)
-    conn.run(f"rm {artifactsKey} {packagesKey}", hide="stdout")
-
-    # save repository definitions
-    conn.run(
-        'echo "deb https://artifacts.elastic.co/packages/7.x/apt stable main"'
-        " > elastic-7.x.list",
-        hide="stdout",
-    )
-    conn.run(
-        'echo "deb [arch=amd64] https://packages.elastic.co/curator/5/debian9 stable'
-        ' main" >> elastic-7.x.list',
-        hide="stdout",
-    )
-    conn.sudo("mv elastic-7.x.list /etc/apt/sources.list.d/", hide=True)
+    addElasticRepository(conn)
+
+    elkStack = ["elasticsearch"]
+
+    if kibanaPath is not None:
+        elkStack.append("kibana")
 
-    elkStack = ["elasticsearch", "kibana", "elasticsearch-curator"]
     installPackages(conn, elkStack)
-    logger.info("Logger: Installed elasticsearch, kibana, and elasticsearch-curator")
+    logger.info(f"{label}: Installed {' and '.join(elkStack)}")
 
     # transfer SSL certificates to loging server and put them in elasticsearch
     # and kibana config directories
@@ -157,33 +275,30 @@ def installConfigureElasticsearch(
         kibanaCertsPath=kibanaCertsPath,
     )
 
-    logger.info(
-        "Logger: Transferred SSL certificates to"
-        f" {elasticCertsPath} and {kibanaCertsPath}"
-    )
+    logger.info(f"{label}: Transferred SSL certificates to {elasticCertsPath}")
 
-    ymlConfigPath = createElasticsearchYml(
-        f"{elasticCertsPath}/privkey.pem",
-        f"{elasticCertsPath}/cert.pem",
-        f"{elasticCertsPath}/fullchain.pem",
-    )
+    elasticYml = renderElasticsearchYml(nodeObj, loggingNodes, privateNetwork)
 
     # overwrite elasticsearch.yml in config directory
-    conn.put(ymlConfigPath)
-    conn.sudo(f"mv elasticsearch.yml {elasticPath}/elasticsearch.yml", hide=True)
-    logger.info(f"Logger: Edited {elasticPath}/elasticsearch.yml")
+    putFile(conn, elasticYml, f"{elasticPath}/elasticsearch.yml")
+    logger.info(f"{label}: Edited {elasticPath}/elasticsearch.yml")
+
+    # size heap, lock memory, raise limits and disable swap before first start
+    applyHostTuning(conn, createHostTuningProfile(dropletSize))
+    logger.info(f"{label}: Applied host tuning profile for {dropletSize} droplet")
 
     conn.sudo("systemctl start elasticsearch.service", hide=True)
-    logger.info("Logger: Started elasticsearch service with systemd")
+    logger.info(f"{label}: Started elasticsearch service with systemd")
 
 
-def configureKibana(conn, kibanaPath, kibanaCertsPath):
+def configureKibana(conn, kibanaPath, workspace="."):
     """Configure Kibana on logging server to connect it with Elasticsearch (must be run
     after installConfigureElasticsearch function)
 
     :conn: fabric.Connection object with connection to logging server (8 GB RAM)
     :kibanaPath: path to kibana configuration directory
-    :kibanaCertsPath: path to kibana SSL certificate directory
+    :workspace: optional, path to workspace directory of the network, where
+    passwords.txt gets written. Defaults to the current directory
     :returns: password for elastic user, useful to make subsequent API calls
 
     """
@@ -198,7 +313,7 @@ def configureKibana(conn, kibanaPath, kibanaCertsPath):
         pty=True,
         watchers=[pwdSetupYes],
     )
-    pwdFile = "passwords.txt"
+    pwdFile = os.path.join(workspace, "passwords.txt")
     logger.info(f"Logger: Generated ELK passwords, writing them to {pwdFile}")
 
     pwdRes = autoPasswords.stdout.strip()
@@ -209,21 +324,10 @@ def configureKibana(conn, kibanaPath, kibanaCertsPath):
     kibanaPass = findPassword(pwdRes, "kibana_system")
     elasticPass = findPassword(pwdRes, "elastic")
 
-    # set up elasticsearch-curator to delete old logstash indices
-    curatorPath = "/opt/elasticsearch-curator/"
-    setupCurator(conn, curatorPath, elasticPass)
-    logger.info("Logger: Set up elasticsearch-curator to delete old indices")
-
-    ymlConfigPath = createKibanaYml(
-        conn.host,
-        kibanaPass,
-        f"{kibanaCertsPath}/privkey.pem",
-        f"{kibanaCertsPath}/fullchain.pem",
-    )
+    kibanaYml = renderKibanaYml(conn.host, kibanaPass)
 
     # overwrite kibana.yml in config directory
-    conn.put(ymlConfigPath)
-    conn.sudo(f"mv kibana.yml {kibanaPath}/kibana.yml", hide=True)
+    putFile(conn, kibanaYml, f"{kibanaPath}/kibana.yml")
     logger.info(f"Logger: Edited {kibanaPath}/kibana.yml")
 
     conn.sudo("systemctl restart elasticsearch.service", hide=True)
@@ -233,37 +337,94 @@ def configureKibana(conn, kibanaPath, kibanaCertsPath):
     return elasticPass
 
 
-def configureLoggingServer(connection, localCertDir):
-    """Completely set up logging server for it to be ready to receive honeypot data
-    from sensor servers
-
-    :connection: fabric.Connection object with connection to logging server (8 GB RAM)
+def setupLoggingCluster(
+    connections,
+    loggingNodes,
+    localCertDir,
+    retention=None,
+    centralEnrichment=False,
+    centralLogstash=False,
+    vpcRange=None,
+    workspace=".",
+):
+    """Set up logging server and any other logging nodes for them to be ready to
+    receive honeypot data from sensor servers (Kibana objects come after, see
+    setupKibanaObjects)
+
+    :connections: list of fabric.Connection objects with connections to logging nodes
+    (8 GB RAM), logging server first
+    :loggingNodes: list of JSON objects representing logging nodes, in the same order
+    as connections (as returned by utils.getLoggingNodes)
     :localCertDir: path to temporary directory containing SSL certificates
-    :returns: None
+    :retention: optional, index lifecycle settings from credentials.json (see
+    deploymentHelpers.createDataStreamTemplates)
+    :centralEnrichment: optional, whether to add GeoIP/ASN info with an ingest
+    pipeline on the logging server instead of on every sensor. Defaults to False
+    :centralLogstash: optional, whether to run Logstash on the logging server to
+    parse raw events from Filebeat sensors and relays. Defaults to False
+    :vpcRange: optional, private IP range of the network's VPC (as returned by
+    vmManagement.createAllVMs). If given, sensors ship to the logging nodes' private
+    addresses and the Elasticsearch/Logstash ports get closed to the public
+    :workspace: optional, path to workspace directory of the network, holding
+    passwords.txt. Defaults to the current directory
+    :returns: tuple of the form (elastic user password, t_pot_internal user password,
+    list of honeypot data stream names, list of summary index names)
 
     """
 
-    elasticPath = "/etc/elasticsearch"
+    elasticPath = ELASTIC_PATH
     elasticCertsPath = f"{elasticPath}/certs"
-    kibanaPath = "/etc/kibana"
+    kibanaPath = KIBANA_PATH
     kibanaCertsPath = f"{kibanaPath}/certs"
 
-    installConfigureElasticsearch(
-        connection,
-        elasticPath,
-        elasticCertsPath,
-        kibanaPath,
-        kibanaCertsPath,
-        localCertDir,
-    )
+    # only the logging server itself runs kibana and receives API requests
+    connection = connections[0]
+
+    for conn, nodeObj in zip(connections, loggingNodes):
+        isLoggingServer = conn is connection
+
+        installConfigureElasticsearch(
+            conn,
+            elasticPath,
+            elasticCertsPath,
+            kibanaPath if isLoggingServer else None,
+            kibanaCertsPath if isLoggingServer else None,
+            localCertDir,
+            nodeObj,
+            loggingNodes,
+            hostSize(nodeObj, loggingNode=True),
+            vpcRange is not None,
+        )
 
     # block until elasticsearch service (port 64298) is ready
     waitForService(connection.host, 64298)
 
-    elasticPass = configureKibana(connection, kibanaPath, kibanaCertsPath)
+    elasticPass = configureKibana(connection, kibanaPath, workspace)
 
     waitForService(connection.host, 64298)
 
+    try:
+        waitForClusterNodes(
+            f"{connection.host}:64298", "elastic", elasticPass, len(loggingNodes)
+        )
+    except BadAPIRequestError:
+        time.sleep(10)
+
+        waitForClusterNodes(
+            f"{connection.host}:64298", "elastic", elasticPass, len(loggingNodes)
+        )
+
+    logger.info(f"Logger: All {len(loggingNodes)} logging nodes joined the cluster")
+
+    try:
+        checkHostTuning(f"{connection.host}:64298", "elastic", elasticPass)
+    except BadAPIRequestError:
+        time.sleep(10)
+
+        checkHostTuning(f"{connection.host}:64298", "elastic", elasticPass)
+
+    logger.info("Logger: Checked that memory lock and file descriptor limits applied")
+
     try:
         # making an API call too early causes an error, hence catching it and waiting
         tPotUser, tPotPass = createTPotUser(
@@ -280,40 +441,160 @@ def configureLoggingServer(connection, localCertDir):
         f"Logger: Created {tPotUser} Elasticsearch user with corresponding role"
     )
 
-    # logstash.conf later gets copied over to each sensor server
-    createLogstashConf(connection.host, "/data/elk/fullchain.pem", tPotUser, tPotPass)
+    # each honeypot type gets its own data stream, rolled over and deleted by its
+    # own ILM policy instead of curator running from cron
+    dataStreams = createDataStreamTemplates(
+        f"{connection.host}:64298", "elastic", elasticPass, retention
+    )
+    logger.info(
+        f"Logger: Created index templates and ILM policies for {len(dataStreams)}"
+        " honeypot data streams"
+    )
+
+    # per-minute counts for dashboards, instead of aggregating days of raw events
+    summaryIndices = createSummaryTransforms(
+        f"{connection.host}:64298", "elastic", elasticPass, retention
+    )
+    logger.info(f"Logger: Started transforms into {', '.join(summaryIndices)}")
+
+    ingestPipeline = None
+
+    if centralEnrichment:
+        # one shared GeoIP/ASN cache on the logging tier instead of one per sensor
+        ingestPipeline = createEnrichPipeline(
+            f"{connection.host}:64298", "elastic", elasticPass
+        )
+        logger.info(f"Logger: Created {ingestPipeline} GeoIP/ASN ingest pipeline")
+
+    if centralLogstash:
+        # Filebeat sensors ship raw lines, parsed here with the same filters
+        # private names resolve to VPC addresses, and the certificate covers them too
+        centralConf = renderCentralLogstashConf(
+            loggingNodes, tPotPass, ingestPipeline is not None, vpcRange is not None
+        )
+        setupCentralLogstash(connection, centralConf, elasticCertsPath)
+        logger.info("Logger: Installed central Logstash for Filebeat sensors")
 
     # add password for t_pot_internal user (which sensor servers use to send data)
-    with open("passwords.txt", "a") as f:
+    with open(os.path.join(workspace, "passwords.txt"), "a") as f:
         f.write(
             f"\n\nChanged password for user {tPotUser}"
             f"\nPASSWORD {tPotUser} = {tPotPass}\n"
         )
 
+    if vpcRange is not None:
+        # the deployment server still makes API requests over the public network
+        deploymentIp = connection.run("echo $SSH_CLIENT", hide=True).stdout.split()[0]
+        privatePorts = [64298, 9300] + ([5044] if centralLogstash else [])
+
+        for conn in connections:
+            restrictPorts(conn, privatePorts, [vpcRange, deploymentIp])
+
+        logger.info(
+            f"Logger: Closed ports {', '.join(map(str, privatePorts))} to everything"
+            f" but {vpcRange} and {deploymentIp}"
+        )
+
+    return elasticPass, tPotPass, dataStreams, summaryIndices
+
+
+def checkFieldAllowlist():
+    """Check that configFiles/fieldAllowlist.json keeps every field T-Pot's Kibana
+    saved objects use for the events of each honeypot type
+
+    :returns: None
+    :raises UncoveredFieldsError: if sensors would prune a field a dashboard uses
+
+    """
+    # sensors drop every field the Kibana dashboards don't use before shipping
+    uncoveredFields = findUncoveredFields(
+        findSavedObjectFields(downloadKibanaObjects()), loadFieldAllowlist()
+    )
+
+    if uncoveredFields:
+        raise UncoveredFieldsError(
+            "Kibana saved objects use fields missing from"
+            " configFiles/fieldAllowlist.json: "
+            + "; ".join(
+                f"{honeypotType or 'any type'}: {', '.join(fields)}"
+                for honeypotType, fields in sorted(
+                    uncoveredFields.items(), key=lambda item: item[0] or ""
+                )
+            )
+        )
+
+
+def setupKibanaObjects(connection, elasticPass, dataStreams, summaryIndices):
+    """Import T-Pot's dashboards, per-type index patterns and the summary dashboard
+    into Kibana on the logging server (set up by setupLoggingCluster)
+
+    :connection: fabric.Connection object with connection to logging server
+    :elasticPass: password of elastic user
+    :dataStreams: list of honeypot data stream names
+    :summaryIndices: list of summary index names
+    :returns: None
+
+    """
+    # T-Pot's dashboards all use one index pattern, which now spans every data stream
+    kibanaObjects = replaceIndexPatternTitle(
+        downloadKibanaObjects(), "logstash-*", "tpot-*"
+    )
+    # Kibana index patterns can't filter documents, so hide canary events (see
+    # canaryProbe.py) in every dashboard, visualization and saved search using them
+    kibanaObjects = addSearchFilter(
+        kibanaObjects, EXCLUDE_CANARY_QUERY, "Hide canary events"
+    )
+
     # block until kibana service (port 5601) is ready
     waitForService(connection.host, 5601)
 
     # convenience function to copy nice honeypot attack visualizations to kibana
     # dashboard. Uses an experimental ELK API, so just comment out if it breaks in
     # the future
-    importKibanaObjects(f"{connection.host}:5601", "elastic", elasticPass)
+    if importKibanaObjects(
+        f"{connection.host}:5601",
+        "elastic",
+        elasticPass,
+        kibanaObjects,
+        elasticHostPort=f"{connection.host}:64298",
+    ):
+        logger.info(
+            "Logger: Imported custom objects into Kibana dashboard and turned on dark"
+            " mode"
+        )
+    else:
+        logger.info("Logger: Kibana already has these custom objects, skipped import")
 
-    logger.info(
-        "Logger: Imported custom objects into Kibana dashboard and turned on dark mode"
+    # per-type index patterns only search the data stream of their honeypot type
+    createIndexPatterns(f"{connection.host}:5601", "elastic", elasticPass, dataStreams)
+    logger.info("Logger: Created one Kibana index pattern per honeypot data stream")
+
+    createIndexPatterns(
+        f"{connection.host}:5601", "elastic", elasticPass, summaryIndices
     )
+    importKibanaObjects(
+        f"{connection.host}:5601",
+        "elastic",
+        elasticPass,
+        createSummaryDashboardObjects(*summaryIndices),
+        "tpot_summary",
+        f"{connection.host}:64298",
+    )
+    logger.info("Logger: Imported T-Pot Summary dashboard reading from transforms")
 
 
-def createAllSudoUsers(sensorObjects, sudoUser, loggingObject=None):
+def createAllSudoUsers(sensorObjects, sudoUser, loggingObjects=None):
     """Create non-root sudo users on all servers in network
 
     :sensorObjects: list of sensor server dictionaries from credentials.json
     :sudoUser: Name of non-root sudo user to create on all servers
-    :loggingObject: optional, logging server dictionary from credentials.json
+    :loggingObjects: optional, list of logging node dictionaries (as returned by
+    utils.getLoggingNodes)
     :returns: None
 
     """
     objsList = (
-        [loggingObject] + sensorObjects if loggingObject is not None else sensorObjects
+        loggingObjects + sensorObjects if loggingObjects is not None else sensorObjects
     )
 
     for creds in objsList:
@@ -325,103 +606,483 @@ def createAllSudoUsers(sensorObjects, sudoUser, loggingObject=None):
         logger.info(f"Created non-root sudo user {sudoUser}@{host}")
 
 
-def deployNetwork(
-    loggingServer=True, credsFile="credentials.json", DOApiKeyFile="digitalocean.ini"
-):
-    """Set up entire distributed T-Pot network with logging and sensor servers
+def warnUnrelayedSensors(sensorObjs, relayObjs):
+    """Warn about Filebeat sensors without a region, which ship straight to the
+    logging server even though the network has relays (see utils.findRelay)
 
-    :loggingServer: optional, whether to set up central logging server. Defaults to
-    True. Set to False if you already have deployed a logging server and want to
-    only add sensor server(s)
-    :credsFile: optional, path to credentials JSON file. Defaults to credentials.json
-    :DOApiKeyFile: optional, path to file containing DigitalOcean API key. Defaults to
-    digitalocean.ini
+    :sensorObjs: array of JSON objects representing sensor servers
+    :relayObjs: array of JSON objects representing regional relays
     :returns: None
 
     """
-    try:
-        # get server credentials from credentials file
-        with open(credsFile) as f:
-            credentials = json.load(f)
-            deploymentCreds = credentials["deployment"]
-            logCreds = credentials["logging"]
-            sensorCreds = credentials["sensors"]
-            tPotSudoUser = credentials["sudouser"]
-    except FileNotFoundError:
-        raise NoCredentialsFileError(
-            f"{credsFile} not found. Did you copy credentials.json.template?"
-        )
-
-    # get DigitalOcean API key
-    with open(DOApiKeyFile) as f:
-        apiKey = f.read().strip().split()[-1]
-
-    deploymentConf = InvokeConfig()
-    deploymentConf.sudo.password = deploymentCreds["sudopass"]
-    deploymentConn = Context(config=deploymentConf)
+    if not relayObjs:
+        return
 
-    # generate SSH keys to log into network servers
-    deploymentConn.run(
-        "ssh-keygen -f ~/.ssh/id_rsa -t rsa -b 4096 -N ''", hide="stdout"
-    )
-    logger.info("Deployment: generated SSH keys for network servers")
-    sshKey = deploymentConn.run("cat ~/.ssh/id_rsa.pub", hide="stdout").stdout.strip()
-    # create all network servers specified in credentials.json
-    createAllVMs(apiKey, logCreds, sensorCreds, sshKey)
-    logger.info("Deployment: Created all network servers through DigitalOcean API")
-
-    tempCertPath = generateSSLCerts(
-        deploymentConn,
-        deploymentCreds["email"],
-        logCreds["host"],
-        f"{os.getcwd()}/{DOApiKeyFile}",
-    )
-    logger.info(
-        "Deployment: Created Let's Encrypt SSL certificates and made temporary"
-        f" SSL certificate directory {tempCertPath}"
-    )
+    for sensor in sensorObjs:
+        if usesFilebeat(sensor) and sensor.get("region") is None:
+            logger.warning(
+                f"{sensor['host']} has no region, so it ships straight to the logging"
+                " server instead of through a relay"
+            )
 
-    sudoUser = deploymentConn.run("whoami", hide="stdout").stdout.strip()
-    certsWrapperPath = createUpdateCertsSh(os.getcwd(), sudoUser)
-    renewHookPath = "/etc/letsencrypt/renewal-hooks/deploy/updateCerts.sh"
-    deploymentConn.sudo(f"cp {certsWrapperPath} {renewHookPath}", hide=True)
-    deploymentConn.sudo(f"chmod u+x {renewHookPath}", hide=True)
-    logger.info(f"Deployment: Added custom SSL renewal script to {renewHookPath}")
 
-    if loggingServer:
-        createAllSudoUsers(sensorCreds, tPotSudoUser, logCreds)
-    else:
-        createAllSudoUsers(sensorCreds, tPotSudoUser)
+def deploySensors(sensorObjs, logCreds, relayObjs, sudoUser, certDir, workspace="."):
+    """Install T-Pot on sensor servers with the shipper config of each
 
-    logConn = Connection(
-        host=logCreds["host"],
-        user=tPotSudoUser,
-        config=Config(overrides={"sudo": {"password": logCreds["sudopass"]}}),
-    )
+    :sensorObjs: array of JSON objects representing sensor servers
+    :logCreds: JSON object representing logging server (logging in credentials.json)
+    :relayObjs: array of JSON objects representing regional relays
+    :sudoUser: name of non-root sudo user (sudouser in credentials.json)
+    :certDir: path to temporary directory containing SSL certificates
+    :workspace: optional, path to workspace directory of the network, holding
+    passwords.txt. Defaults to the current directory
+    :returns: None
 
-    if loggingServer:
-        # set up central logging server
-        configureLoggingServer(logConn, tempCertPath)
+    """
+    warnUnrelayedSensors(sensorObjs, relayObjs)
 
-    logConn.close()
+    # sensors index as the user setupLoggingCluster added to passwords.txt
+    with open(os.path.join(workspace, "passwords.txt")) as f:
+        tPotPass = findPassword(f.read(), TPOT_USER)
 
-    # set up all sensor servers (make this async?)
-    for index, sensor in enumerate(sensorCreds):
+    for index, sensor in enumerate(sensorObjs):
         sensorConn = Connection(
             host=sensor["host"],
-            user=tPotSudoUser,
+            user=sudoUser,
             config=Config(overrides={"sudo": {"password": sensor["sudopass"]}}),
         )
-        installTPot(index + 1, sensorConn, tempCertPath)
 
+        installTPot(
+            index + 1,
+            sensorConn,
+            certDir,
+            renderShipperConf(sensor, logCreds, relayObjs, tPotPass),
+            sensor.get("shipper", "logstash"),
+            sensor.get("profile"),
+        )
+
+        sensorConn.close()
+
+
+def waitForCanaries(sensorObjs, logCreds, sudoUser, timeout=1800, workspace="."):
+    """Wait until a canary event of every sensor is searchable (see canaryProbe.py)
+
+    :sensorObjs: array of JSON objects representing sensor servers
+    :logCreds: JSON object representing logging server (logging in credentials.json)
+    :sudoUser: name of non-root sudo user (sudouser in credentials.json)
+    :timeout: optional, seconds to wait for each sensor, which may still be
+    rebooting after installTPot. Defaults to 1800
+    :workspace: optional, path to workspace directory of the network, holding
+    passwords.txt and canary.jsonl. Defaults to the current directory
+    :returns: None
+
+    """
+    with open(os.path.join(workspace, "passwords.txt")) as f:
+        elasticPass = findPassword(f.read(), "elastic")
+
+    sensorConns = [connectHost(sensor, "sensor", sudoUser) for sensor in sensorObjs]
+    canaryResults = probeFleet(
+        sensorConns,
+        sensorObjs,
+        f"{logCreds['host']}:64298",
+        "elastic",
+        elasticPass,
+        timeout,
+        os.path.join(workspace, CANARY_LOG),
+    )
+
+    for sensorConn in sensorConns:
         sensorConn.close()
 
-    # should probably chmod the whole directory since passwords are everywhere TODO
-    deploymentConn.run("chmod 600 passwords.txt credentials.json")
-    # remove temporarily copied SSL certs from generateSSLCerts
-    deploymentConn.run(f"rm -rf {tempCertPath}", hide="stdout")
-    logger.info(f"Removed temporary SSL certificate directory {tempCertPath}")
+    failedCanaries = [result for result in canaryResults if "error" in result]
+
+    for result in canaryResults:
+        if "error" not in result:
+            logger.info(
+                f"Sensor {result['host']}: Canary event searchable after"
+                f" {result['searchableMs']} ms"
+            )
+
+    if failedCanaries:
+        raise CanaryTimeoutError(
+            "Canary events of sensors not searchable: "
+            + ", ".join(f"{res['host']} ({res['error']})" for res in failedCanaries)
+        )
+
+
+def deployNetwork(workspace=".", loggingServer=True):
+    """Set up entire distributed T-Pot network with logging and sensor servers
+
+    :workspace: optional, path to workspace directory of the network, holding its
+    credentials.json and digitalocean.ini and everything the deployment generates
+    (passwords.txt, deployment.log, ...). Defaults to the current directory
+    :loggingServer: optional, whether to set up central logging server. Defaults to
+    True. Set to False if you already have deployed a logging server and want to
+    only add sensor server(s)
+    :returns: None
+
+    """
+    # cron jobs and the renewal hook run from other directories
+    workspace = os.path.abspath(workspace)
+    credsFile = os.path.join(workspace, "credentials.json")
+    DOApiKeyFile = os.path.join(workspace, "digitalocean.ini")
+    with logToWorkspace(workspace):
+
+        try:
+            # get server credentials from credentials file
+            with open(credsFile) as f:
+                credentials = json.load(f)
+                deploymentCreds = credentials["deployment"]
+                logCreds = credentials["logging"]
+                sensorCreds = credentials["sensors"]
+                relayCreds = credentials.get("relays", [])
+                tPotSudoUser = credentials["sudouser"]
+        except FileNotFoundError:
+            raise NoCredentialsFileError(
+                f"{credsFile} not found. Did you copy credentials.json.template?"
+            )
+
+        # get DigitalOcean API key
+        with open(DOApiKeyFile) as f:
+            apiKey = f.read().strip().split()[-1]
+
+        loggingNodes = getLoggingNodes(logCreds)
+        # raises before creating any droplet if no node could index the sensors' events
+        getIngestHosts(loggingNodes)
+
+        # fail before creating any droplet rather than ship events missing fields
+        if loggingServer:
+            checkFieldAllowlist()
+            logger.info("Deployment: Field allowlist keeps every field Kibana uses")
+
+        deploymentConf = InvokeConfig()
+        deploymentConf.sudo.password = deploymentCreds["sudopass"]
+        deploymentConn = Context(config=deploymentConf)
+
+        certHosts = [node["host"] for node in loggingNodes]
+
+        # sensors validate the certificate against the logging nodes' private names
+        if logCreds.get("vpc", False):
+            certHosts += [privateHost(host) for host in certHosts]
+
+        # relays' beats inputs use the same certificate
+        certHosts += [relay["host"] for relay in relayCreds]
+
+        # Filebeat sensors and relays ship to the central Logstash on the logging server
+        logstashHost = centralLogstashHost(logCreds)
+        warnUnrelayedSensors(sensorCreds, relayCreds)
+
+        def connectSudoUser(hostObj):
+            return Connection(
+                host=hostObj["host"],
+                user=tPotSudoUser,
+                config=Config(overrides={"sudo": {"password": hostObj["sudopass"]}}),
+            )
+
+        def generateSSHKey(values):
+            # generate SSH keys to log into network servers, shared by every network
+            # deployed from this server. Networks deployed side by side check for the
+            # key under the same lock, so only one of them generates it
+            keygenResult = deploymentConn.run(
+                "mkdir -p -m 700 ~/.ssh && flock ~/.ssh/id_rsa.lock sh -c 'test -f"
+                " ~/.ssh/id_rsa || (ssh-keygen -f ~/.ssh/id_rsa -t rsa -b 4096"
+                " -N \"\" -q && echo generated)'",
+                hide=True,
+            )
+
+            if keygenResult.stdout.strip() == "generated":
+                logger.info("Deployment: generated SSH keys for network servers")
+
+            return {
+                "sshKey": deploymentConn.run(
+                    "cat ~/.ssh/id_rsa.pub", hide="stdout"
+                ).stdout.strip()
+            }
+
+        def createDroplets(values):
+            # create all network servers specified in credentials.json
+            vpcRange = createAllVMs(
+                apiKey,
+                logCreds,
+                sensorCreds,
+                values["sshKey"],
+                logCreds.get("vpc", False),
+                relayCreds,
+            )
+            logger.info(
+                "Deployment: Created all network servers through DigitalOcean API"
+            )
+
+            return {"vpcRange": vpcRange}
+
+        def getCerts(values):
+            # DNS-01 challenges only need the domain, so certbot runs while droplets
+            # boot
+            certDir, certIssued = generateSSLCerts(
+                deploymentConn,
+                deploymentCreds["email"],
+                certHosts,
+                DOApiKeyFile,
+                os.path.join(workspace, "certs"),
+            )
+            logger.info(
+                "Deployment: "
+                + (
+                    "Created Let's Encrypt SSL certificates"
+                    if certIssued
+                    else "Reused valid Let's Encrypt SSL certificates"
+                )
+                + f" and made temporary SSL certificate directory {certDir}"
+            )
+
+            return {"certDir": certDir}
+
+        def addRenewalHook(values):
+            sudoUser = deploymentConn.run("whoami", hide="stdout").stdout.strip()
+            certsWrapper = createUpdateCertsSh(
+                PROJECT_DIR, sudoUser, workspace, logCreds["host"]
+            )
+            # one hook per network, each only acting on the renewal of its
+            # certificate
+            renewHookPath = (
+                "/etc/letsencrypt/renewal-hooks/deploy/"
+                f"updateCerts-{logCreds['host']}.sh"
+            )
+            # base64 keeps the script's quotes and $ intact through the shell
+            certsWrapperB64 = base64.b64encode(certsWrapper.encode()).decode()
+            deploymentConn.sudo(
+                f"sh -c 'echo {certsWrapperB64} | base64 -d > {renewHookPath}'",
+                hide=True,
+            )
+            deploymentConn.sudo(f"chmod u+x {renewHookPath}", hide=True)
+            logger.info(
+                f"Deployment: Added custom SSL renewal script to {renewHookPath}"
+            )
+
+        def sudoUserStep(hostObj):
+            def addSudoUser(values):
+                createAllSudoUsers([hostObj], tPotSudoUser)
+
+                return {f"sudoUser:{hostObj['host']}": tPotSudoUser}
+
+            return createStep(
+                f"sudo user {hostObj['host']}",
+                addSudoUser,
+                ["vpcRange"],
+                [f"sudoUser:{hostObj['host']}"],
+            )
+
+        def setupLogging(values):
+            logConns = [connectSudoUser(node) for node in loggingNodes]
+
+            # set up central logging server
+            elasticPass, tPotPass, dataStreams, summaryIndices = setupLoggingCluster(
+                logConns,
+                loggingNodes,
+                values["certDir"],
+                logCreds.get("retention"),
+                logCreds.get("centralEnrichment", False),
+                bool(relayCreds) or any(usesFilebeat(sensor) for sensor in sensorCreds),
+                values["vpcRange"],
+                workspace,
+            )
+
+            for logConn in logConns:
+                logConn.close()
+
+            return {
+                "elasticPass": elasticPass,
+                "tPotPass": tPotPass,
+                "dataStreams": dataStreams,
+                "summaryIndices": summaryIndices,
+            }
+
+        def readPasswords(values):
+            # the logging server of an earlier deployment added its users to
+            # passwords.txt
+            with open(os.path.join(workspace, "passwords.txt")) as f:
+                passwordText = f.read()
+
+            return {
+                "elasticPass": findPassword(passwordText, "elastic"),
+                "tPotPass": findPassword(passwordText, TPOT_USER),
+            }
+
+        def addRetentionCron(values):
+            # delete oldest indices whenever disk usage goes over target percentage
+            addCronJob(deploymentConn, "*/10 * * * *", "retentionManager.py", workspace)
+            logger.info("Deployment: Added cron job running retentionManager.py")
+
+        def importKibana(values):
+            logConn = connectSudoUser(logCreds)
+            setupKibanaObjects(
+                logConn,
+                values["elasticPass"],
+                values["dataStreams"],
+                values["summaryIndices"],
+            )
+            logConn.close()
+
+        def relayStep(relay):
+            def installRelay(values):
+                relayConn = connectSudoUser(relay)
+                relayConf = renderRelayConf(logstashHost)
+                setupRelay(relayConn, relayConf, values["certDir"])
+                logger.info(
+                    f"Relay {relay['host']}: Installed Logstash forwarding to logger"
+                )
+
+                relayConn.close()
+
+                return {f"relay:{relay['host']}": True}
+
+            return createStep(
+                f"relay {relay['host']}",
+                installRelay,
+                ["certDir", f"sudoUser:{relay['host']}"],
+                [f"relay:{relay['host']}"],
+            )
+
+        def sensorSteps(number, sensor):
+            host = sensor["host"]
+            shipper = sensor.get("shipper", "logstash")
+
+            # T-Pot installs while the logging server is still being set up, only the
+            # shipper config needs its password
+            def installBase(values):
+                sensorConn = connectSudoUser(sensor)
+                installTPotBase(number, sensorConn, shipper, sensor.get("profile"))
+                sensorConn.close()
+
+                return {f"tpotBase:{host}": True}
+
+            def finish(values):
+                sensorConn = connectSudoUser(sensor)
+                finishTPot(
+                    number,
+                    sensorConn,
+                    values["certDir"],
+                    renderShipperConf(sensor, logCreds, relayCreds, values["tPotPass"]),
+                    shipper,
+                )
+                sensorConn.close()
+
+                return {f"sensor:{host}": True}
+
+            return [
+                createStep(
+                    f"T-Pot install {host}",
+                    installBase,
+                    [f"sudoUser:{host}"],
+                    [f"tpotBase:{host}"],
+                ),
+                createStep(
+                    f"T-Pot shipper {host}",
+                    finish,
+                    [f"tpotBase:{host}", "certDir", "tPotPass"],
+                    [f"sensor:{host}"],
+                ),
+            ]
+
+        def gateAndMonitor(values):
+            # gate: every sensor's events must reach Elasticsearch, waiting out the
+            # reboots
+            waitForCanaries(sensorCreds, logCreds, tPotSudoUser, workspace=workspace)
+
+            # keep probing every sensor, see
+            # `python3 canaryProbe.py <workspace> --report`
+            addCronJob(deploymentConn, "*/15 * * * *", "canaryProbe.py", workspace)
+            logger.info("Deployment: Added cron job running canaryProbe.py")
+
+            # flag (and optionally restart) sensors whose events stop reaching
+            # Elasticsearch
+            addCronJob(deploymentConn, "*/5 * * * *", "shippingWatchdog.py", workspace)
+            logger.info("Deployment: Added cron job running shippingWatchdog.py")
+
+        # every step starts as soon as the values it needs exist, e.g. certbot runs
+        # while droplets boot and T-Pot installs while the logging cluster comes up
+        steps = [
+            createStep("SSH key", generateSSHKey, outputs=["sshKey"]),
+            createStep("droplets", createDroplets, ["sshKey"], ["vpcRange"]),
+            createStep("SSL certificates", getCerts, outputs=["certDir"]),
+            createStep("renewal hook", addRenewalHook, ["certDir"]),
+        ]
+        steps += [sudoUserStep(hostObj) for hostObj in sensorCreds + relayCreds]
+
+        if loggingServer:
+            steps += [sudoUserStep(node) for node in loggingNodes]
+            steps += [
+                createStep(
+                    "logging cluster",
+                    setupLogging,
+                    ["certDir", "vpcRange"]
+                    + [f"sudoUser:{node['host']}" for node in loggingNodes],
+                    ["elasticPass", "tPotPass", "dataStreams", "summaryIndices"],
+                ),
+                createStep("retention cron job", addRetentionCron, ["elasticPass"]),
+                createStep(
+                    "Kibana objects",
+                    importKibana,
+                    ["elasticPass", "dataStreams", "summaryIndices"],
+                ),
+            ]
+        else:
+            steps.append(
+                createStep(
+                    "passwords", readPasswords, outputs=["elasticPass", "tPotPass"]
+                )
+            )
+
+        steps += [relayStep(relay) for relay in relayCreds]
+
+        for index, sensor in enumerate(sensorCreds):
+            steps += sensorSteps(index + 1, sensor)
+
+        steps.append(
+            createStep(
+                "canaries",
+                gateAndMonitor,
+                ["elasticPass"]
+                + [f"sensor:{sensor['host']}" for sensor in sensorCreds]
+                + [f"relay:{relay['host']}" for relay in relayCreds],
+            )
+        )
+
+        values, timings = {}, {}
+
+        try:
+            # several steps per sensor, so large fleets would open a thread and SSH
+            # session for each at once
+            values, timings = runSteps(steps, workers=min(len(steps), stepWorkers))
+        except BaseException as e:
+            # report and clean up after the steps that ran before the failure too
+            values = getattr(e, "stepValues", values)
+            timings = getattr(e, "stepTimings", timings)
+            raise
+        finally:
+            # the chain of steps to shorten to make deployments faster, or that led up
+            # to the failure
+            if timings:
+                for line in formatCriticalPath(
+                    criticalPath(findDependencies(steps), timings), timings
+                ):
+                    logger.info(f"Deployment: Critical path {line}")
+
+            # should probably chmod the whole directory since passwords are everywhere
+            # TODO. passwords.txt only exists once the logging server is set up
+            deploymentConn.run(
+                f"chmod 600 {os.path.join(workspace, 'passwords.txt')} {credsFile}",
+                warn=True,
+            )
+
+            if "certDir" in values:
+                # remove temporarily copied SSL certs from generateSSLCerts
+                deploymentConn.run(f"rm -rf {values['certDir']}", hide="stdout")
+                logger.info(
+                    f"Removed temporary SSL certificate directory {values['certDir']}"
+                )
 
 
 if __name__ == "__main__":
-    deployNetwork()
+    # optional command-line argument is the network's workspace directory
+    deployNetwork(sys.argv[1] if len(sys.argv) > 1 else ".")
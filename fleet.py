@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fabric import Config, Connection
+from invoke.exceptions import AuthFailure, CommandTimedOut, Failure
+from paramiko.ssh_exception import SSHException
+
+from utils import getLoggingNodes
+
+# Script running a shell command on many servers of the network at once, such as
+# `python3 fleet.py --target sensors --sudo "systemctl restart tpot"` or
+# `python3 fleet.py --tag eu "df -h /"`. Servers with the same output are printed
+# together. Run from the project directory
+
+# T-Pot moves SSH of sensors to this port
+SENSOR_SSH_PORT = 64295
+FLEET_TARGETS = ["all", "logging", "sensors", "relays"]
+
+
+def getFleetHosts(credentials, target="all", tags=None):
+    """Select servers of the network from credentials.json
+
+    :credentials: JSON object of credentials.json
+    :target: optional, one of FLEET_TARGETS. logging selects every logging node.
+    Defaults to all
+    :tags: optional, list of tags. If given, only keeps servers whose tags key in
+    credentials.json has at least one of them
+    :returns: list of tuples of the form (JSON object representing server, role),
+    where role is logging, sensor or relay
+
+    """
+    hosts = []
+
+    if target in ["all", "logging"]:
+        hosts += [(node, "logging") for node in getLoggingNodes(credentials["logging"])]
+
+    if target in ["all", "sensors"]:
+        hosts += [(sensor, "sensor") for sensor in credentials["sensors"]]
+
+    if target in ["all", "relays"]:
+        hosts += [(relay, "relay") for relay in credentials.get("relays", [])]
+
+    if tags:
+        hosts = [
+            (hostObj, role)
+            for hostObj, role in hosts
+            if set(tags) & set(hostObj.get("tags", []))
+        ]
+
+    return hosts
+
+
+def connectHost(hostObj, role, sudoUser, connectTimeout=10):
+    """Create connection to a server of the network as the non-root sudo user
+
+    :hostObj: JSON object representing server
+    :role: role of server (as returned by getFleetHosts)
+    :sudoUser: name of non-root sudo user (sudouser in credentials.json)
+    :connectTimeout: optional, seconds to wait for the SSH connection. Defaults to 10
+    :returns: fabric.Connection object
+
+    """
+    return Connection(
+        host=hostObj["host"],
+        user=sudoUser,
+        port=SENSOR_SSH_PORT if role == "sensor" else 22,
+        connect_timeout=connectTimeout,
+        config=Config(overrides={"sudo": {"password": hostObj["sudopass"]}}),
+    )
+
+
+def runCommand(connection, command, useSudo=False, timeout=None):
+    """Run command on a server without raising on failures
+
+    :connection: fabric.Connection object to server
+    :command: shell command to run
+    :useSudo: optional, whether to run command with sudo. Defaults to False
+    :timeout: optional, seconds after which the command is stopped. Defaults to none
+    :returns: tuple of the form (exit code, output), where the exit code is None if
+    the command timed out, sudo rejected the password or the server couldn't be
+    reached
+
+    """
+    runner = connection.sudo if useSudo else connection.run
+
+    try:
+        result = runner(command, hide=True, warn=True, timeout=timeout)
+    except CommandTimedOut:
+        return None, f"timed out after {timeout}s"
+    except AuthFailure:
+        # wrong sudopass in credentials.json
+        return None, "sudo password rejected"
+    except Failure as e:
+        return None, f"command failed: {e}"
+    except (OSError, SSHException) as e:
+        return None, f"connection failed: {e}"
+
+    return result.exited, (result.stdout + result.stderr).strip()
+
+
+def runFleet(connections, command, useSudo=False, timeout=None, workers=10):
+    """Run command on many servers in parallel
+
+    :connections: dictionary mapping FQDNs to fabric.Connection objects
+    :command: shell command to run
+    :useSudo: optional, whether to run command with sudo. Defaults to False
+    :timeout: optional, seconds after which the command is stopped on each server.
+    Defaults to none
+    :workers: optional, number of servers to run command on at once. Defaults to 10
+    :returns: dictionary mapping FQDNs to results (as returned by runCommand)
+
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            host: executor.submit(runCommand, conn, command, useSudo, timeout)
+            for host, conn in connections.items()
+        }
+
+    return {host: future.result() for host, future in futures.items()}
+
+
+def groupResults(results):
+    """Group servers whose command gave the same exit code and output
+
+    :results: results of servers (as returned by runFleet)
+    :returns: list of tuples of the form (list of FQDNs, exit code, output), biggest
+    group first
+
+    """
+    groups = {}
+
+    for host, result in results.items():
+        groups.setdefault(result, []).append(host)
+
+    return sorted(
+        [(hosts, exitCode, output) for (exitCode, output), hosts in groups.items()],
+        key=lambda group: len(group[0]),
+        reverse=True,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a command on servers of the T-Pot network in parallel"
+    )
+    parser.add_argument("command", help="shell command to run on every server")
+    parser.add_argument(
+        "--target",
+        choices=FLEET_TARGETS,
+        default="all",
+        help="servers to run command on",
+    )
+    parser.add_argument(
+        "--tag",
+        action="append",
+        dest="tags",
+        help="only run on servers with this tag in credentials.json (repeatable)",
+    )
+    parser.add_argument(
+        "--sudo", action="store_true", help="run command with sudo on every server"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=60,
+        help="seconds after which the command is stopped on a server",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=10,
+        help="number of servers to run command on at once",
+    )
+    parser.add_argument(
+        "--workspace",
+        default=".",
+        help="path to workspace directory of the network (see README)",
+    )
+    args = parser.parse_args()
+
+    with open(os.path.join(args.workspace, "credentials.json")) as f:
+        credentials = json.load(f)
+
+    connections = {
+        hostObj["host"]: connectHost(hostObj, role, credentials["sudouser"])
+        for hostObj, role in getFleetHosts(credentials, args.target, args.tags)
+    }
+    results = runFleet(connections, args.command, args.sudo, args.timeout, args.workers)
+
+    for conn in connections.values():
+        conn.close()
+
+    for hosts, exitCode, output in groupResults(results):
+        status = "failed" if exitCode is None else f"exit {exitCode}"
+        print(f"===== {len(hosts)} host(s), {status}: {', '.join(sorted(hosts))}")
+        print(output or "(no output)")
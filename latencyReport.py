@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+
+import requests
+from requests.exceptions import HTTPError
+
+from errors import BadAPIRequestError
+from utils import findPassword, findRelay, tPotHostname
+
+# Script reporting ingest latency (time between an event's @timestamp and it being
+# indexed, recorded by the tpot-ingest-latency final pipeline) for each sensor
+# region. Run from the project directory with `python3 latencyReport.py`
+
+PERCENTS = [50, 95, 99]
+
+
+def regionHostnames(sensorObjs):
+    """Group hostnames of sensor servers by region
+
+    :sensorObjs: array of JSON objects representing sensor servers
+    :returns: dictionary of the form {region: [hostnames]}, where sensors without a
+    region key in credentials.json are under "default"
+
+    """
+    regions = {}
+
+    for sensor in sensorObjs:
+        hostname = tPotHostname(sensor["host"])
+        regions.setdefault(sensor.get("region", "default"), []).append(hostname)
+
+    return regions
+
+
+def getRegionLatency(hostPort, userName, password, regionHosts, hours=1):
+    """Get number of events and ingest latency percentiles of every region
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :regionHosts: hostnames of sensors per region (as returned by regionHostnames)
+    :hours: optional, number of hours to measure over. Defaults to 1
+    :returns: dictionary of the form {region: {"events": count, 50: ms, 95: ms,
+    99: ms}}, with None percentiles for regions without events
+
+    """
+    query = {
+        "size": 0,
+        "query": {"range": {"@timestamp": {"gte": f"now-{hours}h"}}},
+        "aggs": {
+            "regions": {
+                "filters": {
+                    "filters": {
+                        region: {"terms": {"t-pot_hostname.keyword": hostnames}}
+                        for region, hostnames in regionHosts.items()
+                    }
+                },
+                "aggs": {
+                    "latency": {
+                        "percentiles": {
+                            "field": "ingest_latency_ms",
+                            "percents": PERCENTS,
+                        }
+                    }
+                },
+            }
+        },
+    }
+    searchResp = requests.post(
+        f"https://{hostPort}/tpot-*/_search", auth=(userName, password), json=query
+    )
+
+    try:
+        searchResp.raise_for_status()
+    except HTTPError:
+        raise BadAPIRequestError(
+            f"{searchResp.text}\nBad API request. See response above."
+        )
+
+    buckets = searchResp.json()["aggregations"]["regions"]["buckets"]
+    latency = {}
+
+    for region, bucket in buckets.items():
+        values = bucket["latency"]["values"]
+        latency[region] = {
+            "events": bucket["doc_count"],
+            **{percent: values[f"{float(percent)}"] for percent in PERCENTS},
+        }
+
+    return latency
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report ingest latency of honeypot data per sensor region"
+    )
+    parser.add_argument(
+        "--hours",
+        type=int,
+        default=1,
+        help="number of hours of honeypot data to measure latency over",
+    )
+    parser.add_argument(
+        "--workspace",
+        default=".",
+        help="path to workspace directory of the network (see README)",
+    )
+    args = parser.parse_args()
+
+    with open(os.path.join(args.workspace, "credentials.json")) as f:
+        credentials = json.load(f)
+
+    with open(os.path.join(args.workspace, "passwords.txt")) as f:
+        elasticPass = findPassword(f.read(), "elastic")
+
+    relayCreds = credentials.get("relays", [])
+    latency = getRegionLatency(
+        f"{credentials['logging']['host']}:64298",
+        "elastic",
+        elasticPass,
+        regionHostnames(credentials["sensors"]),
+        args.hours,
+    )
+
+    print(
+        f"{'REGION':12} {'RELAY':40} {'EVENTS':>10}"
+        + "".join(f" {f'P{percent} MS':>10}" for percent in PERCENTS)
+    )
+
+    for region, stats in sorted(latency.items()):
+        # sensors without a region never use a relay (see findRelay)
+        relay = findRelay({} if region == "default" else {"region": region}, relayCreds)
+        percentiles = "".join(
+            f" {'-':>10}" if stats[percent] is None else f" {stats[percent]:10.0f}"
+            for percent in PERCENTS
+        )
+        print(
+            f"{region:12} {relay['host'] if relay else '-':40}"
+            f" {stats['events']:10}{percentiles}"
+        )
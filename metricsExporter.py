@@ -0,0 +1,377 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.exceptions import HTTPError
+
+from errors import BadAPIRequestError
+from fleet import connectHost, getFleetHosts, runCommand
+from utils import findPassword, usesFilebeat
+
+# Script collecting ingest metrics of the network and serving them in Prometheus'
+# text format on the deployment server: events in/out, pipeline duration, queue
+# depth and heap of every Logstash (sensors, relays and the central Logstash) and
+# indexing, bulk and write rejection stats of every Elasticsearch node. Run from the
+# project directory with `python3 metricsExporter.py`, then scrape
+# http://deployment-server:9108/metrics
+
+logger = logging.getLogger(__name__)
+
+# Logstash monitoring API, only listening on localhost
+LOGSTASH_STATS_URL = "http://127.0.0.1:9600/_node/stats"
+# (metric name, type, help text, path in stats JSON), where * sums over every key
+LOGSTASH_METRICS = [
+    (
+        "tpot_logstash_events_in_total",
+        "counter",
+        "Events received by Logstash's inputs",
+        ["events", "in"],
+    ),
+    (
+        "tpot_logstash_events_filtered_total",
+        "counter",
+        "Events that went through Logstash's filters",
+        ["events", "filtered"],
+    ),
+    (
+        "tpot_logstash_events_out_total",
+        "counter",
+        "Events sent by Logstash's outputs",
+        ["events", "out"],
+    ),
+    (
+        "tpot_logstash_events_duration_ms_total",
+        "counter",
+        "Milliseconds Logstash spent filtering and sending events",
+        ["events", "duration_in_millis"],
+    ),
+    (
+        "tpot_logstash_queue_push_duration_ms_total",
+        "counter",
+        "Milliseconds Logstash's inputs waited on a full queue (backpressure)",
+        ["events", "queue_push_duration_in_millis"],
+    ),
+    (
+        "tpot_logstash_queue_events",
+        "gauge",
+        "Events waiting in the queues of Logstash's pipelines",
+        ["pipelines", "*", "queue", "events_count"],
+    ),
+    (
+        "tpot_logstash_heap_used_percent",
+        "gauge",
+        "JVM heap usage of Logstash",
+        ["jvm", "mem", "heap_used_percent"],
+    ),
+]
+UP_METRIC = [
+    (
+        "tpot_exporter_up",
+        "gauge",
+        "Whether the Logstash monitoring API or Elasticsearch answered",
+        ["up"],
+    )
+]
+ELASTIC_METRICS = [
+    (
+        "tpot_elasticsearch_indexing_total",
+        "counter",
+        "Documents indexed by the node",
+        ["indices", "indexing", "index_total"],
+    ),
+    (
+        "tpot_elasticsearch_indexing_failed_total",
+        "counter",
+        "Documents the node failed to index",
+        ["indices", "indexing", "index_failed"],
+    ),
+    (
+        "tpot_elasticsearch_indexing_time_ms_total",
+        "counter",
+        "Milliseconds the node spent indexing documents",
+        ["indices", "indexing", "index_time_in_millis"],
+    ),
+    (
+        "tpot_elasticsearch_bulk_total",
+        "counter",
+        "Bulk requests handled by the node's shards",
+        ["indices", "bulk", "total_operations"],
+    ),
+    (
+        "tpot_elasticsearch_bulk_time_ms_total",
+        "counter",
+        "Milliseconds the node's shards spent on bulk requests",
+        ["indices", "bulk", "total_time_in_millis"],
+    ),
+    (
+        "tpot_elasticsearch_write_rejected_total",
+        "counter",
+        "Bulk requests the node rejected because its write queue was full",
+        ["thread_pool", "write", "rejected"],
+    ),
+    (
+        "tpot_elasticsearch_write_queue",
+        "gauge",
+        "Requests waiting in the node's write queue",
+        ["thread_pool", "write", "queue"],
+    ),
+    (
+        "tpot_elasticsearch_heap_used_percent",
+        "gauge",
+        "JVM heap usage of the node",
+        ["jvm", "mem", "heap_used_percent"],
+    ),
+]
+
+
+def findValue(stats, path):
+    """Find a number in nested stats JSON
+
+    :stats: JSON object returned by a stats API
+    :path: list of keys, where "*" sums the values under every key at that level
+    :returns: number, or None if it isn't in stats
+
+    """
+    if not path:
+        return stats if isinstance(stats, (int, float)) else None
+
+    if not isinstance(stats, dict):
+        return None
+
+    if path[0] == "*":
+        values = [findValue(child, path[1:]) for child in stats.values()]
+        values = [value for value in values if value is not None]
+
+        return sum(values) if values else None
+
+    return findValue(stats.get(path[0]), path[1:])
+
+
+def getLogstashStats(connection, inDocker=False, timeout=10):
+    """Get stats of a Logstash from its monitoring API over SSH
+
+    :connection: fabric.Connection object to server running Logstash
+    :inDocker: optional, whether Logstash runs in T-Pot's logstash container (on
+    sensors) instead of on the server itself. Defaults to False
+    :timeout: optional, seconds to wait for the stats. Defaults to 10
+    :returns: JSON object of _node/stats, or None if it couldn't be fetched
+
+    """
+    command = f"curl -s {LOGSTASH_STATS_URL}"
+
+    if inDocker:
+        command = f"docker exec logstash {command}"
+
+    exitCode, output = runCommand(connection, command, useSudo=True, timeout=timeout)
+
+    if exitCode != 0:
+        return None
+
+    try:
+        return json.loads(output)
+    except ValueError:
+        return None
+
+
+def getElasticStats(hostPort, userName, password):
+    """Get indexing, bulk, write thread pool and JVM stats of every Elasticsearch node
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :returns: dictionary mapping node names to their stats
+
+    """
+    statsResp = requests.get(
+        f"https://{hostPort}/_nodes/stats/indices,thread_pool,jvm",
+        auth=(userName, password),
+    )
+
+    try:
+        statsResp.raise_for_status()
+    except HTTPError:
+        raise BadAPIRequestError(
+            f"{statsResp.text}\nBad API request. See response above."
+        )
+
+    return {node["name"]: node for node in statsResp.json()["nodes"].values()}
+
+
+def formatMetrics(metricDefs, samples):
+    """Format samples in Prometheus' text exposition format
+
+    :metricDefs: list of metric definitions (such as LOGSTASH_METRICS)
+    :samples: list of tuples of the form (labels dictionary, stats JSON)
+    :returns: text with HELP and TYPE lines and one line per sample of each metric,
+    skipping samples without the metric
+
+    """
+    lines = []
+
+    for name, metricType, helpText, path in metricDefs:
+        lines += [f"# HELP {name} {helpText}", f"# TYPE {name} {metricType}"]
+
+        for labels, stats in samples:
+            value = findValue(stats, path)
+
+            if value is not None:
+                labelStr = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{labelStr}}} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def collectMetrics(logstashConns, hostPort, userName, password, workers=10):
+    """Collect stats of every Logstash and Elasticsearch node in parallel
+
+    :logstashConns: list of tuples of the form (FQDN, role, fabric.Connection) of
+    servers running Logstash, where role is sensor, relay or logging
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :workers: optional, number of servers to collect from at once. Defaults to 10
+    :returns: text of all metrics in Prometheus' text exposition format
+
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        elasticFuture = executor.submit(getElasticStats, hostPort, userName, password)
+        logstashFutures = [
+            (host, role, executor.submit(getLogstashStats, conn, role == "sensor"))
+            for host, role, conn in logstashConns
+        ]
+
+    logstashSamples = []
+    upSamples = []
+
+    for host, role, future in logstashFutures:
+        try:
+            stats = future.result()
+        except Exception:
+            # such as invoke's AuthFailure when the sudo password is wrong
+            logger.exception(f"Collecting Logstash stats of {host} failed")
+            stats = None
+
+        upSamples.append(({"host": host, "role": role}, {"up": int(stats is not None)}))
+
+        if stats is not None:
+            logstashSamples.append(({"host": host, "role": role}, stats))
+
+    try:
+        elasticSamples = [
+            ({"node": nodeName}, stats)
+            for nodeName, stats in elasticFuture.result().items()
+        ]
+        upSamples.append(({"host": hostPort, "role": "elasticsearch"}, {"up": 1}))
+    except Exception:
+        logger.exception(f"Collecting Elasticsearch stats from {hostPort} failed")
+        elasticSamples = []
+        upSamples.append(({"host": hostPort, "role": "elasticsearch"}, {"up": 0}))
+
+    return (
+        formatMetrics(UP_METRIC, upSamples)
+        + formatMetrics(LOGSTASH_METRICS, logstashSamples)
+        + formatMetrics(ELASTIC_METRICS, elasticSamples)
+    )
+
+
+def formatAllDown(logstashConns, hostPort):
+    """Format tpot_exporter_up 0 for every target, for when a collection fails as a
+    whole
+
+    :logstashConns: list of tuples of the form (FQDN, role, fabric.Connection) of
+    servers running Logstash (see collectMetrics)
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :returns: text of tpot_exporter_up metric in Prometheus' text exposition format
+
+    """
+    targets = [(host, role) for host, role, _ in logstashConns]
+    targets.append((hostPort, "elasticsearch"))
+
+    return formatMetrics(
+        UP_METRIC, [({"host": host, "role": role}, {"up": 0}) for host, role in targets]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve ingest metrics of the T-Pot network to Prometheus"
+    )
+    parser.add_argument(
+        "--port", type=int, default=9108, help="port to serve /metrics on"
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=15,
+        help="seconds between two collections of the metrics",
+    )
+    parser.add_argument(
+        "--workspace",
+        default=".",
+        help="path to workspace directory of the network (see README)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    with open(os.path.join(args.workspace, "credentials.json")) as f:
+        credentials = json.load(f)
+
+    with open(os.path.join(args.workspace, "passwords.txt")) as f:
+        elasticPass = findPassword(f.read(), "elastic")
+
+    logCreds = credentials["logging"]
+    sensorCreds = credentials["sensors"]
+    relayCreds = credentials.get("relays", [])
+    # Filebeat sensors have no Logstash, their events go through the central one
+    centralLogstash = bool(relayCreds) or any(map(usesFilebeat, sensorCreds))
+    logstashConns = [
+        (hostObj["host"], role, connectHost(hostObj, role, credentials["sudouser"]))
+        for hostObj, role in getFleetHosts(credentials)
+        if (role == "sensor" and not usesFilebeat(hostObj))
+        or role == "relay"
+        or (hostObj["host"] == logCreds["host"] and centralLogstash)
+    ]
+
+    # scrapes return the last collection, since SSHing to every server takes a while
+    latest = {"text": ""}
+
+    def collectForever():
+        elasticHostPort = f"{logCreds['host']}:64298"
+
+        # an exception would end the thread and leave /metrics serving stale data
+        while True:
+            try:
+                latest["text"] = collectMetrics(
+                    logstashConns, elasticHostPort, "elastic", elasticPass
+                )
+            except Exception:
+                logger.exception("Collecting metrics failed")
+                latest["text"] = formatAllDown(logstashConns, elasticHostPort)
+
+            time.sleep(args.interval)
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+
+            body = latest["text"].encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    threading.Thread(target=collectForever, daemon=True).start()
+    print(f"Serving metrics on http://0.0.0.0:{args.port}/metrics")
+    ThreadingHTTPServer(("", args.port), MetricsHandler).serve_forever()
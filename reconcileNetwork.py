@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+
+from invoke.config import Config as InvokeConfig
+from invoke.context import Context
+
+from deploymentHelpers import copySSLCerts
+from errors import NoCredentialsFileError
+from fabfile import (createAllSudoUsers, deploySensors, logger, logToWorkspace,
+                     waitForCanaries)
+from utils import splitDomain
+from vmManagement import (createVMs, deleteDropletRecords, deleteDropletsById,
+                          dropletTags, findSSHKeyId, findUntaggedDroplets,
+                          hostSize, planReconcile, tagDroplets)
+
+
+def reconcileNetwork(workspace="."):
+    """Bring the sensors of a deployed T-Pot network in line with credentials.json:
+    create and set up the sensors without a droplet and tear down the sensor droplets
+    no longer in credentials.json, leaving every other server untouched
+
+    :workspace: optional, path to workspace directory of the network (see
+    fabfile.deployNetwork). Defaults to the current directory
+    :returns: None
+
+    """
+    credsFile = os.path.join(workspace, "credentials.json")
+    DOApiKeyFile = os.path.join(workspace, "digitalocean.ini")
+    with logToWorkspace(workspace):
+
+        try:
+            # get server credentials from credentials file
+            with open(credsFile) as f:
+                credentials = json.load(f)
+                deploymentCreds = credentials["deployment"]
+                logCreds = credentials["logging"]
+                sensorCreds = credentials["sensors"]
+                relayCreds = credentials.get("relays", [])
+                tPotSudoUser = credentials["sudouser"]
+        except FileNotFoundError:
+            raise NoCredentialsFileError(
+                f"{credsFile} not found. Did you copy credentials.json.template?"
+            )
+
+        # get DigitalOcean API key
+        with open(DOApiKeyFile) as f:
+            apiKey = f.read().strip().split()[-1]
+
+        # networks deployed before droplets were tagged would get every sensor twice
+        untaggedDroplets = findUntaggedDroplets(apiKey, logCreds, sensorCreds)
+
+        if untaggedDroplets:
+            tagDroplets(
+                apiKey,
+                dropletTags(logCreds, "sensor"),
+                [droplet["id"] for droplet in untaggedDroplets],
+            )
+            logger.info(
+                "Reconcile: Tagged untagged sensor droplets"
+                f" {', '.join(droplet['name'] for droplet in untaggedDroplets)}"
+            )
+
+        missingSensors, removedDroplets = planReconcile(apiKey, logCreds, sensorCreds)
+
+        if removedDroplets:
+            # removed sensors can be under any domain of the network
+            tldList = list(
+                {
+                    splitDomain(hostObj["host"])[1]
+                    for hostObj in [logCreds] + sensorCreds + relayCreds
+                }
+            )
+            # by address and ID, so same-named servers of other networks stay untouched
+            deleteDropletRecords(apiKey, tldList, removedDroplets)
+            deleteDropletsById(apiKey, [droplet["id"] for droplet in removedDroplets])
+            logger.info(
+                "Reconcile: Removed sensor droplets"
+                f" {', '.join(droplet['name'] for droplet in removedDroplets)}"
+            )
+
+        if not missingSensors:
+            logger.info("Reconcile: No sensors to add")
+            return
+
+        deploymentConf = InvokeConfig()
+        deploymentConf.sudo.password = deploymentCreds["sudopass"]
+        deploymentConn = Context(config=deploymentConf)
+
+        # reuse the SSH key, certificate and passwords of the deployment
+        sshKey = deploymentConn.run(
+            "cat ~/.ssh/id_rsa.pub", hide="stdout"
+        ).stdout.strip()
+        createVMs(
+            apiKey,
+            logCreds,
+            [(sensor, hostSize(sensor), "sensor") for sensor in missingSensors],
+            findSSHKeyId(apiKey, sshKey),
+            logCreds.get("vpc", False),
+        )
+        logger.info(
+            "Reconcile: Created sensor droplets"
+            f" {', '.join(sensor['host'] for sensor in missingSensors)}"
+        )
+
+        tempCertPath = copySSLCerts(
+            deploymentConn, logCreds["host"], os.path.join(workspace, "certs")
+        )
+        createAllSudoUsers(missingSensors, tPotSudoUser)
+
+        try:
+            deploySensors(
+                missingSensors,
+                logCreds,
+                relayCreds,
+                tPotSudoUser,
+                tempCertPath,
+                workspace,
+            )
+        finally:
+            # remove temporarily copied SSL certs from copySSLCerts
+            deploymentConn.run(f"rm -rf {tempCertPath}", hide="stdout")
+
+        waitForCanaries(missingSensors, logCreds, tPotSudoUser, workspace=workspace)
+        logger.info(f"Reconcile: Added {len(missingSensors)} sensor(s)")
+
+
+if __name__ == "__main__":
+    # optional command-line argument is the network's workspace directory
+    reconcileNetwork(sys.argv[1] if len(sys.argv) > 1 else ".")
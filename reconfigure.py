@@ -0,0 +1,329 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from configFuncs import (ELASTIC_PATH, KIBANA_PATH, LOGSTASH_PATH,
+                         createHostTuningProfile, renderCentralLogstashConf,
+                         renderElasticsearchYml, renderKibanaYml,
+                         renderRelayConf, renderShipperConf, shipperConfPath)
+from deploymentHelpers import TPOT_USER, putFile, waitForClusterNodes
+from fleet import connectHost, getFleetHosts
+from utils import (centralLogstashHost, findPassword, getLoggingNodes,
+                   nodeHasRole, usesFilebeat, waitForService)
+from vmManagement import hostSize
+
+# Script pushing config changes (edited templates in configFiles or settings in
+# credentials.json) to an already deployed network. It renders the config files of
+# every server, compares their hashes with the files on the servers and only uploads
+# the ones that differ, restarting only the services using them. Run from the project
+# directory with `python3 reconfigure.py`, or add --dry-run to only list the drift
+
+
+def getDesiredConfigs(credentials, passwordText):
+    """Render the config files every server of the network should have, with the same
+    functions the deployment writes them with
+
+    :credentials: JSON object of credentials.json
+    :passwordText: text of passwords.txt (written by fabfile.setupLoggingCluster)
+    :returns: dictionary mapping FQDNs of servers to lists of dictionaries with path
+    (on the server), text, service (systemd unit to restart when the file changes),
+    owner and mode keys (see deploymentHelpers.putFile)
+
+    """
+    logCreds = credentials["logging"]
+    relayCreds = credentials.get("relays", [])
+    loggingNodes = getLoggingNodes(logCreds)
+    privateNetwork = logCreds.get("vpc", False)
+    tPotPass = findPassword(passwordText, TPOT_USER)
+    desired = {}
+
+    for node in loggingNodes:
+        desired[node["host"]] = [
+            {
+                "path": f"{ELASTIC_PATH}/elasticsearch.yml",
+                "text": renderElasticsearchYml(node, loggingNodes, privateNetwork),
+                "service": "elasticsearch",
+                "owner": None,
+                "mode": None,
+            }
+        ]
+        tuningProfile = createHostTuningProfile(hostSize(node, loggingNode=True))
+
+        for remotePath, text in tuningProfile.items():
+            desired[node["host"]].append(
+                {
+                    "path": remotePath,
+                    "text": text,
+                    # systemd-sysctl reapplies everything in /etc/sysctl.d
+                    "service": (
+                        "systemd-sysctl"
+                        if remotePath.startswith("/etc/sysctl.d/")
+                        else "elasticsearch"
+                    ),
+                    "owner": "root:root",
+                    "mode": None,
+                }
+            )
+
+    desired[logCreds["host"]].append(
+        {
+            "path": f"{KIBANA_PATH}/kibana.yml",
+            "text": renderKibanaYml(
+                logCreds["host"], findPassword(passwordText, "kibana_system")
+            ),
+            "service": "kibana",
+            "owner": None,
+            "mode": None,
+        }
+    )
+
+    if relayCreds or any(usesFilebeat(sensor) for sensor in credentials["sensors"]):
+        desired[logCreds["host"]].append(
+            {
+                "path": f"{LOGSTASH_PATH}/conf.d/tpot.conf",
+                "text": renderCentralLogstashConf(
+                    loggingNodes,
+                    tPotPass,
+                    logCreds.get("centralEnrichment", False),
+                    privateNetwork,
+                ),
+                "service": "logstash",
+                "owner": "root:logstash",
+                "mode": 640,
+            }
+        )
+
+    for relay in relayCreds:
+        desired[relay["host"]] = [
+            {
+                "path": f"{LOGSTASH_PATH}/conf.d/relay.conf",
+                "text": renderRelayConf(centralLogstashHost(logCreds)),
+                "service": "logstash",
+                "owner": "root:logstash",
+                "mode": None,
+            }
+        ]
+
+    for sensor in credentials["sensors"]:
+        # the shippers run in T-Pot's docker-compose stack
+        desired[sensor["host"]] = [
+            {
+                "path": shipperConfPath(sensor.get("shipper", "logstash")),
+                "text": renderShipperConf(sensor, logCreds, relayCreds, tPotPass),
+                "service": "tpot",
+                "owner": None,
+                "mode": None,
+            }
+        ]
+
+    return desired
+
+
+def getRemoteHashes(connection, paths):
+    """Get SHA-256 hashes of files on a server in one command
+
+    :connection: fabric.Connection object to server
+    :paths: list of absolute paths of files on server
+    :returns: dictionary mapping paths to hex digests, without the missing files
+
+    """
+    # sha256sum still prints the hashes of the files that exist when some don't
+    hashResult = connection.sudo(f"sha256sum {' '.join(paths)}", hide=True, warn=True)
+    remoteHashes = {}
+
+    for line in hashResult.stdout.splitlines():
+        fileHash, path = line.split(maxsplit=1)
+        remoteHashes[path] = fileHash
+
+    return remoteHashes
+
+
+def findChangedConfigs(configs, remoteHashes):
+    """Find config files whose rendered text differs from the file on the server
+
+    :configs: list of config file dictionaries (as returned by getDesiredConfigs)
+    :remoteHashes: hashes of files on server (as returned by getRemoteHashes)
+    :returns: list of config file dictionaries which differ or are missing
+
+    """
+    return [
+        config
+        for config in configs
+        if hashlib.sha256(config["text"].encode()).hexdigest()
+        != remoteHashes.get(config["path"])
+    ]
+
+
+def applyConfigs(connection, configs):
+    """Upload config files to a server and restart the services using them
+
+    :connection: fabric.Connection object to server
+    :configs: list of config file dictionaries (as returned by findChangedConfigs)
+    :returns: list of restarted services, in the order of configs
+
+    """
+    services = []
+
+    for config in configs:
+        putFile(
+            connection, config["text"], config["path"], config["owner"], config["mode"]
+        )
+
+        if config["service"] not in services:
+            services.append(config["service"])
+
+    if services:
+        # picks up edited systemd overrides
+        connection.sudo("systemctl daemon-reload", hide=True)
+
+    for service in services:
+        connection.sudo(f"systemctl restart {service}.service", hide=True)
+
+    return services
+
+
+def reconfigureHost(connection, configs, dryRun=False):
+    """Bring the config files of a server in line with their rendered text
+
+    :connection: fabric.Connection object to server
+    :configs: list of config file dictionaries of server (as returned by
+    getDesiredConfigs)
+    :dryRun: optional, whether to only find changed files without uploading them.
+    Defaults to False
+    :returns: tuple of the form (list of changed paths, list of restarted services)
+
+    """
+    remoteHashes = getRemoteHashes(connection, [config["path"] for config in configs])
+    changedConfigs = findChangedConfigs(configs, remoteHashes)
+    changedPaths = [config["path"] for config in changedConfigs]
+
+    if dryRun:
+        return changedPaths, []
+
+    return changedPaths, applyConfigs(connection, changedConfigs)
+
+
+def reconfigureLoggingNodes(
+    connections, loggingNodes, desired, elasticPass, dryRun=False, timeout=1800
+):
+    """Bring the config files of the logging nodes in line one node at a time,
+    waiting for each restarted Elasticsearch node to rejoin and its shards to
+    recover before moving on, so no two nodes are ever down together
+
+    :connections: dictionary mapping FQDNs of servers to fabric.Connection objects
+    :loggingNodes: list of JSON objects representing logging nodes (as returned by
+    utils.getLoggingNodes)
+    :desired: dictionary mapping FQDNs of servers to config file dictionaries (as
+    returned by getDesiredConfigs)
+    :elasticPass: password of elastic user
+    :dryRun: optional, whether to only find changed files without uploading them.
+    Defaults to False
+    :timeout: optional, seconds to wait for each node to recover. Defaults to 1800
+    :returns: list of tuples of the form (FQDN, (list of changed paths, list of
+    restarted services))
+
+    """
+    # replicas can only all be assigned with more than one data node
+    dataNodes = [node for node in loggingNodes if nodeHasRole(node, "data")]
+    healthStatus = "green" if len(dataNodes) > 1 else "yellow"
+    results = []
+
+    for node in loggingNodes:
+        changedPaths, services = reconfigureHost(
+            connections[node["host"]], desired[node["host"]], dryRun
+        )
+        results.append((node["host"], (changedPaths, services)))
+
+        if "elasticsearch" not in services:
+            continue
+
+        # ask a node that stayed up, the restarted one may not have rejoined yet
+        otherNodes = [other for other in loggingNodes if other is not node]
+        healthHost = otherNodes[0]["host"] if otherNodes else node["host"]
+        waitForService(healthHost, 64298)
+        waitForClusterNodes(
+            f"{healthHost}:64298",
+            "elastic",
+            elasticPass,
+            len(loggingNodes),
+            timeout,
+            healthStatus,
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Push changed config files to a deployed T-Pot network"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only list the config files that differ from the rendered ones",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=10,
+        help="number of servers to reconfigure at once",
+    )
+    parser.add_argument(
+        "--workspace",
+        default=".",
+        help="path to workspace directory of the network (see README)",
+    )
+    args = parser.parse_args()
+
+    with open(os.path.join(args.workspace, "credentials.json")) as f:
+        credentials = json.load(f)
+
+    with open(os.path.join(args.workspace, "passwords.txt")) as f:
+        passwordText = f.read()
+
+    desired = getDesiredConfigs(credentials, passwordText)
+
+    loggingNodes = getLoggingNodes(credentials["logging"])
+    connections = {
+        hostObj["host"]: connectHost(hostObj, role, credentials["sudouser"])
+        for hostObj, role in getFleetHosts(credentials)
+    }
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        loggingFuture = executor.submit(
+            reconfigureLoggingNodes,
+            connections,
+            loggingNodes,
+            desired,
+            findPassword(passwordText, "elastic"),
+            args.dry_run,
+        )
+        otherFutures = [
+            (
+                host,
+                executor.submit(
+                    reconfigureHost, connections[host], desired[host], args.dry_run
+                ),
+            )
+            for host in connections
+            if host not in {node["host"] for node in loggingNodes}
+        ]
+        results = loggingFuture.result() + [
+            (host, future.result()) for host, future in otherFutures
+        ]
+
+    for conn in connections.values():
+        conn.close()
+
+    for host, (changedPaths, services) in results:
+        if not changedPaths:
+            print(f"{host}: up to date")
+        elif args.dry_run:
+            print(f"{host}: would update {', '.join(changedPaths)}")
+        else:
+            print(
+                f"{host}: updated {', '.join(changedPaths)} and restarted"
+                f" {', '.join(services)}"
+            )
@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import sys
+import time
+
+import requests
+from requests.exceptions import HTTPError
+
+from deploymentHelpers import DEFAULT_RETENTION
+from errors import BadAPIRequestError
+from utils import findPassword
+
+# Script to keep the logging server's disk usage under a target percentage by deleting
+# the oldest backing indices of the honeypot data streams, meant to be run
+# periodically from cron on the deployment server (see deployNetwork in fabfile.py)
+
+logger = logging.getLogger(__name__)
+
+DAY_MILLIS = 24 * 60 * 60 * 1000
+
+
+def getDiskUsage(hostPort, userName, password):
+    """Get disk usage of each elasticsearch data node through _cat/allocation
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :returns: list of tuples of the form (node name, used bytes, total bytes)
+
+    """
+    allocResp = requests.get(
+        f"https://{hostPort}/_cat/allocation",
+        auth=(userName, password),
+        params={"format": "json", "bytes": "b"},
+    )
+
+    try:
+        allocResp.raise_for_status()
+    except HTTPError:
+        raise BadAPIRequestError(
+            f"{allocResp.text}\nBad API request. See response above."
+        )
+
+    # unassigned shards show up as a row without any disk information
+    return [
+        (node["node"], int(node["disk.used"]), int(node["disk.total"]))
+        for node in allocResp.json()
+        if node.get("disk.total") is not None
+    ]
+
+
+def findFullestNode(nodeUsages):
+    """Find the data node with the highest disk usage percentage, since the
+    flood-stage watermark is enforced per node and not over the whole cluster
+
+    :nodeUsages: list of (node name, used bytes, total bytes) tuples (as returned by
+    getDiskUsage)
+    :returns: tuple of the form (node name, used bytes, total bytes), or
+    (None, 0, 0) if no node reports any disk space
+
+    """
+    reporting = [usage for usage in nodeUsages if usage[2] > 0]
+
+    if not reporting:
+        return None, 0, 0
+
+    return max(reporting, key=lambda usage: usage[1] / usage[2])
+
+
+def getIndices(hostPort, userName, password, streamPattern="tpot-*"):
+    """Get creation date and size of the backing indices of all honeypot data streams,
+    flagging write indices which can never be deleted
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :streamPattern: optional, pattern of data streams to manage. Defaults to tpot-*
+    :returns: list of dictionaries with name, created (epoch millis), size (bytes) and
+    writeIndex keys
+
+    """
+    authTup = (userName, password)
+
+    streamsResp = requests.get(
+        f"https://{hostPort}/_data_stream/{streamPattern}", auth=authTup
+    )
+    # backing indices are hidden, so wildcards have to expand to hidden indices too
+    indicesResp = requests.get(
+        f"https://{hostPort}/_cat/indices/.ds-{streamPattern}",
+        auth=authTup,
+        params={
+            "format": "json",
+            "bytes": "b",
+            "h": "index,creation.date,store.size",
+            "expand_wildcards": "all",
+        },
+    )
+
+    for resp in [streamsResp, indicesResp]:
+        try:
+            resp.raise_for_status()
+        except HTTPError:
+            raise BadAPIRequestError(
+                f"{resp.text}\nBad API request. See response above."
+            )
+
+    # the last backing index of a data stream is its write index
+    writeIndices = [
+        stream["indices"][-1]["index_name"]
+        for stream in streamsResp.json()["data_streams"]
+        if stream["indices"]
+    ]
+
+    return [
+        {
+            "name": index["index"],
+            "created": int(index["creation.date"]),
+            "size": int(index["store.size"] or 0),
+            "writeIndex": index["index"] in writeIndices,
+        }
+        for index in indicesResp.json()
+    ]
+
+
+def chooseIndicesToDelete(
+    indices, usedBytes, totalBytes, targetPercent, minDays, now=None
+):
+    """Choose oldest indices to delete to bring disk usage under targetPercent, never
+    choosing write indices or indices younger than minDays
+
+    :indices: list of index dictionaries (as returned by getIndices)
+    :usedBytes: disk space currently used on the fullest data node
+    :totalBytes: total disk space on the fullest data node
+    :targetPercent: disk usage percentage to stay under
+    :minDays: minimum number of days to keep any index for
+    :now: optional, current time in epoch millis. Defaults to time.time()
+    :returns: tuple of the form (names of indices to delete, estimated disk usage
+    percentage after deleting them). Nothing is deleted when totalBytes is 0
+
+    """
+    # no disk to measure usage against, e.g. before any shard is allocated
+    if totalBytes == 0:
+        return [], 0
+
+    if now is None:
+        now = int(time.time() * 1000)
+
+    cutoff = now - minDays * DAY_MILLIS
+    toDelete = []
+
+    for index in sorted(indices, key=lambda index: index["created"]):
+        if usedBytes * 100 <= targetPercent * totalBytes:
+            break
+
+        if index["writeIndex"] or index["created"] > cutoff:
+            continue
+
+        toDelete.append(index["name"])
+        usedBytes -= index["size"]
+
+    return toDelete, usedBytes * 100 / totalBytes
+
+
+def manageRetention(hostPort, userName, password, targetPercent, minDays):
+    """Delete oldest honeypot backing indices until disk usage is under targetPercent
+    while keeping at least minDays of data, logging every decision. Usage is that of
+    the fullest data node, since a single full node is enough to block writes
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :targetPercent: disk usage percentage to stay under
+    :minDays: minimum number of days to keep any index for
+    :returns: list of names of deleted indices
+
+    """
+    nodeName, usedBytes, totalBytes = findFullestNode(
+        getDiskUsage(hostPort, userName, password)
+    )
+
+    # _cat/allocation reports no disk until a data node has shards allocated
+    if totalBytes == 0:
+        logger.info("No disk space reported by Elasticsearch, not deleting anything")
+        return []
+
+    usedPercent = usedBytes * 100 / totalBytes
+
+    if usedPercent <= targetPercent:
+        logger.info(
+            f"Disk usage {usedPercent:.1f}% on fullest node {nodeName} is under"
+            f" target {targetPercent}%, not deleting anything"
+        )
+        return []
+
+    # an index's shards are spread over several nodes, so subtracting its whole size
+    # from the fullest node overestimates the space freed there. That only makes
+    # each run delete too little, never too much, and the next run catches up
+    indices = getIndices(hostPort, userName, password)
+    toDelete, estimatedPercent = chooseIndicesToDelete(
+        indices, usedBytes, totalBytes, targetPercent, minDays
+    )
+
+    logger.info(
+        f"Disk usage {usedPercent:.1f}% on fullest node {nodeName} is over target"
+        f" {targetPercent}%, deleting {len(toDelete)} indices:"
+        f" {', '.join(toDelete) or 'none'}"
+    )
+
+    for indexName in toDelete:
+        deleteResp = requests.delete(
+            f"https://{hostPort}/{indexName}", auth=(userName, password)
+        )
+
+        try:
+            deleteResp.raise_for_status()
+        except HTTPError:
+            raise BadAPIRequestError(
+                f"{deleteResp.text}\nBad API request. See response above."
+            )
+
+        logger.info(f"Deleted index {indexName}")
+
+    if estimatedPercent > targetPercent:
+        logger.warning(
+            f"Disk usage will still be about {estimatedPercent:.1f}% since all"
+            f" remaining indices are younger than {minDays} days or being written to"
+        )
+
+    return toDelete
+
+
+if __name__ == "__main__":
+    # command-line argument is the network's workspace directory, same as
+    # updateCerts.py
+    workspace = sys.argv[1]
+
+    logging.basicConfig(
+        filename=os.path.join(workspace, "retention.log"),
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    with open(os.path.join(workspace, "credentials.json")) as f:
+        logCreds = json.load(f)["logging"]
+
+    with open(os.path.join(workspace, "passwords.txt")) as f:
+        elasticPass = findPassword(f.read(), "elastic")
+
+    retention = {**DEFAULT_RETENTION, **logCreds.get("retention", {})}
+
+    manageRetention(
+        f"{logCreds['host']}:64298",
+        "elastic",
+        elasticPass,
+        retention["diskTargetPercent"],
+        retention["minDays"],
+    )
@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.exceptions import HTTPError
+
+from errors import BadAPIRequestError
+from fleet import connectHost, runCommand
+from utils import findPassword, tPotHostname
+
+# Script flagging sensors whose events stopped reaching Elasticsearch (wedged
+# Logstash after a certificate renewal, full queue, OOM...) and optionally restarting
+# their tpot service, with exponential backoff between restarts of the same sensor.
+# Meant to be run periodically from cron on the deployment server (see deployNetwork
+# in fabfile.py)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WATCHDOG = {
+    "silentMinutes": 30,
+    "restart": False,
+    "maxRestarts": 3,
+    "backoffMinutes": 15,
+}
+# restart times of silent sensors, kept between runs
+WATCHDOG_STATE = "watchdog.json"
+# sensors silent for longer than this are reported without their last event
+LOOKBACK_HOURS = 24
+
+
+def getLastIndexed(hostPort, userName, password, hostnames, hours=LOOKBACK_HOURS):
+    """Get when the last event of every sensor got indexed, in one aggregation
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :hostnames: list of T-Pot hostnames of sensors (t-pot_hostname field)
+    :hours: optional, number of hours to look back. Defaults to LOOKBACK_HOURS
+    :returns: dictionary mapping hostnames to the datetime their last event got
+    indexed (event_ingested field), or None if they have none in the last hours
+
+    """
+    query = {
+        "size": 0,
+        "query": {"range": {"event_ingested": {"gte": f"now-{hours}h"}}},
+        "aggs": {
+            "sensors": {
+                "terms": {
+                    "field": "t-pot_hostname.keyword",
+                    "include": hostnames,
+                    "size": max(len(hostnames), 1),
+                },
+                "aggs": {"lastIndexed": {"max": {"field": "event_ingested"}}},
+            }
+        },
+    }
+    searchResp = requests.post(
+        f"https://{hostPort}/tpot-*/_search", auth=(userName, password), json=query
+    )
+
+    try:
+        searchResp.raise_for_status()
+    except HTTPError:
+        raise BadAPIRequestError(
+            f"{searchResp.text}\nBad API request. See response above."
+        )
+
+    lastIndexed = dict.fromkeys(hostnames)
+
+    for bucket in searchResp.json()["aggregations"]["sensors"]["buckets"]:
+        lastIndexed[bucket["key"]] = datetime.fromtimestamp(
+            bucket["lastIndexed"]["value"] / 1000, timezone.utc
+        )
+
+    return lastIndexed
+
+
+def findSilentSensors(lastIndexed, silentMinutes, now):
+    """Find sensors without any event indexed for too long
+
+    :lastIndexed: last indexed datetimes of sensors (as returned by getLastIndexed)
+    :silentMinutes: number of minutes after which a sensor counts as silent
+    :now: datetime to measure silence from
+    :returns: sorted list of hostnames of silent sensors
+
+    """
+    since = now - timedelta(minutes=silentMinutes)
+
+    return sorted(
+        hostname
+        for hostname, indexedTime in lastIndexed.items()
+        if indexedTime is None or indexedTime < since
+    )
+
+
+def canRestart(restartTimes, now, maxRestarts, backoffMinutes):
+    """Check whether a silent sensor may be restarted again
+
+    :restartTimes: list of ISO datetimes of the sensor's previous restarts since it
+    went silent
+    :now: datetime of the check
+    :maxRestarts: number of restarts after which the sensor is left alone
+    :backoffMinutes: minutes to wait after the first restart, doubled after each
+    following one
+    :returns: True if the sensor may be restarted now, False otherwise
+
+    """
+    if not restartTimes:
+        return True
+
+    if len(restartTimes) >= maxRestarts:
+        return False
+
+    backoff = timedelta(minutes=backoffMinutes * 2 ** (len(restartTimes) - 1))
+
+    return now >= datetime.fromisoformat(restartTimes[-1]) + backoff
+
+
+def restartTPot(connection):
+    """Restart T-Pot's docker-compose stack (honeypots and shipper) on a sensor
+
+    :connection: fabric.Connection object to sensor server
+    :returns: True if the restart succeeded, False otherwise
+
+    """
+    exitCode, output = runCommand(
+        connection, "systemctl restart tpot", useSudo=True, timeout=300
+    )
+
+    if exitCode != 0:
+        logger.error(f"Restarting tpot failed: {output}")
+
+    return exitCode == 0
+
+
+def superviseSensors(
+    hostPort, userName, password, sensorObjs, sudoUser, settings, state, now
+):
+    """Flag silent sensors and restart them if enabled and not backing off
+
+    :hostPort: elasticsearch FQDN and port, in form FQDN:port
+    :userName: user with which to make API requests (usually elastic)
+    :password: password to above user
+    :sensorObjs: array of JSON objects representing sensor servers
+    :sudoUser: name of non-root sudo user (sudouser in credentials.json)
+    :settings: watchdog settings (keys of DEFAULT_WATCHDOG)
+    :state: dictionary mapping hostnames of silent sensors to lists of ISO datetimes
+    of their restarts, updated in place (recovered sensors are removed)
+    :now: datetime of the check
+    :returns: sorted list of hostnames of silent sensors
+
+    """
+    sensors = {tPotHostname(sensor["host"]): sensor for sensor in sensorObjs}
+    lastIndexed = getLastIndexed(hostPort, userName, password, list(sensors))
+    silent = findSilentSensors(lastIndexed, settings["silentMinutes"], now)
+
+    for hostname in list(state):
+        if hostname not in silent:
+            logger.info(f"{hostname}: Events are being indexed again")
+            del state[hostname]
+
+    for hostname in silent:
+        indexedTime = lastIndexed[hostname]
+        logger.warning(
+            f"{hostname}: No events indexed since "
+            + (
+                indexedTime.isoformat()
+                if indexedTime is not None
+                else f"at least {LOOKBACK_HOURS} hours"
+            )
+        )
+
+        if not settings["restart"]:
+            continue
+
+        restartTimes = state.setdefault(hostname, [])
+
+        if not canRestart(
+            restartTimes, now, settings["maxRestarts"], settings["backoffMinutes"]
+        ):
+            logger.warning(
+                f"{hostname}: Not restarting, already restarted {len(restartTimes)}"
+                " time(s)"
+            )
+            continue
+
+        connection = connectHost(sensors[hostname], "sensor", sudoUser)
+
+        if restartTPot(connection):
+            logger.info(f"{hostname}: Restarted tpot service")
+
+        connection.close()
+        restartTimes.append(now.isoformat())
+
+    return silent
+
+
+if __name__ == "__main__":
+    # command-line argument is the network's workspace directory, same as
+    # updateCerts.py
+    workspace = sys.argv[1]
+
+    logging.basicConfig(
+        filename=os.path.join(workspace, "watchdog.log"),
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+
+    with open(os.path.join(workspace, "credentials.json")) as f:
+        credentials = json.load(f)
+
+    with open(os.path.join(workspace, "passwords.txt")) as f:
+        elasticPass = findPassword(f.read(), "elastic")
+
+    try:
+        with open(os.path.join(workspace, WATCHDOG_STATE)) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = {}
+
+    logCreds = credentials["logging"]
+
+    superviseSensors(
+        f"{logCreds['host']}:64298",
+        "elastic",
+        elasticPass,
+        credentials["sensors"],
+        credentials["sudouser"],
+        {**DEFAULT_WATCHDOG, **logCreds.get("watchdog", {})},
+        state,
+        datetime.now(timezone.utc),
+    )
+
+    with open(os.path.join(workspace, WATCHDOG_STATE), "w") as f:
+        json.dump(state, f)
@@ -0,0 +1,230 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from errors import StepGraphError
+
+# Scheduler running a deployment described as a graph of steps. Each step declares
+# the values it needs (inputs) and the values it produces (outputs), and runs as soon
+# as all of its inputs exist, so independent work (such as certificate issuance and
+# sensor installs) overlaps. See deployNetwork in fabfile.py
+
+
+def createStep(name, func, inputs=None, outputs=None):
+    """Describe a step of a deployment
+
+    :name: unique name of step, used in logs and the critical path
+    :func: function taking a dictionary mapping input names to their values and
+    returning a dictionary mapping output names to their values (or None if the step
+    has no outputs)
+    :inputs: optional, list of names of values the step needs. Defaults to none
+    :outputs: optional, list of names of values the step produces. Defaults to none
+    :returns: step dictionary with name, func, inputs and outputs keys
+
+    """
+    return {
+        "name": name,
+        "func": func,
+        "inputs": list(inputs or []),
+        "outputs": list(outputs or []),
+    }
+
+
+def topologicalOrder(dependencies):
+    """Order steps so that every step comes after the steps it depends on
+
+    :dependencies: dictionary mapping step names to sets of names of steps they
+    depend on
+    :returns: list of step names
+    :raises StepGraphError: if steps depend on each other in a cycle
+
+    """
+    remaining = {name: set(deps) for name, deps in dependencies.items()}
+    order = []
+
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+
+        if not ready:
+            raise StepGraphError(
+                f"Steps {', '.join(sorted(remaining))} depend on each other"
+            )
+
+        for name in ready:
+            del remaining[name]
+
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+        order += ready
+
+    return order
+
+
+def findDependencies(steps, initialValues=None):
+    """Find the steps every step has to wait for, from their inputs and outputs
+
+    :steps: list of step dictionaries (as returned by createStep)
+    :initialValues: optional, dictionary of values available before any step runs
+    :returns: dictionary mapping step names to sets of names of the steps producing
+    their inputs
+    :raises StepGraphError: if two steps have the same name, a value is produced
+    twice, an input is produced by no step or steps depend on each other in a cycle
+
+    """
+    producers = dict.fromkeys(initialValues or {})
+
+    for step in steps:
+        if any(other["name"] == step["name"] for other in steps if other is not step):
+            raise StepGraphError(f"Step {step['name']} is defined more than once")
+
+        for output in step["outputs"]:
+            if output in producers:
+                raise StepGraphError(
+                    f"Step {step['name']} produces {output}, which already exists"
+                )
+
+            producers[output] = step["name"]
+
+    dependencies = {}
+
+    for step in steps:
+        missing = [name for name in step["inputs"] if name not in producers]
+
+        if missing:
+            raise StepGraphError(
+                f"Step {step['name']} needs {', '.join(missing)}, which no step"
+                " produces"
+            )
+
+        dependencies[step["name"]] = {
+            producers[name] for name in step["inputs"] if producers[name] is not None
+        }
+
+    topologicalOrder(dependencies)
+
+    return dependencies
+
+
+def runSteps(steps, initialValues=None, workers=8):
+    """Run steps in parallel as soon as their inputs exist
+
+    :steps: list of step dictionaries (as returned by createStep)
+    :initialValues: optional, dictionary of values available before any step runs
+    :workers: optional, number of steps to run at once. Defaults to 8
+    :returns: tuple of the form (dictionary of all values, dictionary mapping step
+    names to tuples of the form (start, end) in seconds since the run started)
+    :raises StepGraphError: if the steps don't form a valid graph (see
+    findDependencies) or a step doesn't return its outputs. Exceptions raised by a
+    step are raised again once the steps already running finish, without starting
+    any other step. Either way, once steps ran the exception gets stepValues and
+    stepTimings attributes, like the tuple returned on success, with the timings of
+    the failed steps too
+
+    """
+    dependencies = findDependencies(steps, initialValues)
+    values = dict(initialValues or {})
+    timings = {}
+    pending = list(steps)
+    running = {}
+    failure = None
+    starts = {}
+    runStart = time.monotonic()
+
+    def runStep(step, inputs):
+        start = time.monotonic() - runStart
+        starts[step["name"]] = start
+        outputs = step["func"](inputs) or {}
+
+        return start, time.monotonic() - runStart, outputs
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            if failure is None:
+                for step in [
+                    step
+                    for step in pending
+                    if dependencies[step["name"]] <= timings.keys()
+                ]:
+                    inputs = {name: values[name] for name in step["inputs"]}
+                    running[executor.submit(runStep, step, inputs)] = step
+                    pending.remove(step)
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                step = running.pop(future)
+
+                try:
+                    start, end, outputs = future.result()
+                # errors of this project subclass BaseException
+                except BaseException as e:
+                    failure = failure or e
+                    # the failed step ends the critical path of a failed run
+                    timings[step["name"]] = (
+                        starts[step["name"]],
+                        time.monotonic() - runStart,
+                    )
+                    continue
+
+                if set(outputs) != set(step["outputs"]):
+                    returned = ", ".join(outputs) or "nothing"
+                    failure = failure or StepGraphError(
+                        f"Step {step['name']} returned {returned} instead of"
+                        f" {', '.join(step['outputs']) or 'nothing'}"
+                    )
+                    timings[step["name"]] = (start, end)
+                    continue
+
+                values.update(outputs)
+                timings[step["name"]] = (start, end)
+
+    if failure is not None:
+        # so callers can still report the run and clean up after the steps that ran
+        failure.stepValues = values
+        failure.stepTimings = timings
+        raise failure
+
+    return values, timings
+
+
+def criticalPath(dependencies, timings):
+    """Find the chain of steps that determined how long a run took, going back from
+    the step that finished last to the dependency that finished last at every step
+
+    :dependencies: dependencies of steps (as returned by findDependencies)
+    :timings: start and end times of steps (as returned by runSteps)
+    :returns: list of step names, first step first
+
+    """
+    if not timings:
+        return []
+
+    path = [max(timings, key=lambda name: timings[name][1])]
+
+    while dependencies[path[-1]]:
+        path.append(max(dependencies[path[-1]], key=lambda name: timings[name][1]))
+
+    return path[::-1]
+
+
+def formatCriticalPath(path, timings):
+    """Describe a critical path with the time each of its steps took
+
+    :path: list of step names (as returned by criticalPath)
+    :timings: start and end times of steps (as returned by runSteps)
+    :returns: list of lines, one per step of path and a total
+
+    """
+    lines = [
+        f"{name}: {timings[name][1] - timings[name][0]:.0f}s"
+        f" (from {timings[name][0]:.0f}s to {timings[name][1]:.0f}s)"
+        for name in path
+    ]
+
+    if path:
+        lines.append(f"total: {timings[path[-1]][1]:.0f}s")
+
+    return lines
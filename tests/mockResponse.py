@@ -5,6 +5,7 @@ DUMMY_ID = 523529
 DUMMY_TOKEN = "dummyToken"
 DUMMY_IP = "0.0.0.0"
 DUMMY_REGION = "region"
+DUMMY_RANGE = "10.10.0.0/20"
 DUMMY_HEADER = {"Authorization": f"Bearer {DUMMY_TOKEN}"}
 
 
@@ -13,10 +14,17 @@ class MockResponse:
     """Class mocking requests.Response class for use in testing"""
 
     def __init__(
-        self, statusError=False, kwargsDict=None, jsonType=None, userRoleCreated=True
+        self,
+        statusError=False,
+        kwargsDict=None,
+        jsonType=None,
+        userRoleCreated=True,
+        statusCode=None,
     ):
         # choose whether to throw HTTPError when raise_for_status() called
         self.status_error = statusError
+        # some functions check specific status codes before raise_for_status()
+        self.status_code = statusCode or (400 if statusError else 200)
         # choose which type of JSON to return (tailored to different API endpoints)
         self.jsonType = jsonType
         # whether T-Pot user/role was created (for test_deploymentHelpers.py)
@@ -64,10 +72,67 @@ class MockResponse:
             }
         elif self.jsonType == "createVM":
             return {"droplet": {"id": DUMMY_ID}}
+        elif self.jsonType == "vpcs":
+            return {
+                "vpcs": [
+                    {"name": "other", "id": "otherId", "ip_range": "10.1.0.0/20"},
+                    {"name": "tpot-logger", "id": DUMMY_ID, "ip_range": DUMMY_RANGE},
+                ]
+            }
+        elif self.jsonType == "createVPC":
+            return {"vpc": {"name": "new", "id": DUMMY_ID, "ip_range": DUMMY_RANGE}}
         elif self.jsonType == "createRole":
             return {"role": {"created": self.userRoleCreated}}
         elif self.jsonType == "createUser":
             return {"created": self.userRoleCreated}
+        elif self.jsonType == "acknowledged":
+            return {"acknowledged": self.userRoleCreated}
+        elif self.jsonType == "nodesProcess":
+            return {
+                "nodes": {
+                    "nodeId": {
+                        "name": "node1",
+                        # reuse userRoleCreated to choose whether tuning applied
+                        "process": {
+                            "mlockall": self.userRoleCreated,
+                            "max_file_descriptors": 65535,
+                        },
+                    }
+                }
+            }
+        elif self.jsonType == "catAllocation":
+            return [
+                {"node": "node1", "disk.used": "600", "disk.total": "1000"},
+                {"node": "node2", "disk.used": "200", "disk.total": "1000"},
+                {"node": "UNASSIGNED", "disk.used": None, "disk.total": None},
+            ]
+        elif self.jsonType == "dataStreams":
+            return {
+                "data_streams": [
+                    {
+                        "name": "tpot-cowrie",
+                        "indices": [
+                            {"index_name": ".ds-tpot-cowrie-000001"},
+                            {"index_name": ".ds-tpot-cowrie-000002"},
+                        ],
+                    }
+                ]
+            }
+        elif self.jsonType == "catIndices":
+            return [
+                {
+                    "index": ".ds-tpot-cowrie-000001",
+                    "creation.date": "1000",
+                    "store.size": "500",
+                },
+                {
+                    "index": ".ds-tpot-cowrie-000002",
+                    "creation.date": "2000",
+                    "store.size": None,
+                },
+            ]
+        elif self.jsonType == "importObjects":
+            return {"success": self.userRoleCreated, "successCount": 1, "errors": []}
         elif self.jsonType == "deleteSSHKey":
             return {
                 "ssh_keys": [
@@ -0,0 +1,160 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import canaryProbe
+import pytest
+from errors import BadAPIRequestError
+
+from .mockResponse import MockResponse
+
+dummyUrl = "dummyhost:64298"
+dummyUser = "dummyUser"
+dummyPass = "dummyPass"
+
+
+def probeResult(host, hoursAgo=0, searchableMs=None, error=None):
+    result = {
+        "time": (datetime.now(timezone.utc) - timedelta(hours=hoursAgo)).isoformat(),
+        "host": host,
+        "type": "Cowrie",
+    }
+
+    if error is None:
+        result["searchableMs"] = searchableMs
+    else:
+        result["error"] = error
+
+    return result
+
+
+class TestChooseCanaryType:
+    @pytest.mark.parametrize(
+        "profile, expected",
+        [
+            (None, "Cowrie"),
+            ("small", "Cowrie"),
+            ("web", "ElasticPot"),
+            ("ics", "ConPot"),
+        ],
+    )
+    def test_profiles(self, profile, expected):
+        sensor = {"host": "sensor.example.com", "profile": profile}
+
+        assert canaryProbe.chooseCanaryType(sensor) == expected
+
+
+class TestWriteCanary:
+    def test_appends_json_line(self, mocker):
+        """Event survives the shell quoting and keeps the canary id in an allowlisted
+        field
+
+        """
+        mocker.patch("canaryProbe.runCommand", return_value=(0, ""))
+        timestamp = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+        assert canaryProbe.writeCanary("conn", "ElasticPot", "abc123", timestamp)
+
+        command = canaryProbe.runCommand.call_args[0][1]
+        assert command.endswith(">> /data/elasticpot/log/elasticpot.json'")
+        eventStr = command.split("echo ", 1)[1].rsplit(" >>", 1)[0]
+        event = json.loads(json.loads(eventStr))
+        assert event["user_agent"] == "abc123"
+        assert event["timestamp"] == timestamp.isoformat()
+        assert event["tpot_canary"] is True
+
+    def test_unreachable(self, mocker):
+        mocker.patch("canaryProbe.runCommand", return_value=(None, "timed out"))
+
+        assert not canaryProbe.writeCanary(
+            "conn", "Cowrie", "abc123", datetime.now(timezone.utc)
+        )
+
+
+class TestFindCanary:
+    def test_found(self, mocker):
+        mocker.patch("canaryProbe.requests.post", return_value=MockResponse())
+        mocker.patch.object(
+            MockResponse,
+            "json",
+            return_value={"hits": {"hits": [{"_source": {"ingest_latency_ms": 800}}]}},
+        )
+
+        event = canaryProbe.findCanary(
+            dummyUrl, dummyUser, dummyPass, "ElasticPot", "abc123"
+        )
+
+        assert event == {"ingest_latency_ms": 800}
+        args, kwargs = canaryProbe.requests.post.call_args
+        assert args[0] == f"https://{dummyUrl}/tpot-elasticpot/_search"
+        assert kwargs["json"]["query"] == {"match": {"http_user_agent": "abc123"}}
+
+    def test_not_indexed_yet(self, mocker):
+        mocker.patch("canaryProbe.requests.post", return_value=MockResponse())
+        mocker.patch.object(MockResponse, "json", return_value={"hits": {"hits": []}})
+
+        assert (
+            canaryProbe.findCanary(dummyUrl, dummyUser, dummyPass, "Cowrie", "abc123")
+            is None
+        )
+
+    def test_bad_request(self, mocker):
+        mocker.patch(
+            "canaryProbe.requests.post", return_value=MockResponse(statusError=True)
+        )
+
+        with pytest.raises(BadAPIRequestError):
+            canaryProbe.findCanary(dummyUrl, dummyUser, dummyPass, "Cowrie", "abc123")
+
+
+class TestProbeSensor:
+    def test_retries_write_then_polls(self, mocker):
+        """Writing is retried while the sensor reboots, then ES is polled"""
+        mocker.patch("canaryProbe.time.sleep")
+        mocker.patch("canaryProbe.writeCanary", side_effect=[False, True])
+        mocker.patch(
+            "canaryProbe.findCanary", side_effect=[None, {"ingest_latency_ms": 900}]
+        )
+        sensor = {"host": "sensor.example.com", "profile": "ssh"}
+
+        result = canaryProbe.probeSensor("conn", sensor, dummyUrl, dummyUser, dummyPass)
+
+        assert result["type"] == "Cowrie"
+        assert result["ingestLatencyMs"] == 900
+        assert result["searchableMs"] >= 0
+        assert "error" not in result
+        assert canaryProbe.writeCanary.call_count == 2
+        assert canaryProbe.findCanary.call_count == 2
+
+    def test_not_searchable(self, mocker):
+        mocker.patch("canaryProbe.time.sleep")
+        mocker.patch("canaryProbe.writeCanary", return_value=True)
+        mocker.patch("canaryProbe.findCanary", return_value=None)
+        sensor = {"host": "sensor.example.com"}
+
+        result = canaryProbe.probeSensor(
+            "conn", sensor, dummyUrl, dummyUser, dummyPass, timeout=0
+        )
+
+        assert result["error"] == "not searchable after 0s"
+
+
+class TestSummarizeProbes:
+    def test_percentiles(self):
+        results = [
+            probeResult("a", searchableMs=ms) for ms in range(100, 1100, 100)
+        ] + [probeResult("a", error="not searchable after 120s")]
+
+        summary = canaryProbe.summarizeProbes(results)
+
+        assert summary["a"] == {"probes": 11, "failed": 1, 50: 500, 95: 1000, 99: 1000}
+
+    def test_old_and_failed_only(self):
+        results = [
+            probeResult("a", hoursAgo=48, searchableMs=100),
+            probeResult("b", error="could not write canary event"),
+        ]
+
+        summary = canaryProbe.summarizeProbes(results, hours=24)
+
+        assert "a" not in summary
+        assert summary["b"] == {"probes": 1, "failed": 1, 50: None, 95: None, 99: None}
@@ -0,0 +1,154 @@
+import capacityPlanner
+import pytest
+from errors import BadAPIRequestError
+
+from .mockResponse import MockResponse
+
+dummyUrl = "dummyhost:64298"
+dummyUser = "dummyUser"
+dummyPass = "dummyPass"
+
+SEARCH_PAGES = [
+    {
+        "aggregations": {
+            "sensors": {
+                "after_key": {"sensor": "sensor1"},
+                "buckets": [
+                    {
+                        "key": {"sensor": "sensor1"},
+                        "doc_count": 7200,
+                        "peakInterval": {"value": 600},
+                    }
+                ],
+            }
+        }
+    },
+    {
+        "aggregations": {
+            "sensors": {
+                "after_key": {"sensor": "sensor2"},
+                "buckets": [
+                    {
+                        "key": {"sensor": "sensor2"},
+                        "doc_count": 36,
+                        "peakInterval": {"value": 6},
+                    }
+                ],
+            }
+        }
+    },
+    {"aggregations": {"sensors": {"buckets": []}}},
+]
+STATS_JSON = {
+    "nodes": {
+        "nodeId": {
+            "name": "logger",
+            "os": {"cpu": {"percent": 90}},
+            "jvm": {"mem": {"heap_used_percent": 50}},
+            "fs": {"total": {"total_in_bytes": 1000, "available_in_bytes": 400}},
+        }
+    }
+}
+
+
+class TestGetSensorRates:
+    def test_rates(self, mocker):
+        """Turn per-sensor counts into average and busiest-minute events/sec, page
+        by page
+
+        """
+        mocker.patch("capacityPlanner.requests.post", return_value=MockResponse())
+        mocker.patch.object(MockResponse, "json", side_effect=SEARCH_PAGES)
+
+        rates = capacityPlanner.getSensorRates(dummyUrl, dummyUser, dummyPass, hours=1)
+
+        assert rates == {"sensor1": (2, 10), "sensor2": (0.01, 0.1)}
+        assert capacityPlanner.requests.post.call_count == 3
+        query = capacityPlanner.requests.post.call_args[1]["json"]
+        assert query["query"]["range"]["@timestamp"]["gte"] == "now-1h"
+        assert query["aggs"]["sensors"]["composite"]["after"] == {"sensor": "sensor2"}
+
+    @pytest.mark.parametrize("hours, interval", [(24, "1m"), (168, "7m"), (25, "2m")])
+    def test_bucket_limit(self, mocker, hours, interval):
+        """Keep every search under search.max_buckets however long the period"""
+        mocker.patch("capacityPlanner.requests.post", return_value=MockResponse())
+        mocker.patch.object(MockResponse, "json", return_value=SEARCH_PAGES[-1])
+
+        capacityPlanner.getSensorRates(dummyUrl, dummyUser, dummyPass, hours=hours)
+
+        sensorsAgg = capacityPlanner.requests.post.call_args[1]["json"]["aggs"][
+            "sensors"
+        ]
+        histogram = sensorsAgg["aggs"]["perInterval"]["date_histogram"]
+        assert histogram["fixed_interval"] == interval
+        bucketsPerSensor = hours * 60 // int(interval[:-1]) + 2
+        assert sensorsAgg["composite"]["size"] * bucketsPerSensor < 65536
+
+    def test_bad_request(self, mocker):
+        """Get sensor rates with bad API request"""
+        mocker.patch(
+            "capacityPlanner.requests.post",
+            return_value=MockResponse(statusError=True),
+        )
+
+        with pytest.raises(BadAPIRequestError):
+            capacityPlanner.getSensorRates(dummyUrl, dummyUser, dummyPass)
+
+
+class TestGetNodeUsage:
+    def test_usage(self, mocker):
+        """Read CPU, heap and disk usage percentages from node stats"""
+        mocker.patch("capacityPlanner.requests.get", return_value=MockResponse())
+        mocker.patch.object(MockResponse, "json", return_value=STATS_JSON)
+
+        usage = capacityPlanner.getNodeUsage(dummyUrl, dummyUser, dummyPass)
+
+        assert usage == {"logger": {"cpu": 90, "heap": 50, "disk": 60}}
+
+
+class TestRecommendSize:
+
+    tiers = [("small", 100), ("medium", 400), ("large", 1000)]
+
+    def test_smallest_with_headroom(self):
+        assert capacityPlanner.recommendSize(50, self.tiers) == "small"
+        assert capacityPlanner.recommendSize(51, self.tiers) == "medium"
+
+    def test_too_busy(self):
+        assert capacityPlanner.recommendSize(5000, self.tiers) == "large"
+
+    def test_overloaded(self):
+        assert capacityPlanner.recommendSize(10, self.tiers, True) == "medium"
+        assert capacityPlanner.recommendSize(400, self.tiers, True) == "large"
+
+
+class TestPlanCapacity:
+    def test_plan(self):
+        """Size sensors by their own rate and logging nodes by the combined rate"""
+        loggingObj = {
+            "host": "logger.example.com",
+            "nodes": [{"host": "node.example.com", "size": "s-8vcpu-16gb"}],
+        }
+        sensorObjs = [
+            {"host": "sensor1.example.com"},
+            {"host": "sensor2.example.com", "shipper": "filebeat"},
+            {"host": "sensor3.example.com", "size": "s-4vcpu-8gb"},
+        ]
+        sensorRates = {"sensor1": (100, 400), "sensor2": (1, 2)}
+        nodeUsage = {"logger": {"cpu": 90, "heap": 50, "disk": 60}}
+
+        plan = capacityPlanner.planCapacity(
+            loggingObj, sensorObjs, sensorRates, nodeUsage
+        )
+
+        assert [(row["host"], row["current"], row["recommended"]) for row in plan] == [
+            ("sensor1.example.com", "s-2vcpu-4gb", "s-4vcpu-8gb"),
+            ("sensor2.example.com", "s-1vcpu-2gb", "s-1vcpu-2gb"),
+            ("sensor3.example.com", "s-4vcpu-8gb", "s-2vcpu-4gb"),
+            ("logger.example.com", "s-4vcpu-8gb", "s-8vcpu-16gb"),
+            ("node.example.com", "s-8vcpu-16gb", "s-4vcpu-8gb"),
+        ]
+        # combined peak of 402 events/sec split over 2 data nodes
+        assert plan[-1]["peak"] == 201
+        assert plan[2]["notes"] == "no events measured"
+        assert plan[3]["notes"] == "cpu 90%"
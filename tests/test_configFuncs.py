@@ -0,0 +1,369 @@
+import re
+
+import pytest
+from configFuncs import (applyTemplateBlocks, createElasticsearchYml,
+                         createFilebeatYml, createHostTuningProfile,
+                         createLogstashConf, createPruneFilters,
+                         createRelayConf, createSensorCompose,
+                         createUpdateCertsSh, findUncoveredFields,
+                         loadFieldAllowlist, loadHoneypotProfiles,
+                         parseFileInputs, profileHoneypots,
+                         renderCentralLogstashConf, renderElasticsearchYml,
+                         renderKibanaYml, renderRelayConf, renderShipperConf,
+                         renderTemplate, shipperConfPath)
+from deploymentHelpers import HONEYPOT_TYPES
+from errors import UnknownProfileError, UnresolvedPlaceholderError
+
+TEMPLATE = """filter {
+# BEGIN_BLOCK first
+  first {}
+# END_BLOCK first
+# BEGIN_BLOCK second
+  second {}
+# END_BLOCK second
+}
+"""
+
+
+class TestApplyTemplateBlocks:
+
+    """Test configFuncs.applyTemplateBlocks function"""
+
+    def test_keep_all_blocks(self):
+        assert applyTemplateBlocks(TEMPLATE, []) == (
+            "filter {\n  first {}\n  second {}\n}\n"
+        )
+
+    def test_remove_one_block(self):
+        assert applyTemplateBlocks(TEMPLATE, ["first"]) == "filter {\n  second {}\n}\n"
+
+    def test_remove_all_blocks(self):
+        assert applyTemplateBlocks(TEMPLATE, ["first", "second"]) == "filter {\n}\n"
+
+    def test_remove_repeated_block(self):
+        text = TEMPLATE + TEMPLATE.replace("second", "first")
+        assert applyTemplateBlocks(text, ["first"]) == (
+            "filter {\n  second {}\n}\nfilter {\n}\n"
+        )
+
+
+class TestFieldAllowlist:
+
+    """Test configFuncs field allowlist functions"""
+
+    allowlist = {
+        "common": ["@timestamp", "geoip"],
+        "Cowrie": ["http.url", "eventid"],
+        "Dionaea": ["username"],
+    }
+
+    def test_uncovered_fields(self):
+        """A Cowrie field only Dionaea keeps is still uncovered"""
+        used = {
+            None: {"geoip.country_name", "eventid", "username", "geoipx"},
+            "Cowrie": {"http.url", "username"},
+            "Dionaea": {"geoip.asn", "username"},
+        }
+        assert findUncoveredFields(used, self.allowlist) == {
+            None: ["geoipx"],
+            "Cowrie": ["username"],
+        }
+
+    def test_all_fields_covered(self):
+        """Types without an allowlist keep every field"""
+        used = {None: {"@timestamp", "geoip.asn"}, "Fatt": {"anything"}}
+        assert findUncoveredFields(used, self.allowlist) == {}
+
+    def test_prune_filters(self):
+        pruneText = createPruneFilters(self.allowlist)
+        assert 'if [type] == "common"' not in pruneText
+        assert (
+            '  if [type] == "Cowrie" {\n    prune {\n      whitelist_names => '
+            '["^@timestamp$", "^geoip$", "^http\\.url$", "^eventid$"]\n    }\n  }'
+        ) in pruneText
+
+    def test_allowlist_types_match_template(self):
+        with open("configFiles/logstash.conf.template") as f:
+            templateTypes = set(re.findall(r'\btype => "(\w+)"', f.read()))
+
+        assert set(loadFieldAllowlist()) - {"common"} == templateTypes
+        assert set(HONEYPOT_TYPES) == templateTypes
+
+
+class TestFilebeatShipper:
+
+    """Test configFuncs functions for sensors shipping raw events with Filebeat"""
+
+    def test_parse_file_inputs(self):
+        with open("configFiles/logstash.conf.template") as f:
+            fileInputs = parseFileInputs(f.read())
+
+        assert {honeypotType for honeypotType, _, _ in fileInputs} == set(
+            HONEYPOT_TYPES
+        )
+        assert ("Cowrie", ["/data/cowrie/log/cowrie.json"], "json") in fileInputs
+        assert ("Rdpy", ["/data/rdpy/log/rdpy.log"], "plain") in fileInputs
+
+    def test_filebeat_yml(self):
+        filebeatYml = createFilebeatYml("logger.example.com")
+
+        assert filebeatYml.count("  - type: log\n") == len(HONEYPOT_TYPES)
+        assert '    paths: ["/data/conpot/log/*.json"]\n' in filebeatYml
+        assert 'hosts: ["logger.example.com:5044"]' in filebeatYml
+
+    def test_central_logstash_conf(self):
+        logConf = createLogstashConf(
+            ["logger.example.com"],
+            "/certs/fullchain.pem",
+            "user",
+            "pass",
+            beatsCerts=("/certs/fullchain.pem", "/certs/privkey.pem"),
+        )
+
+        assert 'ssl_key => "/certs/privkey.pem"' in logConf
+        assert "  file {" not in logConf
+        assert "${MY_" not in logConf
+        assert '"dest_ip" => "%{t-pot_ip_ext}"' in logConf
+        assert "mmdb" not in logConf
+        assert 'default_database_type => "ASN"' in logConf
+        # events forwarded by relays get decoded too
+        assert 'source => "line"' in logConf
+        assert "BLOCK" not in logConf
+
+    def test_relay_conf(self):
+        relayConf = createRelayConf("logger.example.com", "/c/full", "/c/key")
+
+        assert 'hosts => ["logger.example.com"]' in relayConf
+        assert 'ssl_key => "/c/key"' in relayConf
+        assert "{{" not in relayConf
+
+    def test_sensor_logstash_conf(self):
+        logConf = createLogstashConf(["a.example.com"], "/c", "u", "p")
+
+        assert "beats {" not in logConf
+        assert '"t-pot_hostname" => "${MY_HOSTNAME}"' in logConf
+        assert "GeoLite2-ASN.mmdb" in logConf
+        assert "default_database_type" not in logConf
+        assert "prune {" not in logConf
+        assert "BLOCK" not in logConf
+
+
+class TestHoneypotProfiles:
+
+    """Test configFuncs functions for honeypot selection profiles"""
+
+    composeText = (
+        "services:\n\n"
+        "# Logstash service\n"
+        "  logstash:\n"
+        "    image: logstash\n\n"
+        "# Cowrie service\n"
+        "  cowrie:\n"
+        "    image: cowrie\n\n"
+        "# Tanner redis service\n"
+        "  tanner_redis:\n"
+        "    image: redis\n\n"
+        "# Snare service\n"
+        "  snare:\n"
+        "    image: snare\n"
+    )
+
+    def test_profiles_match_honeypot_types(self):
+        honeypotProfiles = loadHoneypotProfiles()
+
+        assert set(honeypotProfiles["services"]) == set(HONEYPOT_TYPES)
+
+        for profile in honeypotProfiles["profiles"]:
+            assert set(profileHoneypots(honeypotProfiles, profile)) <= set(
+                HONEYPOT_TYPES
+            )
+
+    def test_default_profile(self):
+        assert sorted(profileHoneypots(loadHoneypotProfiles(), None)) == sorted(
+            HONEYPOT_TYPES
+        )
+
+    def test_unknown_profile(self):
+        with pytest.raises(UnknownProfileError):
+            profileHoneypots(loadHoneypotProfiles(), "nonexistent")
+
+    def test_sensor_compose(self):
+        composeText = createSensorCompose(self.composeText, "ssh")
+
+        assert "  cowrie:\n" in composeText
+        assert "  logstash:\n" in composeText
+        assert "tanner_redis" not in composeText
+        assert "snare" not in composeText
+
+    def test_sensor_compose_filebeat(self):
+        composeText = createSensorCompose(self.composeText, shipper="filebeat")
+
+        assert "  filebeat:\n" in composeText
+        assert "  logstash:\n" not in composeText
+        assert "  snare:\n" in composeText
+
+    def test_profile_logstash_conf(self):
+        logConf = createLogstashConf(["a.example.com"], "/c", "u", "p", profile="web")
+
+        assert set(re.findall(r'type => "(\w+)"', logConf)) == set(
+            loadHoneypotProfiles()["profiles"]["web"]
+        )
+        assert 'if [type] == "Tanner" {' in logConf
+        assert 'if [type] == "Cowrie" {' not in logConf
+        assert "BLOCK" not in logConf
+
+    def test_profile_filebeat_yml(self):
+        filebeatYml = createFilebeatYml("logger.example.com", "ssh")
+
+        assert filebeatYml.count("  - type: log\n") == 1
+        assert "      type: Cowrie\n" in filebeatYml
+
+
+class TestElasticsearchYml:
+
+    """Test configFuncs.createElasticsearchYml over public and private networks"""
+
+    loggingNodes = [{"host": "logger.example.com"}, {"host": "node.example.com"}]
+
+    def createYml(self, privateNetwork):
+        return createElasticsearchYml(
+            "/key",
+            "/cert",
+            "/full",
+            self.loggingNodes[1],
+            self.loggingNodes,
+            privateNetwork,
+        )
+
+    def test_public_network(self):
+        elasticYml = self.createYml(False)
+
+        assert "network.publish_host: node.example.com\n" in elasticYml
+        assert '["logger.example.com", "node.example.com"]' in elasticYml
+
+    def test_private_network(self):
+        elasticYml = self.createYml(True)
+
+        assert "network.publish_host: node-vpc.example.com\n" in elasticYml
+        assert '["logger-vpc.example.com", "node-vpc.example.com"]' in elasticYml
+        assert "node.name: node\n" in elasticYml
+
+
+class TestWorkspaces:
+
+    """Test that several networks can be deployed from one server"""
+
+    def test_update_certs_sh(self):
+        updateCertsSh = createUpdateCertsSh(
+            "/opt/deploy-t-pot", "deployer", "/srv/networks/a", "logger.a.com"
+        )
+
+        assert '"/etc/letsencrypt/live/logger.a.com" ]' in updateCertsSh
+        assert (
+            "python3 /opt/deploy-t-pot/updateCerts.py /srv/networks/a\n"
+            in updateCertsSh
+        )
+
+    def test_templates_outside_project(self, tmp_path, monkeypatch):
+        """Templates are found from any working directory, such as a workspace"""
+        monkeypatch.chdir(tmp_path)
+
+        assert "logstash.example.com" in createRelayConf(
+            "logstash.example.com", "/cert", "/key"
+        )
+
+
+class TestRenderTemplate:
+
+    """Test configFuncs.renderTemplate function"""
+
+    def writeTemplate(self, tmp_path, text):
+        templatePath = tmp_path / "test.template"
+        templatePath.write_text(text)
+
+        return str(templatePath)
+
+    def test_single_pass(self, tmp_path):
+        """Values containing placeholders are inserted as is"""
+        templatePath = self.writeTemplate(tmp_path, "a: {{A}}\nb: {{B}} {{A}}\n")
+
+        rendered = renderTemplate(templatePath, {"A": "{{B}}", "B": 2})
+
+        assert rendered == "a: {{B}}\nb: 2 {{B}}\n"
+
+    def test_unresolved_placeholder(self, tmp_path):
+        templatePath = self.writeTemplate(tmp_path, "{{A}} {{B}} {{C}}\n")
+
+        with pytest.raises(UnresolvedPlaceholderError, match="B, C"):
+            renderTemplate(templatePath, {"A": 1})
+
+    def test_removed_block_placeholders(self, tmp_path):
+        """Placeholders of removed blocks don't need values"""
+        templatePath = self.writeTemplate(
+            tmp_path, "# BEGIN_BLOCK first\n{{A}}\n# END_BLOCK first\n{{B}}\n"
+        )
+
+        assert renderTemplate(templatePath, {"B": 2}, ["first"]) == "2\n"
+        assert renderTemplate(templatePath, {"A": 1, "B": 2}) == "1\n2\n"
+
+    def test_host_tuning_profile(self):
+        tuningProfile = createHostTuningProfile("s-4vcpu-8gb")
+
+        assert tuningProfile["/etc/elasticsearch/jvm.options.d/heap.options"].endswith(
+            "-Xms4096m\n-Xmx4096m\n"
+        )
+        assert "/etc/sysctl.d/99-elasticsearch.conf" in tuningProfile
+
+
+class TestDeployedConfigs:
+
+    """Test the renderers fabfile.py and reconfigure.py share"""
+
+    logCreds = {"host": "logger.example.com", "vpc": True, "centralEnrichment": True}
+    relayObjs = [{"host": "relay.example.com", "region": "sgp1"}]
+
+    def test_elasticsearch_yml(self):
+        elasticYml = renderElasticsearchYml(self.logCreds, [self.logCreds], True)
+
+        assert "/etc/elasticsearch/certs/privkey.pem" in elasticYml
+        assert "logger-vpc.example.com" in elasticYml
+
+    def test_kibana_yml(self):
+        kibanaYml = renderKibanaYml("logger.example.com", "kibanaPass")
+
+        assert "/etc/kibana/certs/fullchain.pem" in kibanaYml
+        assert "kibanaPass" in kibanaYml
+
+    def test_central_logstash_conf(self):
+        logConf = renderCentralLogstashConf([self.logCreds], "tPotPass", True, True)
+
+        assert 'ssl_key => "/etc/logstash/certs/privkey.pem"' in logConf
+        assert '"https://logger-vpc.example.com:64298"' in logConf
+        assert "t_pot_geoip" in logConf
+
+    def test_relay_conf(self):
+        relayConf = renderRelayConf("logger-vpc.example.com")
+
+        assert 'hosts => ["logger-vpc.example.com"]' in relayConf
+        assert "/etc/logstash/certs/privkey.pem" in relayConf
+
+    def test_shipper_conf(self):
+        sensor = {"host": "s.example.com"}
+        logConf = renderShipperConf(sensor, self.logCreds, self.relayObjs, "tPotPass")
+
+        assert shipperConfPath() == "/data/elk/logstash.conf"
+        assert "/data/elk/fullchain.pem" in logConf
+        assert "'tPotPass'" in logConf
+
+    def test_filebeat_shipper_conf(self):
+        """Filebeat sensors ship through their region's relay, or to the logger"""
+        relayed = {"host": "a.example.com", "shipper": "filebeat", "region": "sgp1"}
+        direct = {"host": "b.example.com", "shipper": "filebeat"}
+
+        assert shipperConfPath("filebeat") == "/data/elk/filebeat.yml"
+        assert 'hosts: ["relay.example.com:5044"]' in renderShipperConf(
+            relayed, self.logCreds, self.relayObjs, "tPotPass"
+        )
+        assert 'hosts: ["logger-vpc.example.com:5044"]' in renderShipperConf(
+            direct, self.logCreds, self.relayObjs, "tPotPass"
+        )
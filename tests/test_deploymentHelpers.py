@@ -1,8 +1,18 @@
+import hashlib
+import json
 import string
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from zipfile import ZipFile
 
 import deploymentHelpers
 import pytest
-from errors import BadAPIRequestError, NotCreatedError
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from errors import BadAPIRequestError, HostTuningError, NotCreatedError
+from utils import findSavedObjectFields
 
 from .mockResponse import MockResponse
 
@@ -13,6 +23,29 @@ dummyPass = "dummyPass"
 createdRoleName = "t_pot_writer"
 createdUserName = "t_pot_internal"
 
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def selfSignedCert(hosts, expiresIn):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hosts[0])])
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(NOW - timedelta(days=30))
+        .not_valid_after(NOW + expiresIn)
+        .add_extension(
+            x509.SubjectAlternativeName([x509.DNSName(host) for host in hosts]),
+            critical=False,
+        )
+        .sign(key, hashes.SHA256())
+    )
+
+    return cert.public_bytes(serialization.Encoding.PEM).decode()
+
 
 class TestInstallPackages:
     def test_list_packages(self, mocker):
@@ -27,6 +60,27 @@ class TestInstallPackages:
         assert any([packageStr in command for command in posArgs])
 
 
+class TestPutFile:
+    def test_put_from_memory(self, mocker):
+        """Upload text from memory and move it into place"""
+        mockedConnection = mocker.MagicMock()
+
+        deploymentHelpers.putFile(
+            mockedConnection, "a: 1\n", "/etc/app/app.yml", "root:app", 640
+        )
+
+        fileObj = mockedConnection.put.call_args[0][0]
+        assert fileObj.read() == b"a: 1\n"
+        assert mockedConnection.put.call_args[1]["remote"] == "app.yml"
+        posArgs = [call[0][0] for call in mockedConnection.sudo.call_args_list]
+        assert posArgs == [
+            "mkdir -p /etc/app",
+            "mv app.yml /etc/app/app.yml",
+            "chown root:app /etc/app/app.yml",
+            "chmod 640 /etc/app/app.yml",
+        ]
+
+
 class TestCreateTPotRole:
     jsonType = "createRole"
 
@@ -140,3 +194,567 @@ class TestCreateTPotUser:
         )
         with pytest.raises(BadAPIRequestError):
             deploymentHelpers.createTPotUser(dummyUrl, dummyUser, creatorPwd=dummyPass)
+
+
+class TestCreateILMPolicy:
+    jsonType = "acknowledged"
+
+    def test_default_retention(self, mocker):
+        """Create ILM policy with default retention settings"""
+        mocker.patch(
+            "deploymentHelpers.requests.put",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                jsonType=__class__.jsonType
+            ),
+        )
+        policyName = deploymentHelpers.createILMPolicy(dummyUrl, dummyUser, dummyPass)
+
+        assert policyName in deploymentHelpers.requests.put.call_args[0][0]
+        phases = deploymentHelpers.requests.put.call_args[1]["json"]["policy"]["phases"]
+        defaults = deploymentHelpers.DEFAULT_RETENTION
+        rollover = phases["hot"]["actions"]["rollover"]
+        assert rollover["max_primary_shard_size"] == defaults["rolloverSize"]
+        assert rollover["max_age"] == defaults["rolloverAge"]
+        assert phases["warm"]["actions"]["forcemerge"]["max_num_segments"] == 1
+        assert phases["delete"]["min_age"] == defaults["deleteAfter"]
+
+    def test_partial_retention(self, mocker):
+        """Create ILM policy overriding only some retention settings"""
+        mocker.patch(
+            "deploymentHelpers.requests.put",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                jsonType=__class__.jsonType
+            ),
+        )
+        deploymentHelpers.createILMPolicy(
+            dummyUrl, dummyUser, dummyPass, {"deleteAfter": "30d"}
+        )
+
+        phases = deploymentHelpers.requests.put.call_args[1]["json"]["policy"]["phases"]
+        rollover = phases["hot"]["actions"]["rollover"]
+        assert phases["delete"]["min_age"] == "30d"
+        assert rollover["max_age"] == deploymentHelpers.DEFAULT_RETENTION["rolloverAge"]
+
+    def test_not_acknowledged_policy(self, monkeypatch):
+        """Try to create ILM policy but don't get it acknowledged"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "put",
+            lambda *args, **kwargs: MockResponse(
+                jsonType=__class__.jsonType, userRoleCreated=False
+            ),
+        )
+        with pytest.raises(NotCreatedError):
+            deploymentHelpers.createILMPolicy(dummyUrl, dummyUser, dummyPass)
+
+    def test_bad_request_policy(self, monkeypatch):
+        """Create ILM policy with bad API request"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "put",
+            lambda *args, **kwargs: MockResponse(
+                statusError=True, jsonType=__class__.jsonType
+            ),
+        )
+        with pytest.raises(BadAPIRequestError):
+            deploymentHelpers.createILMPolicy(dummyUrl, dummyUser, dummyPass)
+
+
+class TestCreateDataStreamTemplates:
+    jsonType = "acknowledged"
+
+    def test_per_type_retention(self, mocker):
+        """Create one template and policy per type, overriding retention of one type"""
+        mocker.patch(
+            "deploymentHelpers.requests.put",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                jsonType=__class__.jsonType
+            ),
+        )
+        streams = deploymentHelpers.createDataStreamTemplates(
+            dummyUrl,
+            dummyUser,
+            dummyPass,
+            {"deleteAfter": "14d", "perType": {"cowrie": {"deleteAfter": "30d"}}},
+        )
+
+        assert len(streams) == len(deploymentHelpers.HONEYPOT_TYPES)
+        assert "tpot-cowrie" in streams
+
+        calls = {
+            call[0][0].split("/", 3)[-1]: call[1].get("json")
+            for call in deploymentHelpers.requests.put.call_args_list
+        }
+        assert "_component_template/tpot-mappings" in calls
+        assert "_data_stream/tpot-cowrie" in calls
+        cowrieTemplate = calls["_index_template/tpot-cowrie"]
+        assert cowrieTemplate["data_stream"] == {}
+        assert cowrieTemplate["template"]["settings"]["index.lifecycle.name"] == (
+            "t_pot_cowrie_ilm_policy"
+        )
+        # ingest latency pipeline runs on every data stream
+        assert cowrieTemplate["template"]["settings"]["index.final_pipeline"] == (
+            deploymentHelpers.LATENCY_PIPELINE
+        )
+        latencyPipeline = f"_ingest/pipeline/{deploymentHelpers.LATENCY_PIPELINE}"
+        assert calls[latencyPipeline]["processors"][0]["set"]["field"] == (
+            "event_ingested"
+        )
+
+        cowriePhases = calls["_ilm/policy/t_pot_cowrie_ilm_policy"]["policy"]["phases"]
+        dionaeaPhases = calls["_ilm/policy/t_pot_dionaea_ilm_policy"]["policy"][
+            "phases"
+        ]
+        assert cowriePhases["delete"]["min_age"] == "30d"
+        assert dionaeaPhases["delete"]["min_age"] == "14d"
+
+    def test_not_acknowledged_template(self, monkeypatch):
+        """Try to create templates but don't get them acknowledged"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "put",
+            lambda *args, **kwargs: MockResponse(
+                jsonType=__class__.jsonType, userRoleCreated=False
+            ),
+        )
+        with pytest.raises(NotCreatedError):
+            deploymentHelpers.createDataStreamTemplates(dummyUrl, dummyUser, dummyPass)
+
+    def test_bad_request_template(self, monkeypatch):
+        """Create templates with bad API request"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "put",
+            lambda *args, **kwargs: MockResponse(
+                statusError=True, jsonType=__class__.jsonType
+            ),
+        )
+        with pytest.raises(BadAPIRequestError):
+            deploymentHelpers.createDataStreamTemplates(dummyUrl, dummyUser, dummyPass)
+
+
+class TestCreateSummaryTransforms:
+    jsonType = "acknowledged"
+
+    def test_create_and_start(self, mocker):
+        """Create and start one transform per summary index"""
+        mocker.patch(
+            "deploymentHelpers.requests.put",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                jsonType=__class__.jsonType
+            ),
+        )
+        mocker.patch("deploymentHelpers.requests.post", return_value=MockResponse())
+        summaryIndices = deploymentHelpers.createSummaryTransforms(
+            dummyUrl, dummyUser, dummyPass, {"summaryMaxAge": "90d"}
+        )
+
+        assert summaryIndices == ["tpotsummary-attacks", "tpotsummary-credentials"]
+        assert deploymentHelpers.requests.post.call_count == 2
+
+        transforms = [
+            call[1]["json"] for call in deploymentHelpers.requests.put.call_args_list
+        ]
+        for transform, summaryIndex in zip(transforms, summaryIndices):
+            groupBy = transform["pivot"]["group_by"]
+            assert transform["dest"]["index"] == summaryIndex
+            assert transform["source"]["index"] == ["tpot-*"]
+            assert groupBy["@timestamp"]["date_histogram"]["fixed_interval"] == "1m"
+            assert all(
+                group["terms"]["missing_bucket"]
+                for name, group in groupBy.items()
+                if name not in ["@timestamp", "type"]
+            )
+            assert transform["retention_policy"]["time"]["max_age"] == "90d"
+            assert (
+                deploymentHelpers.EXCLUDE_CANARY_QUERY
+                in transform["source"]["query"]["bool"]["filter"]
+            )
+
+    def test_not_acknowledged_transform(self, monkeypatch):
+        """Try to create transforms but don't get them acknowledged"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "put",
+            lambda *args, **kwargs: MockResponse(
+                jsonType=__class__.jsonType, userRoleCreated=False
+            ),
+        )
+        with pytest.raises(NotCreatedError):
+            deploymentHelpers.createSummaryTransforms(dummyUrl, dummyUser, dummyPass)
+
+    def test_bad_request_start(self, monkeypatch):
+        """Create transforms but fail to start them"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "put",
+            lambda *args, **kwargs: MockResponse(jsonType=__class__.jsonType),
+        )
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "post",
+            lambda *args, **kwargs: MockResponse(statusError=True),
+        )
+        with pytest.raises(BadAPIRequestError):
+            deploymentHelpers.createSummaryTransforms(dummyUrl, dummyUser, dummyPass)
+
+
+class TestCreateSummaryDashboardObjects:
+    def test_dashboard_references(self):
+        """Reference every visualization from the dashboard and summary index
+        patterns from the visualizations"""
+        objectsText = deploymentHelpers.createSummaryDashboardObjects(
+            "attacksPattern", "credentialsPattern"
+        )
+        savedObjects = [json.loads(line) for line in objectsText.splitlines()]
+        visualizations = [obj for obj in savedObjects if obj["type"] == "visualization"]
+        dashboard = savedObjects[-1]
+
+        assert dashboard["type"] == "dashboard"
+        assert [ref["id"] for ref in dashboard["references"]] == [
+            vis["id"] for vis in visualizations
+        ]
+        assert len(json.loads(dashboard["attributes"]["panelsJSON"])) == len(
+            visualizations
+        )
+        assert {vis["references"][0]["id"] for vis in visualizations} == {
+            "attacksPattern",
+            "credentialsPattern",
+        }
+        assert findSavedObjectFields(objectsText)[None] == {
+            "attacks",
+            "@timestamp",
+            "type",
+            "country",
+            "asn",
+            "as_org",
+            "dest_port",
+            "username",
+            "password",
+        }
+
+
+class TestCheckHostTuning:
+    jsonType = "nodesProcess"
+
+    def test_tuning_applied(self, monkeypatch):
+        """Check host tuning on node with memory locked and enough file descriptors"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "get",
+            lambda *args, **kwargs: MockResponse(jsonType=__class__.jsonType),
+        )
+        deploymentHelpers.checkHostTuning(dummyUrl, dummyUser, dummyPass)
+
+    def test_memory_not_locked(self, monkeypatch):
+        """Check host tuning on node without memory locked"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "get",
+            lambda *args, **kwargs: MockResponse(
+                jsonType=__class__.jsonType, userRoleCreated=False
+            ),
+        )
+        with pytest.raises(HostTuningError):
+            deploymentHelpers.checkHostTuning(dummyUrl, dummyUser, dummyPass)
+
+    def test_not_enough_file_descriptors(self, monkeypatch):
+        """Check host tuning requiring more file descriptors than allowed"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "get",
+            lambda *args, **kwargs: MockResponse(jsonType=__class__.jsonType),
+        )
+        with pytest.raises(HostTuningError):
+            deploymentHelpers.checkHostTuning(
+                dummyUrl, dummyUser, dummyPass, minFileDescriptors=100000
+            )
+
+
+class TestWaitForClusterNodes:
+    def test_nodes_joined(self, monkeypatch):
+        """Wait for nodes which all joined the cluster"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "get",
+            lambda *args, **kwargs: MockResponse(),
+        )
+        deploymentHelpers.waitForClusterNodes(dummyUrl, dummyUser, dummyPass, 3)
+
+    def test_nodes_timed_out(self, monkeypatch):
+        """Wait for nodes but time out before all of them joined the cluster"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "get",
+            lambda *args, **kwargs: MockResponse(statusError=True, statusCode=408),
+        )
+        with pytest.raises(NotCreatedError):
+            deploymentHelpers.waitForClusterNodes(dummyUrl, dummyUser, dummyPass, 3)
+
+
+class TestCreateEnrichPipeline:
+    jsonType = "acknowledged"
+
+    def test_good_pipeline(self, mocker):
+        """Create GeoIP/ASN ingest pipeline correctly"""
+        mocker.patch(
+            "deploymentHelpers.requests.put",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                jsonType=__class__.jsonType
+            ),
+        )
+        pipelineName = deploymentHelpers.createEnrichPipeline(
+            dummyUrl, dummyUser, dummyPass
+        )
+
+        assert pipelineName in deploymentHelpers.requests.put.call_args[0][0]
+        processors = deploymentHelpers.requests.put.call_args[1]["json"]["processors"]
+        geoipProcessors = [proc["geoip"] for proc in processors if "geoip" in proc]
+        # one lookup in the City database and one in the ASN database
+        assert len(geoipProcessors) == 2
+        assert all(proc["field"] == "src_ip" for proc in geoipProcessors)
+
+    def test_bad_request_pipeline(self, monkeypatch):
+        """Create ingest pipeline with bad API request"""
+        monkeypatch.setattr(
+            deploymentHelpers.requests,
+            "put",
+            lambda *args, **kwargs: MockResponse(
+                statusError=True, jsonType=__class__.jsonType
+            ),
+        )
+        with pytest.raises(BadAPIRequestError):
+            deploymentHelpers.createEnrichPipeline(dummyUrl, dummyUser, dummyPass)
+
+
+def zipObjects(objectsText):
+    """Zip saved objects the way the tpotce-light repository does"""
+    zipBuffer = BytesIO()
+
+    with ZipFile(zipBuffer, "w") as zf:
+        zf.writestr("kibana_export.ndjson", objectsText)
+
+    return zipBuffer.getvalue()
+
+
+class TestDownloadKibanaObjects:
+    def test_download_then_cache(self, mocker, tmp_path):
+        """Download export once, then reuse cached copy while the ETag matches"""
+        zipResp = mocker.Mock(
+            status_code=200,
+            content=zipObjects('{"id": "abc"}\n'),
+            headers={"ETag": '"etag1"'},
+        )
+        mocker.patch(
+            "deploymentHelpers.requests.get",
+            side_effect=[zipResp, mocker.Mock(status_code=304)],
+        )
+
+        first = deploymentHelpers.downloadKibanaObjects(tmp_path)
+        second = deploymentHelpers.downloadKibanaObjects(tmp_path)
+
+        assert first == second == '{"id": "abc"}\n'
+        assert deploymentHelpers.requests.get.call_args_list[0][1]["headers"] == {}
+        assert deploymentHelpers.requests.get.call_args[1]["headers"] == {
+            "If-None-Match": '"etag1"'
+        }
+        # only the cache files, nothing extracted to disk
+        assert len(list(tmp_path.iterdir())) == 2
+
+
+class TestInstalledObjectsHash:
+    objectsText = (
+        '{"type": "dashboard", "id": "abc", "attributes": {"title": "T-Pot"}}\n'
+        '{"type": "visualization", "id": "def", "attributes": {"title": "Map"}}\n'
+        '{"exportedCount": 2, "missingRefCount": 0, "missingReferences": []}\n'
+    )
+
+    def test_ignores_import_metadata(self, mocker):
+        """Reimporting the same objects keeps their hash, editing them changes it"""
+        exports = [
+            '{"type": "visualization", "id": "def", "attributes": {"title": "Map"},'
+            ' "updated_at": "2021-04-12T08:00:00.000Z", "version": "WzEsMV0="}\n'
+            '{"type": "dashboard", "id": "abc", "attributes": {"title": "T-Pot"},'
+            ' "references": []}\n',
+            '{"type": "dashboard", "id": "abc", "attributes": {"title": "T-Pot"},'
+            ' "updated_at": "2021-04-13T08:00:00.000Z", "version": "WzIsMV0="}\n'
+            '{"type": "visualization", "id": "def", "attributes": {"title": "Map"}}\n',
+            '{"type": "dashboard", "id": "abc", "attributes": {"title": "Edited"}}\n'
+            '{"type": "visualization", "id": "def", "attributes": {"title": "Map"}}\n',
+        ]
+        mocker.patch(
+            "deploymentHelpers.requests.post",
+            side_effect=[mocker.Mock(status_code=200, text=text) for text in exports],
+        )
+
+        hashes = [
+            deploymentHelpers.installedObjectsHash(
+                dummyUrl, dummyUser, dummyPass, self.objectsText
+            )
+            for _ in exports
+        ]
+
+        assert hashes[0] == hashes[1] != hashes[2]
+        assert deploymentHelpers.requests.post.call_args[1]["json"]["objects"] == [
+            {"type": "dashboard", "id": "abc"},
+            {"type": "visualization", "id": "def"},
+        ]
+
+    def test_missing_objects(self, mocker):
+        """Objects deleted from Kibana can't be exported"""
+        mocker.patch(
+            "deploymentHelpers.requests.post",
+            return_value=mocker.Mock(status_code=400, text="Bad Request"),
+        )
+
+        assert (
+            deploymentHelpers.installedObjectsHash(
+                dummyUrl, dummyUser, dummyPass, self.objectsText
+            )
+            is None
+        )
+
+
+class TestImportKibanaObjects:
+    objectsText = '{"id": "abc"}\n'
+    objectsHash = hashlib.sha256(objectsText.encode()).hexdigest()
+
+    def test_skip_same_objects(self, mocker):
+        """Skip import when the objects were imported and are still installed"""
+        mocker.patch(
+            "deploymentHelpers.getDeploymentState",
+            return_value={"objects": self.objectsHash, "installed": "installed"},
+        )
+        mocker.patch(
+            "deploymentHelpers.installedObjectsHash", return_value="installed"
+        )
+        mocker.patch("deploymentHelpers.requests.post")
+
+        imported = deploymentHelpers.importKibanaObjects(
+            dummyUrl, dummyUser, dummyPass, self.objectsText, elasticHostPort="es:1"
+        )
+
+        assert not imported
+        deploymentHelpers.requests.post.assert_not_called()
+
+    @pytest.mark.parametrize("installedHash", ["edited", None])
+    def test_repair_installed_objects(self, mocker, installedHash):
+        """Import again when the objects were edited or deleted in Kibana since"""
+        mocker.patch(
+            "deploymentHelpers.getDeploymentState",
+            return_value={"objects": self.objectsHash, "installed": None},
+        )
+        mocker.patch(
+            "deploymentHelpers.installedObjectsHash", return_value=installedHash
+        )
+        mocker.patch("deploymentHelpers.setDeploymentState")
+        mocker.patch(
+            "deploymentHelpers.requests.post",
+            side_effect=lambda *args, **kwargs: MockResponse(jsonType="importObjects"),
+        )
+
+        assert deploymentHelpers.importKibanaObjects(
+            dummyUrl, dummyUser, dummyPass, self.objectsText, elasticHostPort="es:1"
+        )
+
+    def test_import_new_objects(self, mocker):
+        """Import objects and record their hashes when they don't match"""
+        mocker.patch("deploymentHelpers.getDeploymentState", return_value="old")
+        mocker.patch(
+            "deploymentHelpers.installedObjectsHash", return_value="installed"
+        )
+        mocker.patch("deploymentHelpers.setDeploymentState")
+        mocker.patch(
+            "deploymentHelpers.requests.post",
+            side_effect=lambda *args, **kwargs: MockResponse(jsonType="importObjects"),
+        )
+
+        imported = deploymentHelpers.importKibanaObjects(
+            dummyUrl, dummyUser, dummyPass, self.objectsText, "summary", "es:1"
+        )
+
+        assert imported
+        fileName, fileObj = deploymentHelpers.requests.post.call_args_list[0][1][
+            "files"
+        ]["file"]
+        assert fileName == "summary.ndjson"
+        assert fileObj.read() == self.objectsText.encode()
+        deploymentHelpers.setDeploymentState.assert_called_once_with(
+            "es:1",
+            dummyUser,
+            dummyPass,
+            "kibana-objects-summary",
+            {"objects": self.objectsHash, "installed": "installed"},
+        )
+
+    def test_failed_objects(self, mocker):
+        """Objects that failed to import are never recorded as imported"""
+        mocker.patch("deploymentHelpers.getDeploymentState", return_value=None)
+        mocker.patch("deploymentHelpers.setDeploymentState")
+        mocker.patch(
+            "deploymentHelpers.requests.post",
+            return_value=MockResponse(jsonType="importObjects", userRoleCreated=False),
+        )
+
+        with pytest.raises(BadAPIRequestError):
+            deploymentHelpers.importKibanaObjects(
+                dummyUrl, dummyUser, dummyPass, self.objectsText, elasticHostPort="es:1"
+            )
+
+        deploymentHelpers.setDeploymentState.assert_not_called()
+
+
+class TestCertCoversHosts:
+    def test_valid(self):
+        certPem = selfSignedCert(["logger.a.com", "node.a.com"], timedelta(days=60))
+
+        assert deploymentHelpers.certCoversHosts(certPem, ["logger.a.com"], now=NOW)
+
+    def test_missing_host(self):
+        """A new logging node or relay needs a new certificate"""
+        certPem = selfSignedCert(["logger.a.com"], timedelta(days=60))
+
+        assert not deploymentHelpers.certCoversHosts(
+            certPem, ["logger.a.com", "relay.a.com"], now=NOW
+        )
+
+    def test_expiring(self):
+        certPem = selfSignedCert(["logger.a.com"], timedelta(days=10))
+
+        assert not deploymentHelpers.certCoversHosts(certPem, ["logger.a.com"], now=NOW)
+
+    def test_no_cert(self):
+        assert not deploymentHelpers.certCoversHosts(None, ["logger.a.com"])
+
+
+class TestGenerateSSLCerts:
+    def test_reuse_cert(self, mocker):
+        """Skip certbot when the existing certificate can be reused"""
+        mockedConnection = mocker.MagicMock()
+        mocker.patch("deploymentHelpers.readSSLCert", return_value="cert")
+        mocker.patch("deploymentHelpers.certCoversHosts", return_value=True)
+        mocker.patch("deploymentHelpers.copySSLCerts", return_value="certs")
+
+        certDir, issued = deploymentHelpers.generateSSLCerts(
+            mockedConnection, "me@a.com", ["logger.a.com"], "digitalocean.ini"
+        )
+
+        assert (certDir, issued) == ("certs", False)
+        mockedConnection.sudo.assert_not_called()
+
+    def test_issue_cert(self, mocker):
+        mockedConnection = mocker.MagicMock()
+        mocker.patch("deploymentHelpers.readSSLCert", return_value=None)
+        mocker.patch("deploymentHelpers.installPackages")
+        mocker.patch("deploymentHelpers.copySSLCerts", return_value="certs")
+
+        certDir, issued = deploymentHelpers.generateSSLCerts(
+            mockedConnection,
+            "me@a.com",
+            ["logger.a.com", "relay.a.com"],
+            "digitalocean.ini",
+        )
+
+        assert (certDir, issued) == ("certs", True)
+        certbotCommand = mockedConnection.sudo.call_args[0][0]
+        assert "-d logger.a.com -d relay.a.com" in certbotCommand
@@ -0,0 +1,107 @@
+import fleet
+from invoke.exceptions import AuthFailure, CommandTimedOut
+
+CREDENTIALS = {
+    "logging": {
+        "host": "logger.example.com",
+        "sudopass": "pass",
+        "nodes": [{"host": "node.example.com", "sudopass": "pass"}],
+    },
+    "sensors": [
+        {"host": "sensor1.example.com", "sudopass": "pass", "tags": ["eu"]},
+        {"host": "sensor2.example.com", "sudopass": "pass", "tags": ["asia"]},
+    ],
+    "relays": [{"host": "relay.example.com", "sudopass": "pass", "tags": ["eu"]}],
+}
+
+
+class TestGetFleetHosts:
+    def hostNames(self, hosts):
+        return [hostObj["host"] for hostObj, _ in hosts]
+
+    def test_targets(self):
+        assert len(fleet.getFleetHosts(CREDENTIALS)) == 5
+        assert self.hostNames(fleet.getFleetHosts(CREDENTIALS, "logging")) == [
+            "logger.example.com",
+            "node.example.com",
+        ]
+        assert fleet.getFleetHosts(CREDENTIALS, "sensors")[0][1] == "sensor"
+
+    def test_tags(self):
+        hosts = fleet.getFleetHosts(CREDENTIALS, tags=["eu"])
+        assert self.hostNames(hosts) == ["sensor1.example.com", "relay.example.com"]
+
+        hosts = fleet.getFleetHosts(CREDENTIALS, "sensors", ["eu", "asia"])
+        assert self.hostNames(hosts) == ["sensor1.example.com", "sensor2.example.com"]
+
+
+class TestConnectHost:
+    def test_sensor_port(self):
+        sensorConn = fleet.connectHost(CREDENTIALS["sensors"][0], "sensor", "admin")
+        relayConn = fleet.connectHost(CREDENTIALS["relays"][0], "relay", "admin")
+
+        assert sensorConn.port == fleet.SENSOR_SSH_PORT
+        assert relayConn.port == 22
+        assert sensorConn.user == "admin"
+
+
+class TestRunCommand:
+    def test_output(self, mocker):
+        mockedConnection = mocker.MagicMock()
+        mockedConnection.sudo.return_value = mocker.Mock(
+            exited=1, stdout="out\n", stderr="err\n"
+        )
+
+        result = fleet.runCommand(mockedConnection, "false", useSudo=True, timeout=5)
+
+        assert result == (1, "out\nerr")
+        assert mockedConnection.sudo.call_args[1]["timeout"] == 5
+        mockedConnection.run.assert_not_called()
+
+    def test_timeout(self, mocker):
+        mockedConnection = mocker.MagicMock()
+        mockedConnection.run.side_effect = CommandTimedOut(mocker.Mock(), 5)
+
+        assert fleet.runCommand(mockedConnection, "sleep 10", timeout=5) == (
+            None,
+            "timed out after 5s",
+        )
+
+    def test_unreachable(self, mocker):
+        mockedConnection = mocker.MagicMock()
+        mockedConnection.run.side_effect = OSError("No route to host")
+
+        exitCode, output = fleet.runCommand(mockedConnection, "uptime")
+
+        assert exitCode is None
+        assert "No route to host" in output
+
+    def test_wrong_sudo_password(self, mocker):
+        """A rejected sudo password fails the server instead of the whole run"""
+        okConnection = mocker.MagicMock()
+        okConnection.sudo.return_value = mocker.Mock(exited=0, stdout="ok", stderr="")
+        rejectedConnection = mocker.MagicMock()
+        rejectedConnection.sudo.side_effect = AuthFailure(None, "[sudo] password: ")
+        hosts = {"a.example.com": okConnection, "b.example.com": rejectedConnection}
+
+        results = fleet.runFleet(hosts, "uptime", useSudo=True)
+
+        assert results == {
+            "a.example.com": (0, "ok"),
+            "b.example.com": (None, "sudo password rejected"),
+        }
+
+
+class TestGroupResults:
+    def test_group_identical(self, mocker):
+        mocker.patch(
+            "fleet.runCommand",
+            side_effect=lambda conn, *args: (0, "ok") if conn != "c" else (1, "bad"),
+        )
+
+        results = fleet.runFleet({"a": "a", "b": "b", "c": "c"}, "check", workers=2)
+
+        assert fleet.groupResults(results) == [
+            (["a", "b"], 0, "ok"),
+            (["c"], 1, "bad"),
+        ]
@@ -0,0 +1,75 @@
+import latencyReport
+import pytest
+from errors import BadAPIRequestError
+
+from .mockResponse import MockResponse
+
+dummyUrl = "dummyhost:64298"
+dummyUser = "dummyUser"
+dummyPass = "dummyPass"
+
+SEARCH_JSON = {
+    "aggregations": {
+        "regions": {
+            "buckets": {
+                "fra1": {
+                    "doc_count": 100,
+                    "latency": {
+                        "values": {"50.0": 800.0, "95.0": 2500.0, "99.0": 4000.0}
+                    },
+                },
+                "default": {
+                    "doc_count": 0,
+                    "latency": {"values": {"50.0": None, "95.0": None, "99.0": None}},
+                },
+            }
+        }
+    }
+}
+
+
+class TestRegionHostnames:
+    def test_group_by_region(self):
+        """Group sensor hostnames by region, defaulting to the default region"""
+        sensorObjs = [
+            {"host": "a.example.com", "region": "fra1"},
+            {"host": "b.example.com"},
+            {"host": "c.example.com", "region": "fra1"},
+        ]
+
+        assert latencyReport.regionHostnames(sensorObjs) == {
+            "fra1": ["a", "c"],
+            "default": ["b"],
+        }
+
+
+class TestGetRegionLatency:
+    regionHosts = {"fra1": ["a", "c"], "default": ["b"]}
+
+    def test_latency(self, mocker):
+        """Read ingest latency percentiles of each region"""
+        mocker.patch("latencyReport.requests.post", return_value=MockResponse())
+        mocker.patch.object(MockResponse, "json", return_value=SEARCH_JSON)
+
+        latency = latencyReport.getRegionLatency(
+            dummyUrl, dummyUser, dummyPass, self.regionHosts
+        )
+
+        assert latency["fra1"] == {"events": 100, 50: 800, 95: 2500, 99: 4000}
+        assert latency["default"][99] is None
+        query = latencyReport.requests.post.call_args[1]["json"]
+        assert query["aggs"]["regions"]["filters"]["filters"]["fra1"] == {
+            "terms": {"t-pot_hostname.keyword": ["a", "c"]}
+        }
+
+    def test_bad_request(self, mocker):
+        """Get latency with bad API request"""
+        mocker.patch(
+            "latencyReport.requests.post",
+            return_value=MockResponse(statusError=True),
+        )
+
+        with pytest.raises(BadAPIRequestError):
+            latencyReport.getRegionLatency(
+                dummyUrl, dummyUser, dummyPass, self.regionHosts
+            )
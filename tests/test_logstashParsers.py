@@ -0,0 +1,329 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+import pytest
+from benchmarks.benchmarkParsers import (BENCH_DIR, FIXTURES, LEGACY_PATH,
+                                         TEMPLATE_PATH, benchmarkParsers,
+                                         extractTypeFilter)
+
+
+def captureFields(block):
+    """Get the fields captured by the grok and dissect patterns of a filter block
+
+    :block: filter block of one honeypot type
+    :returns: set of field names, without [@metadata] fields
+
+    """
+    fields = set()
+
+    for pattern in re.findall(r'"([^"]*%\{[^"]*)"', block):
+        for key in re.findall(r"%\{([^}]*)\}", pattern):
+            if ":" in key:
+                # grok %{PATTERN:field:type}
+                fields.add(key.split(":")[1])
+            elif not re.fullmatch(r"[A-Z0-9_]+", key):
+                # dissect %{field}, -> only skips repeated delimiters. Bare grok
+                # patterns such as %{SPACE} capture nothing
+                fields.add(key.replace("->", ""))
+
+    return {field for field in fields if not field.startswith("[@metadata]")}
+
+
+def templateFilter(honeypotType):
+    """Get the filter block of one honeypot type from logstash.conf.template
+
+    :honeypotType: honeypot type, as in the type field of the file inputs
+    :returns: text of the filter block
+
+    """
+    with open(TEMPLATE_PATH) as f:
+        return extractTypeFilter(f.read(), honeypotType)
+
+
+def dissect(mapping, text):
+    """Split text like Logstash's dissect filter does with the simple mappings of the
+    template: each field ends at the next occurrence of the delimiter after it, a
+    field ending in -> also skips repeats of that delimiter, and the last field takes
+    the rest of the text
+
+    :mapping: dissect mapping, such as "%{a} %{b}: %{c}"
+    :text: text to split
+    :returns: dictionary mapping field names to values, None if a delimiter is missing
+
+    """
+    parts = re.split(r"%\{([^}]*)\}", mapping)
+    prefix, keys, delimiters = parts[0], parts[1::2], parts[2::2]
+
+    if not text.startswith(prefix):
+        return None
+
+    position = len(prefix)
+    fields = {}
+
+    for key, delimiter in zip(keys, delimiters):
+        if not delimiter:
+            fields[key] = text[position:]
+            break
+
+        end = text.find(delimiter, position)
+
+        if end == -1:
+            return None
+
+        fields[key.replace("->", "")] = text[position:end]
+        position = end + len(delimiter)
+
+        if key.endswith("->"):
+            while text.startswith(delimiter, position):
+                position += len(delimiter)
+
+    return fields
+
+
+def parseCitrix(block, message):
+    """Parse a CitrixHoneypot message with the conditionals, dissect mappings and gsub
+    of the template's filter block, leaving out the grok fallback
+
+    :block: CitrixHoneypot filter block of the template
+    :message: message field of a CitrixHoneypot log line
+    :returns: dictionary of parsed fields, None for messages left to grok
+
+    """
+    mappings = re.findall(r'=> "(.*%\{.*)"', block)
+    guards = re.findall(r"=~ /(.+?)/ \{", block)
+    gsubPattern, replacement = re.search(
+        r'gsub => \[ "fileinfo.filename", "(.*)", "(.*)" \]', block
+    ).groups()
+    fields = dissect(mappings[0], message)
+    citrixMsg = fields.pop("[@metadata][citrix_msg]")
+    fields["src_port"] = int(fields["src_port"])
+
+    if re.match(guards[0], citrixMsg):
+        fields.update(dissect(mappings[1], citrixMsg))
+        fields["fileinfo.filename"] = re.sub(
+            gsubPattern, replacement, fields["fileinfo.filename"]
+        )
+    elif re.match(guards[1], citrixMsg):
+        fields.update(dissect(mappings[2], citrixMsg))
+    else:
+        return None
+
+    return {key: val for key, val in fields.items() if val != ""}
+
+
+def parseRdpy(block, message):
+    """Parse an Rdpy log line with the conditional and dissect mappings of the
+    template's filter block
+
+    :block: Rdpy filter block of the template
+    :message: Rdpy log line
+    :returns: dictionary of parsed fields, None if dissect fails
+
+    """
+    mappings = re.findall(r'=> "(.*%\{.*)"', block)
+    guard = re.search(r"=~ /(.+?)/ \{", block).group(1)
+
+    if re.match(guard, message):
+        fields = dissect(mappings[0], message)
+        fields["src_port"] = int(fields["src_port"])
+        return fields
+
+    fields = dissect(mappings[1], message)
+
+    if fields is None:
+        return None
+
+    return {key: val for key, val in fields.items() if val != ""}
+
+
+@pytest.mark.parametrize("honeypotType", FIXTURES)
+def test_extract_type_filter(honeypotType):
+    """Extract exactly one honeypot type's filter from the template and the fixture"""
+    for path in [TEMPLATE_PATH, LEGACY_PATH]:
+        with open(path) as f:
+            block = extractTypeFilter(f.read(), honeypotType)
+
+        assert block.startswith(f'  if [type] == "{honeypotType}" {{')
+        assert block.endswith("}")
+        assert block.count("{") == block.count("}")
+        assert re.findall(r'if \[type\] == "(\w+)"', block) == [honeypotType]
+
+
+@pytest.mark.parametrize("honeypotType", FIXTURES)
+def test_field_sets_match_legacy(honeypotType):
+    """Capture the same fields with dissect as the old grok patterns did
+
+    Only compares field names, the docker benchmark compares the parsed values
+
+    """
+    with open(TEMPLATE_PATH) as f:
+        block = extractTypeFilter(f.read(), honeypotType)
+
+    with open(LEGACY_PATH) as f:
+        legacyBlock = extractTypeFilter(f.read(), honeypotType)
+
+    assert "dissect {" in block
+    assert captureFields(block) == captureFields(legacyBlock)
+
+
+@pytest.mark.skipif(shutil.which("docker") is None, reason="needs docker")
+def test_parsers_match_legacy():
+    """Check that dissect-based parsers give the same fields as the old grok ones"""
+    assert benchmarkParsers(
+        repetitions=1, image="docker.elastic.co/logstash/logstash:7.17.0"
+    )
+
+
+def test_citrix_fixture_fields():
+    """Give the fields of the old grok patterns with dissect and gsub"""
+    block = templateFilter("CitrixHoneypot")
+
+    with open(os.path.join(BENCH_DIR, "fixtures", "citrixhoneypot.json")) as f:
+        messages = [json.loads(line)["message"] for line in f]
+
+    def expected(ip, port, method, state, **fields):
+        return {
+            "src_ip": ip,
+            "src_port": port,
+            "http.http_method": method,
+            "fileinfo.state": state,
+            **fields,
+        }
+
+    assert [parseCitrix(block, message) for message in messages] == [
+        expected(
+            "45.155.205.108",
+            53244,
+            "GET",
+            "Directory traversal",
+            **{"fileinfo.filename": "/vpn/../vpns/cfg/smb.conf"},
+        ),
+        expected(
+            "45.155.205.108",
+            53250,
+            "GET",
+            "Directory traversal",
+            **{"fileinfo.filename": "/vpn/../vpns/portal/scripts/newbm.pl"},
+        ),
+        expected(
+            "45.155.205.108",
+            53262,
+            "POST",
+            "Exploitation detected",
+            payload="url=http://example.com&title=[%25+template.new({'BLOCK'%3d"
+            "'print+`id`'})+%25]&desc=desc&UI_inuse=a",
+        ),
+        expected(
+            "193.118.53.202",
+            38712,
+            "HEAD",
+            "Scanner",
+            **{"fileinfo.filename": "/vpn/index.html"},
+        ),
+        expected(
+            "89.248.165.52", 44690, "GET", "Scanner", **{"fileinfo.filename": "/"}
+        ),
+        # no "METHOD State:", left to grok
+        None,
+        None,
+        expected(
+            "20.151.7.112",
+            60102,
+            "PUT",
+            "Directory traversal",
+            **{"fileinfo.filename": "/vpn/../vpns/portal/tips.html"},
+        ),
+        # UNIXPATH stopped at the query string and fragment
+        expected(
+            "89.248.165.52",
+            44702,
+            "GET",
+            "Scanner",
+            **{"fileinfo.filename": "/vpn/index.html"},
+        ),
+        expected(
+            "89.248.165.52",
+            44718,
+            "GET",
+            "Scanner",
+            **{"fileinfo.filename": "/vpn/../vpns/cfg/smb.conf"},
+        ),
+        # empty payload isn't indexed
+        expected("89.248.165.52", 44730, "GET", "Scanner"),
+    ]
+
+
+def test_rdpy_fixture_fields():
+    """Give the fields of the old grok patterns, plus the logins in NEWLY_PARSED"""
+    block = templateFilter("Rdpy")
+
+    with open(os.path.join(BENCH_DIR, "fixtures", "rdpy.log")) as f:
+        messages = f.read().splitlines()
+
+    assert [parseRdpy(block, message) for message in messages] == [
+        {
+            "timestamp": "2021-04-12T08:01:12.110532",
+            "src_ip": "185.202.1.175",
+            "src_port": 64311,
+        },
+        {
+            "timestamp": "2021-04-12T08:01:12.530012",
+            "username": "administrator",
+            "password": "P@ssw0rd",
+            "hostname": "WIN-8QJKFAC7S1D",
+        },
+        {
+            "timestamp": "2021-04-12T08:03:47.761209",
+            "src_ip": "45.146.164.110",
+            "src_port": 52120,
+        },
+        {
+            "timestamp": "2021-04-12T08:03:48.002196",
+            "domain": "WORKGROUP",
+            "username": "admin",
+            "hostname": "DESKTOP-R2AS9JU",
+        },
+        {"timestamp": "2021-04-12T08:09:20.415877"},
+        {
+            "timestamp": "2021-04-12T08:12:05.900316",
+            "src_ip": "92.63.197.153",
+            "src_port": 45882,
+        },
+        {
+            "timestamp": "2021-04-12T08:12:06.001431",
+            "username": "user",
+            "password": "qwerty,123",
+            "hostname": "mstshash=user",
+        },
+        None,
+    ]
+
+
+def test_citrix_patterns_fail_fast():
+    """Reject long non-matching lines fast, which CISCO_REASON took exponential time on
+
+    Attackers control the request path, so a 30 character one could stall a worker
+
+    """
+    block = templateFilter("CitrixHoneypot")
+    statePattern = re.search(r'"CITRIX_STATE" => "(.*)"', block).group(1)
+    patterns = re.findall(r"=~ /(.+?)/ \{", block) + [rf"\A\S+ {statePattern}: "]
+    line = "GET " + "a" * 64 + "!"
+
+    for pattern in patterns:
+        # in a subprocess, so a regression fails on the timeout instead of hanging
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import re, sys; assert not re.match(sys.argv[1], sys.argv[2])",
+                pattern,
+                line,
+            ],
+            check=True,
+            timeout=10,
+        )
@@ -0,0 +1,157 @@
+import metricsExporter
+import pytest
+from errors import BadAPIRequestError
+from invoke.exceptions import AuthFailure
+
+from .mockResponse import MockResponse
+
+dummyUrl = "dummyhost:64298"
+dummyUser = "dummyUser"
+dummyPass = "dummyPass"
+
+LOGSTASH_STATS = {
+    "events": {"in": 120, "filtered": 120, "out": 100, "duration_in_millis": 50},
+    "pipelines": {
+        "main": {"queue": {"type": "persisted", "events_count": 15}},
+        "other": {"queue": {"type": "persisted", "events_count": 5}},
+    },
+    "jvm": {"mem": {"heap_used_percent": 40}},
+}
+NODES_JSON = {
+    "nodes": {
+        "nodeId": {
+            "name": "logger",
+            "indices": {"indexing": {"index_total": 1000, "index_failed": 2}},
+            "thread_pool": {"write": {"rejected": 3, "queue": 0}},
+        }
+    }
+}
+
+
+class TestFindValue:
+    def test_nested(self):
+        assert metricsExporter.findValue(LOGSTASH_STATS, ["events", "out"]) == 100
+        assert metricsExporter.findValue(LOGSTASH_STATS, ["events", "missing"]) is None
+        assert metricsExporter.findValue(LOGSTASH_STATS, ["events"]) is None
+
+    def test_sum_wildcard(self):
+        path = ["pipelines", "*", "queue", "events_count"]
+        assert metricsExporter.findValue(LOGSTASH_STATS, path) == 20
+        assert metricsExporter.findValue({"pipelines": {}}, path) is None
+
+
+class TestGetLogstashStats:
+    def test_sensor_container(self, mocker):
+        """Sensors' Logstash is queried inside T-Pot's logstash container"""
+        mocker.patch(
+            "metricsExporter.runCommand", return_value=(0, '{"events": {"in": 1}}')
+        )
+
+        stats = metricsExporter.getLogstashStats("conn", inDocker=True)
+
+        assert stats == {"events": {"in": 1}}
+        command = metricsExporter.runCommand.call_args[0][1]
+        assert command.startswith("docker exec logstash curl")
+
+    def test_unreachable(self, mocker):
+        mocker.patch("metricsExporter.runCommand", return_value=(None, "timed out"))
+
+        assert metricsExporter.getLogstashStats("conn") is None
+
+
+class TestGetElasticStats:
+    def test_stats_by_node(self, mocker):
+        mocker.patch("metricsExporter.requests.get", return_value=MockResponse())
+        mocker.patch.object(MockResponse, "json", return_value=NODES_JSON)
+
+        stats = metricsExporter.getElasticStats(dummyUrl, dummyUser, dummyPass)
+
+        assert list(stats) == ["logger"]
+
+    def test_bad_request(self, mocker):
+        mocker.patch(
+            "metricsExporter.requests.get",
+            return_value=MockResponse(statusError=True),
+        )
+
+        with pytest.raises(BadAPIRequestError):
+            metricsExporter.getElasticStats(dummyUrl, dummyUser, dummyPass)
+
+
+class TestCollectMetrics:
+    def test_prometheus_text(self, mocker):
+        mocker.patch(
+            "metricsExporter.getLogstashStats",
+            side_effect=lambda conn, inDocker: LOGSTASH_STATS if inDocker else None,
+        )
+        mocker.patch(
+            "metricsExporter.getElasticStats",
+            return_value={"logger": NODES_JSON["nodes"]["nodeId"]},
+        )
+        logstashConns = [
+            ("sensor1.example.com", "sensor", "conn1"),
+            ("relay.example.com", "relay", "conn2"),
+        ]
+
+        metricsText = metricsExporter.collectMetrics(
+            logstashConns, dummyUrl, dummyUser, dummyPass
+        )
+
+        assert "# TYPE tpot_logstash_events_out_total counter\n" in metricsText
+        assert (
+            'tpot_logstash_events_out_total{host="sensor1.example.com",role="sensor"}'
+            " 100\n"
+        ) in metricsText
+        assert 'tpot_exporter_up{host="relay.example.com",role="relay"} 0\n' in (
+            metricsText
+        )
+        assert 'tpot_elasticsearch_write_rejected_total{node="logger"} 3\n' in (
+            metricsText
+        )
+        # relay didn't answer, so has no samples
+        assert 'tpot_logstash_events_in_total{host="relay' not in metricsText
+
+    def test_target_raises(self, mocker):
+        """Any exception of a target, such as a sudo AuthFailure, only marks that
+        target down
+
+        """
+        mocker.patch("metricsExporter.getLogstashStats", side_effect=self.failOnConn2)
+        mocker.patch("metricsExporter.getElasticStats", side_effect=KeyError("nodes"))
+        logstashConns = [
+            ("sensor1.example.com", "sensor", "conn1"),
+            ("sensor2.example.com", "sensor", "conn2"),
+        ]
+
+        metricsText = metricsExporter.collectMetrics(
+            logstashConns, dummyUrl, dummyUser, dummyPass
+        )
+
+        assert 'tpot_exporter_up{host="sensor1.example.com",role="sensor"} 1\n' in (
+            metricsText
+        )
+        assert 'tpot_exporter_up{host="sensor2.example.com",role="sensor"} 0\n' in (
+            metricsText
+        )
+        assert f'tpot_exporter_up{{host="{dummyUrl}",role="elasticsearch"}} 0\n' in (
+            metricsText
+        )
+
+    @staticmethod
+    def failOnConn2(conn, inDocker):
+        if conn == "conn2":
+            raise AuthFailure(None, "sudo")
+
+        return LOGSTASH_STATS
+
+
+class TestFormatAllDown:
+    def test_all_targets_down(self):
+        metricsText = metricsExporter.formatAllDown(
+            [("relay.example.com", "relay", "conn")], dummyUrl
+        )
+
+        assert metricsText.splitlines()[2:] == [
+            'tpot_exporter_up{host="relay.example.com",role="relay"} 0',
+            f'tpot_exporter_up{{host="{dummyUrl}",role="elasticsearch"}} 0',
+        ]
@@ -0,0 +1,191 @@
+import hashlib
+
+import reconfigure
+
+PASSWORD_TEXT = (
+    "PASSWORD kibana_system = kibanaPass\n"
+    "PASSWORD elastic = elasticPass\n\n"
+    "Changed password for user t_pot_internal\n"
+    "PASSWORD t_pot_internal = tPotPass\n"
+)
+CREDENTIALS = {
+    "logging": {"host": "logger.example.com", "vpc": True},
+    "sensors": [
+        {"host": "sensor1.example.com"},
+        {"host": "sensor2.example.com", "shipper": "filebeat", "region": "sgp1"},
+    ],
+    "relays": [{"host": "relay.example.com", "region": "sgp1"}],
+}
+
+
+def sha256(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class TestGetDesiredConfigs:
+    def test_configs_per_host(self):
+        desired = reconfigure.getDesiredConfigs(CREDENTIALS, PASSWORD_TEXT)
+
+        loggerPaths = [config["path"] for config in desired["logger.example.com"]]
+        assert loggerPaths[0] == "/etc/elasticsearch/elasticsearch.yml"
+        assert "/etc/kibana/kibana.yml" in loggerPaths
+        assert "/etc/logstash/conf.d/tpot.conf" in loggerPaths
+
+        sensorConf = desired["sensor1.example.com"][0]
+        assert sensorConf["path"] == "/data/elk/logstash.conf"
+        assert sensorConf["service"] == "tpot"
+        assert "'tPotPass'" in sensorConf["text"]
+        assert '"https://logger-vpc.example.com:64298"' in sensorConf["text"]
+
+        # Filebeat sensors ship through the relay of their region
+        filebeatConf = desired["sensor2.example.com"][0]
+        assert filebeatConf["path"] == "/data/elk/filebeat.yml"
+        assert 'hosts: ["relay.example.com:5044"]' in filebeatConf["text"]
+        relayConf = desired["relay.example.com"][0]["text"]
+        assert 'hosts => ["logger-vpc.example.com"]' in relayConf
+
+
+class TestGetRemoteHashes:
+    def test_parse_hashes(self, mocker):
+        mockedConnection = mocker.MagicMock()
+        mockedConnection.sudo.return_value.stdout = "abc  /etc/a.yml\ndef  /etc/b.yml\n"
+
+        remoteHashes = reconfigure.getRemoteHashes(
+            mockedConnection, ["/etc/a.yml", "/etc/b.yml", "/etc/missing.yml"]
+        )
+
+        assert remoteHashes == {"/etc/a.yml": "abc", "/etc/b.yml": "def"}
+        assert mockedConnection.sudo.call_args[1]["warn"]
+
+
+class TestReconfigureHost:
+
+    configs = [
+        {"path": f"/etc/{name}.yml", "text": name, "service": service}
+        for name, service in [
+            ("a", "elasticsearch"),
+            ("b", "kibana"),
+            ("c", "elasticsearch"),
+        ]
+    ]
+
+    def test_find_changed(self):
+        """Files with another hash or missing from the server are changed"""
+        remoteHashes = {"/etc/a.yml": sha256("a"), "/etc/b.yml": sha256("old")}
+
+        changedConfigs = reconfigure.findChangedConfigs(self.configs, remoteHashes)
+
+        assert [config["path"] for config in changedConfigs] == [
+            "/etc/b.yml",
+            "/etc/c.yml",
+        ]
+
+    def test_restart_changed_services(self, mocker):
+        """Only upload changed files and restart each of their services once"""
+        mocker.patch(
+            "reconfigure.getRemoteHashes", return_value={"/etc/b.yml": sha256("b")}
+        )
+        mocker.patch("reconfigure.putFile")
+        mockedConnection = mocker.MagicMock()
+        configs = [dict(config, owner=None, mode=None) for config in self.configs]
+
+        changedPaths, services = reconfigure.reconfigureHost(mockedConnection, configs)
+
+        assert changedPaths == ["/etc/a.yml", "/etc/c.yml"]
+        assert services == ["elasticsearch"]
+        assert reconfigure.putFile.call_count == 2
+        posArgs = [call[0][0] for call in mockedConnection.sudo.call_args_list]
+        assert posArgs == [
+            "systemctl daemon-reload",
+            "systemctl restart elasticsearch.service",
+        ]
+
+    def test_dry_run(self, mocker):
+        mocker.patch("reconfigure.getRemoteHashes", return_value={})
+        mocker.patch("reconfigure.putFile")
+        mockedConnection = mocker.MagicMock()
+
+        changedPaths, services = reconfigure.reconfigureHost(
+            mockedConnection, self.configs, dryRun=True
+        )
+
+        assert len(changedPaths) == 3
+        assert services == []
+        reconfigure.putFile.assert_not_called()
+        mockedConnection.sudo.assert_not_called()
+
+
+class TestReconfigureLoggingNodes:
+
+    nodes = [
+        {"host": "node1.example.com"},
+        {"host": "node2.example.com", "roles": ["master", "data"]},
+        {"host": "node3.example.com", "roles": ["master"]},
+    ]
+
+    def test_wait_between_restarts(self, mocker):
+        """Wait for the cluster to recover after each Elasticsearch restart, before
+        touching the next node
+
+        """
+        calls = []
+        services = {
+            "node1.example.com": ["elasticsearch"],
+            "node2.example.com": ["kibana"],
+            "node3.example.com": ["systemd-sysctl", "elasticsearch"],
+        }
+
+        def reconfigureHost(connection, configs, dryRun):
+            calls.append(connection)
+
+            return [], services[connection]
+
+        mocker.patch("reconfigure.reconfigureHost", side_effect=reconfigureHost)
+        mocker.patch("reconfigure.waitForService")
+        mocker.patch(
+            "reconfigure.waitForClusterNodes",
+            side_effect=lambda hostPort, *args: calls.append(("wait", *args)),
+        )
+        connections = {node["host"]: node["host"] for node in self.nodes}
+        desired = {node["host"]: [] for node in self.nodes}
+
+        results = reconfigure.reconfigureLoggingNodes(
+            connections, self.nodes, desired, "elasticPass"
+        )
+
+        wait = ("wait", "elastic", "elasticPass", 3, 1800, "green")
+        assert calls == [
+            "node1.example.com",
+            wait,
+            "node2.example.com",
+            "node3.example.com",
+            wait,
+        ]
+        assert [host for host, _ in results] == list(connections)
+        # never asks the node that just restarted
+        hostPorts = [
+            call[0][0] for call in reconfigure.waitForClusterNodes.call_args_list
+        ]
+        assert hostPorts == ["node2.example.com:64298", "node1.example.com:64298"]
+
+    def test_single_node_yellow(self, mocker):
+        """A single data node can't assign replicas, so only wait for yellow"""
+        mocker.patch(
+            "reconfigure.reconfigureHost", return_value=([], ["elasticsearch"])
+        )
+        mocker.patch("reconfigure.waitForService")
+        mocker.patch("reconfigure.waitForClusterNodes")
+        node = {"host": "logger.example.com"}
+
+        reconfigure.reconfigureLoggingNodes(
+            {node["host"]: None}, [node], {node["host"]: []}, "elasticPass"
+        )
+
+        assert reconfigure.waitForClusterNodes.call_args[0] == (
+            "logger.example.com:64298",
+            "elastic",
+            "elasticPass",
+            1,
+            1800,
+            "yellow",
+        )
@@ -0,0 +1,178 @@
+import pytest
+import retentionManager
+from errors import BadAPIRequestError
+
+from .mockResponse import MockResponse
+
+dummyUrl = "dummyhost:64298"
+dummyUser = "dummyUser"
+dummyPass = "dummyPass"
+
+DAY = retentionManager.DAY_MILLIS
+NOW = 100 * DAY
+# oldest index first, each index is 100 bytes
+DUMMY_INDICES = [
+    {"name": "old", "created": NOW - 10 * DAY, "size": 100, "writeIndex": False},
+    {"name": "older", "created": NOW - 20 * DAY, "size": 100, "writeIndex": False},
+    {"name": "recent", "created": NOW - 1 * DAY, "size": 100, "writeIndex": False},
+    {"name": "current", "created": NOW - 30 * DAY, "size": 100, "writeIndex": True},
+]
+
+
+class TestGetDiskUsage:
+    jsonType = "catAllocation"
+
+    def test_per_node(self, monkeypatch):
+        """Report disk usage of each node, ignoring unassigned shards"""
+        monkeypatch.setattr(
+            retentionManager.requests,
+            "get",
+            lambda *args, **kwargs: MockResponse(jsonType=__class__.jsonType),
+        )
+        usage = retentionManager.getDiskUsage(dummyUrl, dummyUser, dummyPass)
+        assert usage == [("node1", 600, 1000), ("node2", 200, 1000)]
+        assert retentionManager.findFullestNode(usage) == ("node1", 600, 1000)
+
+    def test_bad_request(self, monkeypatch):
+        """Get disk usage with bad API request"""
+        monkeypatch.setattr(
+            retentionManager.requests,
+            "get",
+            lambda *args, **kwargs: MockResponse(
+                statusError=True, jsonType=__class__.jsonType
+            ),
+        )
+        with pytest.raises(BadAPIRequestError):
+            retentionManager.getDiskUsage(dummyUrl, dummyUser, dummyPass)
+
+
+class TestFindFullestNode:
+    def test_fullest_percentage(self):
+        """Pick the node with the highest usage percentage, not the most bytes"""
+        usage = [("big", 500, 2000), ("small", 95, 100), ("empty", 0, 1000)]
+        assert retentionManager.findFullestNode(usage) == ("small", 95, 100)
+
+    def test_no_nodes(self):
+        """Report no disk space if no node has any"""
+        assert retentionManager.findFullestNode([]) == (None, 0, 0)
+
+
+class TestGetIndices:
+    def test_flag_write_index(self, mocker):
+        """Flag last backing index of each data stream as its write index"""
+        mocker.patch(
+            "retentionManager.requests.get",
+            side_effect=lambda url, **kwargs: MockResponse(
+                jsonType="dataStreams" if "_data_stream" in url else "catIndices"
+            ),
+        )
+        indices = retentionManager.getIndices(dummyUrl, dummyUser, dummyPass)
+        assert indices == [
+            {
+                "name": ".ds-tpot-cowrie-000001",
+                "created": 1000,
+                "size": 500,
+                "writeIndex": False,
+            },
+            {
+                "name": ".ds-tpot-cowrie-000002",
+                "created": 2000,
+                "size": 0,
+                "writeIndex": True,
+            },
+        ]
+
+    def test_bad_request(self, monkeypatch):
+        """Get indices with bad API request"""
+        monkeypatch.setattr(
+            retentionManager.requests,
+            "get",
+            lambda *args, **kwargs: MockResponse(statusError=True),
+        )
+        with pytest.raises(BadAPIRequestError):
+            retentionManager.getIndices(dummyUrl, dummyUser, dummyPass)
+
+
+class TestChooseIndicesToDelete:
+    def test_under_target(self):
+        """Don't delete anything if disk usage is already under target"""
+        toDelete, percent = retentionManager.chooseIndicesToDelete(
+            DUMMY_INDICES, 500, 1000, 75, 2, now=NOW
+        )
+        assert toDelete == []
+        assert percent == 50
+
+    def test_oldest_first(self):
+        """Delete oldest index first, skipping the write index"""
+        toDelete, percent = retentionManager.chooseIndicesToDelete(
+            DUMMY_INDICES, 800, 1000, 75, 2, now=NOW
+        )
+        assert toDelete == ["older"]
+        assert percent == 70
+
+    def test_min_days_floor(self):
+        """Never delete indices younger than minDays, even if over target"""
+        toDelete, percent = retentionManager.chooseIndicesToDelete(
+            DUMMY_INDICES, 900, 1000, 10, 2, now=NOW
+        )
+        assert toDelete == ["older", "old"]
+        assert percent == 70
+
+    def test_no_disk(self):
+        """Don't delete anything without a total disk size to compare with"""
+        toDelete, percent = retentionManager.chooseIndicesToDelete(
+            DUMMY_INDICES, 0, 0, 75, 2, now=NOW
+        )
+        assert toDelete == []
+        assert percent == 0
+
+
+class TestManageRetention:
+    def test_no_deletion_under_target(self, mocker):
+        """Don't look at or delete indices if disk usage is under target"""
+        mocker.patch(
+            "retentionManager.getDiskUsage", return_value=[("node1", 100, 1000)]
+        )
+        mocker.patch("retentionManager.getIndices")
+        mocker.patch("retentionManager.requests.delete")
+
+        assert (
+            retentionManager.manageRetention(dummyUrl, dummyUser, dummyPass, 75, 2)
+            == []
+        )
+        retentionManager.getIndices.assert_not_called()
+        retentionManager.requests.delete.assert_not_called()
+
+    def test_no_disk_reported(self, mocker):
+        """Skip deletion before any data node reports disk space"""
+        mocker.patch("retentionManager.getDiskUsage", return_value=[])
+        mocker.patch("retentionManager.getIndices")
+        mocker.patch("retentionManager.requests.delete")
+
+        assert (
+            retentionManager.manageRetention(dummyUrl, dummyUser, dummyPass, 75, 2)
+            == []
+        )
+        retentionManager.getIndices.assert_not_called()
+        retentionManager.requests.delete.assert_not_called()
+
+    def test_delete_chosen_indices(self, mocker):
+        """Delete every index chosen by chooseIndicesToDelete"""
+        mocker.patch("retentionManager.time.time", return_value=NOW / 1000)
+        # averaged over both nodes usage would be at the 50% target
+        mocker.patch(
+            "retentionManager.getDiskUsage",
+            return_value=[("node1", 900, 1000), ("node2", 100, 1000)],
+        )
+        mocker.patch("retentionManager.getIndices", return_value=DUMMY_INDICES)
+        mocker.patch(
+            "retentionManager.requests.delete",
+            side_effect=lambda *args, **kwargs: MockResponse(),
+        )
+
+        deleted = retentionManager.manageRetention(
+            dummyUrl, dummyUser, dummyPass, 50, 2
+        )
+
+        assert deleted == ["older", "old"]
+        assert retentionManager.requests.delete.call_count == 2
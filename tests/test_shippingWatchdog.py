@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta, timezone
+
+import deploymentHelpers
+import pytest
+import shippingWatchdog
+from errors import BadAPIRequestError
+
+from .mockResponse import MockResponse
+
+dummyUrl = "dummyhost:64298"
+dummyUser = "dummyUser"
+dummyPass = "dummyPass"
+
+NOW = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+SETTINGS = {**shippingWatchdog.DEFAULT_WATCHDOG, "restart": True}
+SENSORS = [
+    {"host": "a.example.com", "sudopass": "pass"},
+    {"host": "b.example.com", "sudopass": "pass"},
+]
+
+
+def searchJson(lastIndexed):
+    return {
+        "aggregations": {
+            "sensors": {
+                "buckets": [
+                    {
+                        "key": hostname,
+                        "lastIndexed": {"value": indexedTime.timestamp() * 1000},
+                    }
+                    for hostname, indexedTime in lastIndexed.items()
+                ]
+            }
+        }
+    }
+
+
+class TestGetLastIndexed:
+    def test_missing_sensor(self, mocker):
+        """Sensors without events in the lookback window have no bucket"""
+        mocker.patch("shippingWatchdog.requests.post", return_value=MockResponse())
+        mocker.patch.object(MockResponse, "json", return_value=searchJson({"a": NOW}))
+
+        lastIndexed = shippingWatchdog.getLastIndexed(
+            dummyUrl, dummyUser, dummyPass, ["a", "b"]
+        )
+
+        assert lastIndexed == {"a": NOW, "b": None}
+        query = shippingWatchdog.requests.post.call_args[1]["json"]
+        assert query["aggs"]["sensors"]["terms"]["include"] == ["a", "b"]
+
+    def test_bad_request(self, mocker):
+        mocker.patch(
+            "shippingWatchdog.requests.post",
+            return_value=MockResponse(statusError=True),
+        )
+
+        with pytest.raises(BadAPIRequestError):
+            shippingWatchdog.getLastIndexed(dummyUrl, dummyUser, dummyPass, ["a"])
+
+
+class TestFindSilentSensors:
+    def test_silent(self):
+        lastIndexed = {
+            "a": NOW - timedelta(minutes=5),
+            "b": NOW - timedelta(minutes=45),
+            "c": None,
+        }
+
+        assert shippingWatchdog.findSilentSensors(lastIndexed, 30, NOW) == ["b", "c"]
+
+
+class TestCanRestart:
+    @pytest.mark.parametrize(
+        "minutesAgo, expected",
+        [
+            ([], True),
+            ([10], False),
+            ([20], True),
+            ([50, 20], False),
+            ([50, 30], True),
+            ([200, 150, 100], False),
+        ],
+    )
+    def test_backoff(self, minutesAgo, expected):
+        """Wait 15 minutes after the first restart, then 30, then give up"""
+        restartTimes = [
+            (NOW - timedelta(minutes=minutes)).isoformat() for minutes in minutesAgo
+        ]
+
+        assert shippingWatchdog.canRestart(restartTimes, NOW, 3, 15) == expected
+
+
+class TestSuperviseSensors:
+    def test_match_set_hostname(self, mocker):
+        """Look sensors up under the hostname setTPotHostname gives them"""
+        connection = mocker.MagicMock()
+        deploymentHelpers.setTPotHostname(connection, SENSORS[0]["host"])
+        setCommand = connection.sudo.call_args_list[0][0][0]
+        assert setCommand.startswith("hostnamectl set-hostname ")
+        hostname = setCommand.split()[-1]
+
+        mocker.patch("shippingWatchdog.requests.post", return_value=MockResponse())
+        mocker.patch.object(
+            MockResponse, "json", return_value=searchJson({hostname: NOW})
+        )
+        mocker.patch("shippingWatchdog.restartTPot")
+
+        silent = shippingWatchdog.superviseSensors(
+            dummyUrl,
+            dummyUser,
+            dummyPass,
+            SENSORS[:1],
+            "tpotadmin",
+            SETTINGS,
+            {},
+            NOW,
+        )
+
+        assert silent == []
+        shippingWatchdog.restartTPot.assert_not_called()
+
+    def test_restart_silent(self, mocker):
+        mocker.patch(
+            "shippingWatchdog.getLastIndexed",
+            return_value={"a": NOW, "b": NOW - timedelta(hours=2)},
+        )
+        mocker.patch("shippingWatchdog.connectHost")
+        mocker.patch("shippingWatchdog.restartTPot", return_value=True)
+        state = {"a": [NOW.isoformat()]}
+
+        silent = shippingWatchdog.superviseSensors(
+            dummyUrl, dummyUser, dummyPass, SENSORS, "tpotadmin", SETTINGS, state, NOW
+        )
+
+        assert silent == ["b"]
+        assert state == {"b": [NOW.isoformat()]}
+        shippingWatchdog.connectHost.assert_called_once_with(
+            SENSORS[1], "sensor", "tpotadmin"
+        )
+
+    def test_restart_disabled(self, mocker):
+        mocker.patch("shippingWatchdog.getLastIndexed", return_value={"a": None})
+        mocker.patch("shippingWatchdog.restartTPot")
+        state = {}
+
+        silent = shippingWatchdog.superviseSensors(
+            dummyUrl,
+            dummyUser,
+            dummyPass,
+            SENSORS[:1],
+            "tpotadmin",
+            shippingWatchdog.DEFAULT_WATCHDOG,
+            state,
+            NOW,
+        )
+
+        assert silent == ["a"]
+        assert state == {}
+        shippingWatchdog.restartTPot.assert_not_called()
+
+    def test_backing_off(self, mocker):
+        mocker.patch("shippingWatchdog.getLastIndexed", return_value={"a": None})
+        mocker.patch("shippingWatchdog.restartTPot")
+        state = {"a": [(NOW - timedelta(minutes=1)).isoformat()]}
+
+        shippingWatchdog.superviseSensors(
+            dummyUrl,
+            dummyUser,
+            dummyPass,
+            SENSORS[:1],
+            "tpotadmin",
+            SETTINGS,
+            state,
+            NOW,
+        )
+
+        assert len(state["a"]) == 1
+        shippingWatchdog.restartTPot.assert_not_called()
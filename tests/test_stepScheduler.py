@@ -0,0 +1,163 @@
+import threading
+
+import pytest
+import stepScheduler
+from errors import NotCreatedError, StepGraphError
+
+
+def constantStep(name, outputs, inputs=None):
+    return stepScheduler.createStep(
+        name, lambda values: dict(outputs), inputs, list(outputs)
+    )
+
+
+class TestFindDependencies:
+    def test_dependencies_from_inputs(self):
+        steps = [
+            constantStep("certs", {"certDir": "certs"}),
+            constantStep("droplets", {"vpcRange": None}, ["sshKey"]),
+            constantStep("sensor", {}, ["certDir", "vpcRange"]),
+        ]
+
+        dependencies = stepScheduler.findDependencies(steps, {"sshKey": "key"})
+
+        assert dependencies == {
+            "certs": set(),
+            "droplets": set(),
+            "sensor": {"certs", "droplets"},
+        }
+
+    @pytest.mark.parametrize(
+        "steps",
+        [
+            # input nobody produces
+            [constantStep("sensor", {}, ["certDir"])],
+            # value produced twice
+            [constantStep("a", {"x": 1}), constantStep("b", {"x": 2})],
+            # name used twice
+            [constantStep("a", {"x": 1}), constantStep("a", {"y": 2})],
+            # cycle
+            [constantStep("a", {"x": 1}, ["y"]), constantStep("b", {"y": 2}, ["x"])],
+        ],
+    )
+    def test_invalid_graph(self, steps):
+        with pytest.raises(StepGraphError):
+            stepScheduler.findDependencies(steps)
+
+
+class TestRunSteps:
+    def test_pass_values(self):
+        steps = [
+            stepScheduler.createStep(
+                "double", lambda values: {"y": values["x"] * 2}, ["x"], ["y"]
+            ),
+            stepScheduler.createStep(
+                "add",
+                lambda values: {"z": values["x"] + values["y"]},
+                ["x", "y"],
+                ["z"],
+            ),
+        ]
+
+        values, timings = stepScheduler.runSteps(steps, {"x": 3})
+
+        assert values == {"x": 3, "y": 6, "z": 9}
+        assert timings["double"][1] <= timings["add"][0]
+
+    def test_overlap_independent_steps(self):
+        """Independent steps run at the same time, so each sees the other start"""
+        started = {"a": threading.Event(), "b": threading.Event()}
+
+        def waitForOther(name, other):
+            def func(values):
+                started[name].set()
+                assert started[other].wait(5)
+
+            return func
+
+        steps = [
+            stepScheduler.createStep("a", waitForOther("a", "b")),
+            stepScheduler.createStep("b", waitForOther("b", "a")),
+        ]
+
+        _, timings = stepScheduler.runSteps(steps)
+
+        assert set(timings) == {"a", "b"}
+
+    def test_failure_stops_dependents(self):
+        ran = []
+
+        def fail(values):
+            raise NotCreatedError("logging server setup failed")
+
+        steps = [
+            stepScheduler.createStep("logging", fail, outputs=["tPotPass"]),
+            stepScheduler.createStep(
+                "sensor", lambda values: ran.append("sensor"), ["tPotPass"]
+            ),
+        ]
+
+        with pytest.raises(NotCreatedError):
+            stepScheduler.runSteps(steps)
+
+        assert ran == []
+
+    def test_failure_keeps_progress(self):
+        """Failed runs keep the values and timings of the steps that ran"""
+
+        def fail(values):
+            raise NotCreatedError("sensor setup failed")
+
+        steps = [
+            stepScheduler.createStep(
+                "certs", lambda values: {"certDir": "/tmp/certs"}, outputs=["certDir"]
+            ),
+            stepScheduler.createStep("sensor", fail, ["certDir"], ["sensor"]),
+            stepScheduler.createStep("canaries", lambda values: None, ["sensor"]),
+        ]
+
+        with pytest.raises(NotCreatedError) as excInfo:
+            stepScheduler.runSteps(steps)
+
+        timings = excInfo.value.stepTimings
+        assert excInfo.value.stepValues == {"certDir": "/tmp/certs"}
+        assert set(timings) == {"certs", "sensor"}
+        assert stepScheduler.criticalPath(
+            stepScheduler.findDependencies(steps), timings
+        ) == ["certs", "sensor"]
+
+    def test_missing_output(self):
+        steps = [stepScheduler.createStep("certs", lambda values: {}, [], ["certDir"])]
+
+        with pytest.raises(StepGraphError):
+            stepScheduler.runSteps(steps)
+
+
+class TestCriticalPath:
+    def test_latest_dependency(self):
+        dependencies = {
+            "sshKey": set(),
+            "certs": set(),
+            "droplets": {"sshKey"},
+            "logging": {"certs", "droplets"},
+            "sensorBase": {"droplets"},
+            "sensorFinish": {"sensorBase", "logging"},
+        }
+        timings = {
+            "sshKey": (0, 1),
+            "certs": (0, 90),
+            "droplets": (1, 60),
+            "logging": (90, 400),
+            "sensorBase": (60, 300),
+            "sensorFinish": (400, 450),
+        }
+
+        path = stepScheduler.criticalPath(dependencies, timings)
+
+        assert path == ["certs", "logging", "sensorFinish"]
+        assert stepScheduler.formatCriticalPath(path, timings) == [
+            "certs: 90s (from 0s to 90s)",
+            "logging: 310s (from 90s to 400s)",
+            "sensorFinish: 50s (from 400s to 450s)",
+            "total: 450s",
+        ]
@@ -1,6 +1,13 @@
+import json
+
 import pytest
-from errors import NoSubdomainError, NotFoundError
-from utils import findPassword, splitDomain
+from errors import (NoIngestNodeError, NoSubdomainError, NotFoundError,
+                    UnknownSizeError)
+from utils import (addSearchFilter, dropletMemoryMb, findPassword, findRelay,
+                   findSavedObjectFields, findTPotFlavor, getIngestHosts,
+                   getLoggingNodes, nodeHasRole, privateHost,
+                   replaceComposeService, replaceIndexPatternTitle,
+                   splitDomain, tPotHostname, usesFilebeat)
 
 
 class TestFindPasword:
@@ -43,3 +50,329 @@ class TestSplitDomain:
     def test_no_subdomain_with_dot(self):
         with pytest.raises(NoSubdomainError):
             splitDomain(".domain.gov")
+
+
+class TestTPotHostname:
+
+    """Test utils.tPotHostname function"""
+
+    def test_subdomain(self):
+        assert tPotHostname("sensor1.domain.net") == "sensor1"
+
+
+class TestDropletMemoryMb:
+
+    """Test utils.dropletMemoryMb function"""
+
+    def test_gb_size(self):
+        assert dropletMemoryMb("s-4vcpu-8gb") == 8192
+
+    def test_mb_size(self):
+        assert dropletMemoryMb("s-1vcpu-512mb-10gb") == 512
+
+    def test_size_with_suffix(self):
+        assert dropletMemoryMb("s-2vcpu-4gb-intel") == 4096
+
+    def test_cpu_optimized_size(self):
+        assert dropletMemoryMb("c-4") == 8192
+        assert dropletMemoryMb("c2-2vcpu-4gb") == 4096
+
+    def test_legacy_size(self):
+        assert dropletMemoryMb("2gb") == 2048
+
+    def test_unknown_size(self):
+        with pytest.raises(UnknownSizeError):
+            dropletMemoryMb("c-3")
+
+
+class TestGetLoggingNodes:
+
+    """Test utils.getLoggingNodes function"""
+
+    def test_single_node(self):
+        loggingObj = {"host": "logger.domain.net", "sudopass": "pass"}
+        assert getLoggingNodes(loggingObj) == [loggingObj]
+
+    def test_multiple_nodes(self):
+        otherNode = {"host": "data.domain.net", "sudopass": "pass", "roles": ["data"]}
+        loggingObj = {"host": "logger.domain.net", "nodes": [otherNode]}
+        nodes = getLoggingNodes(loggingObj)
+        # logging server comes first, without the nodes array
+        assert nodes == [{"host": "logger.domain.net"}, otherNode]
+
+
+class TestNodeHasRole:
+
+    """Test utils.nodeHasRole function"""
+
+    def test_default_roles(self):
+        assert nodeHasRole({"host": "logger.domain.net"}, "master")
+        assert not nodeHasRole({"host": "logger.domain.net"}, "coordinating")
+
+    def test_explicit_roles(self):
+        nodeObj = {"host": "data.domain.net", "roles": ["data", "ingest"]}
+        assert nodeHasRole(nodeObj, "ingest")
+        assert not nodeHasRole(nodeObj, "master")
+
+
+class TestGetIngestHosts:
+
+    """Test utils.getIngestHosts function"""
+
+    loggingNodes = [
+        {"host": "logger.domain.net", "roles": ["master"]},
+        {"host": "data.domain.net", "roles": ["data"]},
+        {"host": "ingest.domain.net", "roles": ["ingest"]},
+    ]
+
+    def test_public_network(self):
+        assert getIngestHosts(self.loggingNodes) == [
+            "data.domain.net",
+            "ingest.domain.net",
+        ]
+
+    def test_private_network(self):
+        assert getIngestHosts(self.loggingNodes, True) == [
+            "data-vpc.domain.net",
+            "ingest-vpc.domain.net",
+        ]
+
+    def test_no_ingest_node(self):
+        """Refuse a tier where sensors would have no host to ship to"""
+        with pytest.raises(NoIngestNodeError):
+            getIngestHosts(self.loggingNodes[:1])
+
+
+class TestFindSavedObjectFields:
+
+    """Test utils.findSavedObjectFields function"""
+
+    def test_find_fields(self):
+        visState = {"aggs": [{"params": {"field": "src_ip.keyword"}}]}
+        searchSource = {
+            "filter": [{"meta": {"key": "type", "params": {"query": "Cowrie"}}}]
+        }
+        savedObjects = [
+            {
+                "type": "visualization",
+                "attributes": {
+                    "visState": json.dumps(visState),
+                    "kibanaSavedObjectMeta": {
+                        "searchSourceJSON": json.dumps(searchSource)
+                    },
+                },
+            },
+            {"type": "search", "attributes": {"columns": ["_source", "eventid"]}},
+            {
+                "type": "lens",
+                "attributes": {
+                    "state": {"columns": {"a": {"sourceField": "geoip.asn"}}}
+                },
+            },
+            {"type": "index-pattern", "attributes": {"fields": '[{"name": "unused"}]'}},
+        ]
+        objectsText = "\n".join(json.dumps(obj) for obj in savedObjects) + "\n"
+
+        assert findSavedObjectFields(objectsText) == {
+            "Cowrie": {"src_ip", "type"},
+            None: {"eventid", "geoip.asn"},
+        }
+
+    def test_fields_by_type(self):
+        """Types come from queries and filters, panels inherit their dashboard's"""
+        kuerySource = {"query": {"query": 'type:"Dionaea"', "language": "kuery"}}
+        customFilter = {"meta": {"type": "custom", "key": "query", "negate": False}}
+        negatedFilter = {
+            "meta": {"key": "type", "negate": True, "params": ["Adbhoney"]}
+        }
+        dashboardSource = {
+            "query": {"query": "type:Cowrie OR type:Honeytrap", "language": "lucene"},
+            "filter": [customFilter, negatedFilter],
+        }
+        savedObjects = [
+            {
+                "id": "dionaea-vis",
+                "type": "visualization",
+                "attributes": {
+                    "visState": json.dumps({"params": {"field": "connection"}}),
+                    "kibanaSavedObjectMeta": {
+                        "searchSourceJSON": json.dumps(kuerySource)
+                    },
+                },
+            },
+            {
+                "id": "panel",
+                "type": "lens",
+                "attributes": {
+                    "state": {"columns": {"a": {"sourceField": "username"}}}
+                },
+            },
+            {
+                "id": "dashboard",
+                "type": "dashboard",
+                "attributes": {
+                    "kibanaSavedObjectMeta": {
+                        "searchSourceJSON": json.dumps(dashboardSource)
+                    }
+                },
+                "references": [{"id": "panel"}, {"id": "dionaea-vis"}],
+            },
+        ]
+        objectsText = "\n".join(json.dumps(obj) for obj in savedObjects) + "\n"
+
+        assert findSavedObjectFields(objectsText) == {
+            "Dionaea": {"connection"},
+            "Cowrie": {"username", "type"},
+            "Honeytrap": {"username", "type"},
+        }
+
+
+class TestReplaceIndexPatternTitle:
+
+    """Test utils.replaceIndexPatternTitle function"""
+
+    def test_replace_title(self):
+        savedObjects = [
+            {
+                "id": "abc",
+                "type": "index-pattern",
+                "attributes": {"title": "logstash-*"},
+            },
+            {"id": "def", "type": "index-pattern", "attributes": {"title": "other-*"}},
+            {"id": "ghi", "type": "search", "attributes": {"title": "logstash-*"}},
+        ]
+        objectsText = "\n".join(json.dumps(obj) for obj in savedObjects) + "\n"
+
+        replaced = replaceIndexPatternTitle(objectsText, "logstash-*", "tpot-*")
+        titles = [
+            (obj["id"], obj["attributes"]["title"])
+            for obj in map(json.loads, replaced.splitlines())
+        ]
+        assert titles == [("abc", "tpot-*"), ("def", "other-*"), ("ghi", "logstash-*")]
+
+
+class TestAddSearchFilter:
+
+    """Test utils.addSearchFilter function"""
+
+    def test_add_filter(self):
+        query = {"bool": {"must_not": [{"term": {"tpot_canary": True}}]}}
+        existingFilter = {"query": {"match_phrase": {"type": "Cowrie"}}}
+        savedObjects = [
+            {
+                "id": "abc",
+                "type": "visualization",
+                "attributes": {
+                    "kibanaSavedObjectMeta": {
+                        "searchSourceJSON": json.dumps({"filter": [existingFilter]})
+                    }
+                },
+            },
+            {"id": "def", "type": "dashboard", "attributes": {}},
+            {"id": "ghi", "type": "index-pattern", "attributes": {"title": "tpot-*"}},
+        ]
+        objectsText = "\n".join(json.dumps(obj) for obj in savedObjects) + "\n"
+
+        filtered = [
+            json.loads(line)
+            for line in addSearchFilter(objectsText, query, "Hide").splitlines()
+        ]
+        filters = [
+            [
+                searchFilter["query"]
+                for searchFilter in json.loads(
+                    obj["attributes"]["kibanaSavedObjectMeta"]["searchSourceJSON"]
+                )["filter"]
+            ]
+            for obj in filtered[:2]
+        ]
+        assert filters == [[existingFilter["query"], query], [query]]
+        assert filtered[2] == savedObjects[2]
+
+
+class TestReplaceComposeService:
+
+    """Test utils.replaceComposeService function"""
+
+    composeText = (
+        "services:\n\n"
+        "# Logstash service\n"
+        "  logstash:\n"
+        "    env_file:\n"
+        "      - /opt/tpot/etc/compose/elk_environment\n\n"
+        "# Cowrie service\n"
+        "  cowrie:\n"
+        "    image: cowrie\n"
+    )
+
+    def test_replace_service(self):
+        newService = "# Filebeat service\n  filebeat:\n    image: filebeat\n"
+        assert replaceComposeService(self.composeText, "logstash", newService) == (
+            "services:\n\n"
+            "# Filebeat service\n  filebeat:\n    image: filebeat\n\n"
+            "# Cowrie service\n  cowrie:\n    image: cowrie\n"
+        )
+
+    def test_remove_last_service(self):
+        assert replaceComposeService(self.composeText, "cowrie") == (
+            self.composeText.split("# Cowrie")[0]
+        )
+
+    def test_service_not_found(self):
+        with pytest.raises(NotFoundError):
+            replaceComposeService(self.composeText, "dionaea")
+
+
+class TestUsesFilebeat:
+
+    """Test utils.usesFilebeat function"""
+
+    def test_default_logstash(self):
+        assert not usesFilebeat({"host": "sensor.example.com"})
+
+    def test_filebeat(self):
+        assert usesFilebeat({"host": "sensor.example.com", "shipper": "filebeat"})
+
+
+class TestFindTPotFlavor:
+
+    """Test utils.findTPotFlavor function"""
+
+    def test_find_flavor(self):
+        tPotConf = "# tpot configuration file\nmyCONF_TPOT_FLAVOR='SENSOR'\n"
+        assert findTPotFlavor(tPotConf) == "SENSOR"
+
+    def test_flavor_not_found(self):
+        with pytest.raises(NotFoundError):
+            findTPotFlavor("myCONF_WEB_USER='webuser'\n")
+
+
+class TestPrivateHost:
+
+    """Test utils.privateHost function"""
+
+    def test_private_host(self):
+        assert privateHost("logger.example.com") == "logger-vpc.example.com"
+
+
+class TestFindRelay:
+
+    """Test utils.findRelay function"""
+
+    relayObjs = [
+        {"host": "relay-fra.example.com", "region": "fra1"},
+        {"host": "relay-sgp.example.com", "region": "sgp1"},
+    ]
+
+    def test_same_region(self):
+        relay = findRelay({"host": "s.example.com", "region": "sgp1"}, self.relayObjs)
+        assert relay["host"] == "relay-sgp.example.com"
+
+    def test_no_relay(self):
+        relay = findRelay({"host": "s.example.com", "region": "nyc1"}, self.relayObjs)
+        assert relay is None
+
+    def test_no_region(self):
+        """Sensors without a region don't match relays without one either"""
+        relayObjs = self.relayObjs + [{"host": "relay.example.com"}]
+        assert findRelay({"host": "s.example.com"}, relayObjs) is None
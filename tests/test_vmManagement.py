@@ -1,9 +1,10 @@
 import pytest
 import vmManagement
+from errors import VPCRegionError
 from requests.exceptions import HTTPError
 
-from .mockResponse import (DUMMY_ID, DUMMY_IP, DUMMY_REGION, DUMMY_TOKEN,
-                           MockResponse)
+from .mockResponse import (DUMMY_ID, DUMMY_IP, DUMMY_RANGE, DUMMY_REGION,
+                           DUMMY_TOKEN, MockResponse)
 
 DUMMY_SUB_DOMAIN = "subdomain"
 DUMMY_DOMAIN = "domain.com"
@@ -101,6 +102,18 @@ class TestWaitForVM:
         # returned in "waitForVM" case of MockResponse().json()
         assert vmIp == DUMMY_IP
 
+    def test_private_address(self, mocker):
+        """Return VPC address of droplet instead of public address"""
+        mocker.patch("vmManagement.time.sleep")
+        mocker.patch(
+            "vmManagement.requests.get",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                kwargsDict=kwargs, jsonType=__class__.jsonType
+            ),
+        )
+
+        assert vmManagement.waitForVM(DUMMY_TOKEN, DUMMY_ID, "private") == "3.4.0.1"
+
 
 class TestCreateVM:
 
@@ -139,6 +152,31 @@ class TestCreateVM:
             DUMMY_TOKEN, DUMMY_SUB_DOMAIN, DUMMY_DOMAIN, DUMMY_IP
         )
 
+    def test_vpc_vm_request(self, mocker):
+        """Create VM in VPC with an extra A record for its private address"""
+        mocker.patch(
+            "vmManagement.requests.post",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                kwargsDict=kwargs, jsonType=__class__.jsonType
+            ),
+        )
+        mocker.patch("vmManagement.waitForVM", side_effect=[DUMMY_IP, "10.10.0.2"])
+        mocker.patch("vmManagement.createARecord")
+
+        vmManagement.createVM(
+            DUMMY_TOKEN,
+            DUMMY_SUB_DOMAIN,
+            DUMMY_DOMAIN,
+            DUMMY_REGION,
+            DUMMY_ID,
+            vpcUuid="vpcId",
+        )
+
+        assert vmManagement.requests.post.call_args[1]["json"]["vpc_uuid"] == "vpcId"
+        vmManagement.createARecord.assert_called_with(
+            DUMMY_TOKEN, f"{DUMMY_SUB_DOMAIN}-vpc", DUMMY_DOMAIN, "10.10.0.2"
+        )
+
 
 class TestChooseRegion:
 
@@ -187,7 +225,7 @@ class TestChooseRegion:
 class TestCreateAllVMs:
     def test_correct_amount_createVM_calls(self, mocker):
         """Check that createAllVMs is called the appropriate number of times"""
-        mocker.patch("vmManagement.addSSHKey", return_value=DUMMY_ID)
+        mocker.patch("vmManagement.findSSHKeyId", return_value=DUMMY_ID)
         mocker.patch("vmManagement.chooseRegion", return_value=DEFAULT_REGION)
         mocker.patch("vmManagement.createVM")
 
@@ -199,6 +237,201 @@ class TestCreateAllVMs:
         # DUMMY_SENSOR_OBJS + 1 for DUMMY_LOGGING_OBJ
         assert vmManagement.createVM.call_count == len(DUMMY_SENSOR_OBJS) + 1
 
+    def test_createVM_calls_logging_nodes(self, mocker):
+        """Check that createAllVMs also creates every extra logging node"""
+        mocker.patch("vmManagement.findSSHKeyId", return_value=DUMMY_ID)
+        mocker.patch("vmManagement.chooseRegion", return_value=DEFAULT_REGION)
+        mocker.patch("vmManagement.createVM")
+
+        loggingObj = {**DUMMY_LOGGING_OBJ, "nodes": [DUMMY_LOGGING_OBJ] * 2}
+        vmManagement.createAllVMs(
+            DUMMY_TOKEN, loggingObj, DUMMY_SENSOR_OBJS, DUMMY_SSH_KEY
+        )
+
+        # 1 logging server + 2 extra logging nodes, all with logging server size
+        loggerCalls = [
+            call
+            for call in vmManagement.createVM.call_args_list
+            if call[1]["size"] == vmManagement.LOGGER_SIZE
+        ]
+        assert len(loggerCalls) == 3
+        assert vmManagement.createVM.call_count == len(DUMMY_SENSOR_OBJS) + 3
+
+    def test_createVM_calls_filebeat_sensors(self, mocker):
+        """Check that sensors shipping with Filebeat get the smaller droplet size"""
+        mocker.patch("vmManagement.findSSHKeyId", return_value=DUMMY_ID)
+        mocker.patch("vmManagement.chooseRegion", return_value=DEFAULT_REGION)
+        mocker.patch("vmManagement.createVM")
+
+        sensorObjs = DUMMY_SENSOR_OBJS + [
+            {**DUMMY_SENSOR_OBJS[0], "shipper": "filebeat"}
+        ]
+        vmManagement.createAllVMs(
+            DUMMY_TOKEN, DUMMY_LOGGING_OBJ, sensorObjs, DUMMY_SSH_KEY
+        )
+
+        sensorSizes = [
+            call[1].get("size") for call in vmManagement.createVM.call_args_list[1:]
+        ]
+        assert sensorSizes == [vmManagement.SENSOR_SIZE] * len(DUMMY_SENSOR_OBJS) + [
+            vmManagement.SHIPPER_SIZE
+        ]
+
+    def test_createVM_calls_per_host_settings(self, mocker):
+        """Check that size, image and region set on a host override the defaults"""
+        mocker.patch("vmManagement.findSSHKeyId", return_value=DUMMY_ID)
+        mocker.patch("vmManagement.chooseRegion", return_value=DEFAULT_REGION)
+        mocker.patch("vmManagement.createVM")
+
+        loggingObj = {**DUMMY_LOGGING_OBJ, "size": "s-8vcpu-16gb"}
+        sensorObjs = [
+            {**DUMMY_SENSOR_OBJS[0], "image": "debian-11-x64", "region": "fra1"}
+        ]
+        vmManagement.createAllVMs(DUMMY_TOKEN, loggingObj, sensorObjs, DUMMY_SSH_KEY)
+
+        loggerCall, sensorCall = vmManagement.createVM.call_args_list
+        assert loggerCall[1]["size"] == "s-8vcpu-16gb"
+        assert loggerCall[1]["image"] == vmManagement.DEFAULT_IMAGE
+        assert loggerCall[0][3] == DEFAULT_REGION
+        assert sensorCall[1]["size"] == vmManagement.SENSOR_SIZE
+        assert sensorCall[1]["image"] == "debian-11-x64"
+        assert sensorCall[0][3] == "fra1"
+
+    def test_createVM_calls_vpc(self, mocker):
+        """Check that every droplet goes in the VPC of the logging server's region"""
+        mocker.patch("vmManagement.findSSHKeyId", return_value=DUMMY_ID)
+        mocker.patch("vmManagement.chooseRegion", return_value=DEFAULT_REGION)
+        mocker.patch("vmManagement.createVPC", return_value=("vpcId", DUMMY_RANGE))
+        mocker.patch("vmManagement.createVM")
+
+        vpcRange = vmManagement.createAllVMs(
+            DUMMY_TOKEN, DUMMY_LOGGING_OBJ, DUMMY_SENSOR_OBJS, DUMMY_SSH_KEY, vpc=True
+        )
+
+        assert vpcRange == DUMMY_RANGE
+        vmManagement.createVPC.assert_called_once_with(
+            DUMMY_TOKEN, f"tpot-{DUMMY_SUB_DOMAIN}", DEFAULT_REGION
+        )
+        assert all(
+            call[1]["vpcUuid"] == "vpcId"
+            for call in vmManagement.createVM.call_args_list
+        )
+
+    def test_createVM_calls_relays(self, mocker):
+        """Check that regional relays get created in their own region"""
+        mocker.patch("vmManagement.findSSHKeyId", return_value=DUMMY_ID)
+        mocker.patch("vmManagement.chooseRegion", return_value=DEFAULT_REGION)
+        mocker.patch("vmManagement.createVM")
+
+        relayObjs = [{"host": f"relay.{DUMMY_DOMAIN}", "region": "sgp1"}]
+        vmManagement.createAllVMs(
+            DUMMY_TOKEN,
+            DUMMY_LOGGING_OBJ,
+            DUMMY_SENSOR_OBJS,
+            DUMMY_SSH_KEY,
+            relayObjs=relayObjs,
+        )
+
+        relayCall = vmManagement.createVM.call_args_list[-1]
+        assert relayCall[0][1] == "relay"
+        assert relayCall[0][3] == "sgp1"
+        assert relayCall[1]["size"] == vmManagement.RELAY_SIZE
+
+    def test_createVM_calls_tags(self, mocker):
+        """Check that droplets are tagged with their network and role"""
+        mocker.patch("vmManagement.findSSHKeyId", return_value=DUMMY_ID)
+        mocker.patch("vmManagement.chooseRegion", return_value=DEFAULT_REGION)
+        mocker.patch("vmManagement.createVM")
+
+        vmManagement.createAllVMs(
+            DUMMY_TOKEN, DUMMY_LOGGING_OBJ, DUMMY_SENSOR_OBJS[:1], DUMMY_SSH_KEY
+        )
+
+        loggerCall, sensorCall = vmManagement.createVM.call_args_list
+        networkTag = f"tpot-{DUMMY_SUB_DOMAIN}"
+        assert loggerCall[1]["tags"] == [networkTag, "tpot-logging"]
+        assert sensorCall[1]["tags"] == [networkTag, "tpot-sensor"]
+
+    def test_vpc_other_region(self, mocker):
+        """Refuse to create a VPC network spanning several regions"""
+        mocker.patch("vmManagement.findSSHKeyId", return_value=DUMMY_ID)
+        mocker.patch("vmManagement.chooseRegion", return_value=DEFAULT_REGION)
+        mocker.patch("vmManagement.createVM")
+
+        sensorObjs = [{**DUMMY_SENSOR_OBJS[0], "region": "fra1"}]
+
+        with pytest.raises(VPCRegionError):
+            vmManagement.createAllVMs(
+                DUMMY_TOKEN, DUMMY_LOGGING_OBJ, sensorObjs, DUMMY_SSH_KEY, vpc=True
+            )
+
+        vmManagement.createVM.assert_not_called()
+
+
+class TestCreateVPC:
+    def test_reuse_vpc(self, mocker):
+        """Reuse existing VPC with the same name"""
+        mocker.patch(
+            "vmManagement.requests.get",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                kwargsDict=kwargs, jsonType="vpcs"
+            ),
+        )
+        mocker.patch("vmManagement.requests.post")
+
+        vpc = vmManagement.createVPC(DUMMY_TOKEN, "tpot-logger", DUMMY_REGION)
+
+        assert vpc == (DUMMY_ID, DUMMY_RANGE)
+        vmManagement.requests.post.assert_not_called()
+
+    def test_create_vpc(self, mocker):
+        """Create VPC when none has the name"""
+        mocker.patch(
+            "vmManagement.requests.get",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                kwargsDict=kwargs, jsonType="vpcs"
+            ),
+        )
+        mocker.patch(
+            "vmManagement.requests.post",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                kwargsDict=kwargs, jsonType="createVPC"
+            ),
+        )
+
+        vpc = vmManagement.createVPC(DUMMY_TOKEN, "tpot-new", DUMMY_REGION)
+
+        assert vpc == (DUMMY_ID, DUMMY_RANGE)
+        assert vmManagement.requests.post.call_args[1]["json"] == {
+            "name": "tpot-new",
+            "region": DUMMY_REGION,
+        }
+
+
+class TestDeleteVPC:
+    def test_wait_for_droplets(self, mocker):
+        """Retry deleting VPC while its droplets are still being deleted"""
+        mocker.patch("vmManagement.time.sleep")
+        mocker.patch(
+            "vmManagement.requests.get",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                kwargsDict=kwargs, jsonType="vpcs"
+            ),
+        )
+        mocker.patch(
+            "vmManagement.requests.delete",
+            side_effect=[
+                MockResponse(statusCode=403),
+                MockResponse(statusCode=403),
+                MockResponse(statusCode=204),
+            ],
+        )
+
+        vmManagement.deleteVPC(DUMMY_TOKEN, "tpot-logger")
+
+        assert vmManagement.requests.delete.call_count == 3
+        assert str(DUMMY_ID) in vmManagement.requests.delete.call_args[0][0]
+
 
 class TestDeleteSSHKey:
 
@@ -233,3 +466,255 @@ class TestDeleteSSHKey:
         # DUMMY_ID returned in JSON of requests.get should be in the API endpoint for
         # the requests.delete call
         assert str(DUMMY_ID) in vmManagement.requests.delete.call_args[0][0]
+
+
+class TestFindSSHKeyId:
+    def test_existing_key(self, mocker):
+        """Reuse the key already added by deployNetwork"""
+        mocker.patch("vmManagement.requests.get", return_value=MockResponse())
+        mocker.patch.object(
+            MockResponse,
+            "json",
+            return_value={
+                "ssh_keys": [
+                    {"id": 1, "public_key": "other key"},
+                    {"id": DUMMY_ID, "public_key": f"{DUMMY_SSH_KEY}\n"},
+                ]
+            },
+        )
+        mocker.patch("vmManagement.addSSHKey")
+
+        assert vmManagement.findSSHKeyId(DUMMY_TOKEN, DUMMY_SSH_KEY) == DUMMY_ID
+        vmManagement.addSSHKey.assert_not_called()
+
+    def test_missing_key(self, mocker):
+        mocker.patch("vmManagement.requests.get", return_value=MockResponse())
+        mocker.patch.object(MockResponse, "json", return_value={"ssh_keys": []})
+        mocker.patch("vmManagement.addSSHKey", return_value=DUMMY_ID)
+
+        assert vmManagement.findSSHKeyId(DUMMY_TOKEN, DUMMY_SSH_KEY) == DUMMY_ID
+        vmManagement.addSSHKey.assert_called_once()
+
+
+class TestPlanReconcile:
+    def test_missing_and_removed(self, mocker):
+        """Only sensor droplets of the network count, whatever other droplets are
+        named"""
+        networkDroplets = [
+            {"name": "subdomain", "id": 1, "tags": ["tpot-subdomain", "tpot-logging"]},
+            {"name": "sensor1", "id": 2, "tags": ["tpot-subdomain", "tpot-sensor"]},
+            {"name": "old-sensor", "id": 3, "tags": ["tpot-subdomain", "tpot-sensor"]},
+        ]
+        mocker.patch("vmManagement.listDroplets", return_value=networkDroplets)
+        sensorObjs = [
+            {"host": f"sensor1.{DUMMY_DOMAIN}"},
+            # another network's sensor2 doesn't hide that this one is missing
+            {"host": f"sensor2.{DUMMY_DOMAIN}"},
+        ]
+
+        missing, removed = vmManagement.planReconcile(
+            DUMMY_TOKEN, DUMMY_LOGGING_OBJ, sensorObjs
+        )
+
+        assert missing == sensorObjs[1:]
+        assert removed == networkDroplets[2:]
+        vmManagement.listDroplets.assert_called_once_with(
+            DUMMY_TOKEN, f"tpot-{DUMMY_SUB_DOMAIN}"
+        )
+
+    def test_list_tagged_droplets(self, mocker):
+        """Follow the next page links past the 200 droplets of the first page"""
+        pages = [
+            {
+                "droplets": [{"name": "sensor1"}],
+                "links": {"pages": {"next": "https://next.page"}},
+            },
+            {"droplets": [{"name": "sensor2"}], "links": {}},
+        ]
+        mocker.patch(
+            "vmManagement.requests.get",
+            side_effect=lambda *args, **kwargs: MockResponse(kwargsDict=kwargs),
+        )
+        mocker.patch.object(MockResponse, "json", side_effect=pages)
+
+        droplets = vmManagement.listDroplets(DUMMY_TOKEN, "tpot-sensor")
+
+        assert droplets == [{"name": "sensor1"}, {"name": "sensor2"}]
+        firstCall, nextCall = vmManagement.requests.get.call_args_list
+        assert firstCall[1]["params"]["tag_name"] == "tpot-sensor"
+        assert nextCall[0][0] == "https://next.page"
+
+
+class TestUntaggedDroplets:
+    def test_find_untagged(self, mocker):
+        """Only untagged droplets the sensors' A records point at are the network's"""
+        droplets = [
+            {
+                "name": name,
+                "id": dropletId,
+                "tags": tags,
+                "networks": {"v4": [{"type": "public", "ip_address": ip}]},
+            }
+            for name, dropletId, tags, ip in [
+                ("sensor1", 1, [], "1.1.1.1"),
+                # same name in another project, not what sensor2's record points at
+                ("sensor2", 2, [], "2.2.2.2"),
+                ("sensor3", 3, ["tpot-subdomain", "tpot-sensor"], "3.3.3.3"),
+                ("unrelated", 4, [], "4.4.4.4"),
+            ]
+        ]
+        records = [
+            {"type": "A", "name": "sensor1", "data": "1.1.1.1"},
+            {"type": "A", "name": "sensor2", "data": "5.5.5.5"},
+            {"type": "A", "name": "sensor3", "data": "3.3.3.3"},
+        ]
+        mocker.patch("vmManagement.listDroplets", return_value=droplets)
+        mocker.patch("vmManagement.listPages", return_value=records)
+        sensorObjs = [
+            {"host": f"sensor{number}.{DUMMY_DOMAIN}"} for number in range(1, 4)
+        ]
+
+        untagged = vmManagement.findUntaggedDroplets(
+            DUMMY_TOKEN, DUMMY_LOGGING_OBJ, sensorObjs
+        )
+
+        assert untagged == droplets[:1]
+
+    def test_tagged_not_missing(self, mocker):
+        """Once tagged, sensors deployed before tagging aren't created again"""
+        legacyDroplet = {"name": "sensor1", "id": DUMMY_ID, "tags": []}
+        mocker.patch(
+            "vmManagement.requests.post",
+            side_effect=lambda *args, **kwargs: MockResponse(
+                kwargsDict=kwargs, statusCode=201
+            ),
+        )
+
+        tags = vmManagement.dropletTags(DUMMY_LOGGING_OBJ, "sensor")
+        vmManagement.tagDroplets(DUMMY_TOKEN, tags, [legacyDroplet["id"]])
+
+        tagCalls = vmManagement.requests.post.call_args_list
+        assert [call[1]["json"] for call in tagCalls[::2]] == [
+            {"name": tag} for tag in tags
+        ]
+        assert tagCalls[1][1]["json"]["resources"] == [
+            {"resource_id": str(DUMMY_ID), "resource_type": "droplet"}
+        ]
+
+        mocker.patch(
+            "vmManagement.listDroplets",
+            return_value=[{**legacyDroplet, "tags": tags}],
+        )
+        sensorObjs = [{"host": f"sensor1.{DUMMY_DOMAIN}"}]
+
+        assert vmManagement.planReconcile(
+            DUMMY_TOKEN, DUMMY_LOGGING_OBJ, sensorObjs
+        ) == ([], [])
+
+    def test_existing_tag(self, mocker):
+        """Tags that already exist are still added to the droplets"""
+        mocker.patch(
+            "vmManagement.requests.post",
+            side_effect=lambda url, **kwargs: MockResponse(
+                kwargsDict=kwargs,
+                statusError=url.endswith("/tags"),
+                statusCode=422 if url.endswith("/tags") else 204,
+            ),
+        )
+
+        vmManagement.tagDroplets(DUMMY_TOKEN, ["tpot-sensor"], [DUMMY_ID])
+
+        assert vmManagement.requests.post.call_count == 2
+
+
+class TestDeleteRemovedSensors:
+    def test_only_droplet_records(self, mocker):
+        """Records with the same name pointing at other droplets stay"""
+        droplet = {
+            "name": "sensor1",
+            "id": DUMMY_ID,
+            "networks": {
+                "v4": [
+                    {"type": "public", "ip_address": "1.1.1.1"},
+                    {"type": "private", "ip_address": "10.0.0.1"},
+                ]
+            },
+        }
+        records = [
+            {"id": 1, "type": "A", "name": "sensor1", "data": "1.1.1.1"},
+            {"id": 2, "type": "A", "name": "sensor1-vpc", "data": "10.0.0.1"},
+            {"id": 3, "type": "A", "name": "sensor1", "data": "2.2.2.2"},
+            {"id": 4, "type": "A", "name": "sensor1-vpc", "data": "10.0.0.2"},
+        ]
+        mocker.patch("vmManagement.listPages", return_value=records)
+        mocker.patch(
+            "vmManagement.requests.delete",
+            side_effect=lambda *args, **kwargs: MockResponse(kwargsDict=kwargs),
+        )
+
+        vmManagement.deleteDropletRecords(DUMMY_TOKEN, [DUMMY_DOMAIN], [droplet])
+
+        deleted = [
+            call[0][0].rsplit("/", 1)[1]
+            for call in vmManagement.requests.delete.call_args_list
+        ]
+        assert deleted == ["1", "2"]
+
+    def test_delete_by_id(self, mocker):
+        mocker.patch(
+            "vmManagement.requests.delete",
+            side_effect=lambda *args, **kwargs: MockResponse(kwargsDict=kwargs),
+        )
+
+        vmManagement.deleteDropletsById(DUMMY_TOKEN, [DUMMY_ID])
+
+        assert vmManagement.requests.delete.call_args[0][0].endswith(f"/{DUMMY_ID}")
+
+
+class TestAPIRemoveNetwork:
+    def test_remove_own_network(self, mocker):
+        """Only the network's droplets go, the SSH key stays for other networks"""
+        ownDroplet = {"name": "sensor1", "id": 1, "tags": ["tpot-subdomain"]}
+        otherDroplet = {
+            "name": "sensor1",
+            "id": 2,
+            "tags": ["tpot-other", "tpot-sensor"],
+        }
+        mocker.patch(
+            "vmManagement.listDroplets",
+            side_effect=lambda apiToken, tag=None: (
+                [ownDroplet] if tag else [ownDroplet, otherDroplet]
+            ),
+        )
+        mocker.patch("vmManagement.findUntaggedDroplets", return_value=[])
+        mocker.patch("vmManagement.deleteDropletRecords")
+        mocker.patch("vmManagement.deleteDropletsById")
+        mocker.patch("vmManagement.deleteSSHKey")
+
+        vmManagement.APIRemoveNetwork(DUMMY_TOKEN, DUMMY_LOGGING_OBJ, DUMMY_SENSOR_OBJS)
+
+        vmManagement.deleteDropletRecords.assert_called_once_with(
+            DUMMY_TOKEN, [DUMMY_DOMAIN], [ownDroplet]
+        )
+        vmManagement.deleteDropletsById.assert_called_once_with(DUMMY_TOKEN, [1])
+        vmManagement.deleteSSHKey.assert_not_called()
+
+    def test_remove_last_network(self, mocker):
+        """Untagged droplets of old networks go too, and so does the unused SSH key"""
+        ownDroplet = {"name": "sensor1", "id": 1, "tags": ["tpot-subdomain"]}
+        legacyDroplet = {"name": "subdomain", "id": 2, "tags": []}
+        mocker.patch(
+            "vmManagement.listDroplets",
+            side_effect=lambda apiToken, tag=None: (
+                [ownDroplet] if tag else [ownDroplet, legacyDroplet]
+            ),
+        )
+        mocker.patch("vmManagement.findUntaggedDroplets", return_value=[legacyDroplet])
+        mocker.patch("vmManagement.deleteDropletRecords")
+        mocker.patch("vmManagement.deleteDropletsById")
+        mocker.patch("vmManagement.deleteSSHKey")
+
+        vmManagement.APIRemoveNetwork(DUMMY_TOKEN, DUMMY_LOGGING_OBJ, DUMMY_SENSOR_OBJS)
+
+        vmManagement.deleteDropletsById.assert_called_once_with(DUMMY_TOKEN, [1, 2])
+        vmManagement.deleteSSHKey.assert_called_once_with(DUMMY_TOKEN)
@@ -6,36 +6,44 @@ from fabric import Config, Connection
 from invoke.config import Config as InvokeConfig
 from invoke.context import Context
 
-from deploymentHelpers import transferSSLCerts
+from deploymentHelpers import transferRelayCerts, transferSSLCerts
+from utils import getLoggingNodes, usesFilebeat
 
 # Fabric script to automatically handle SSL certificate renewal with ELK services
 # check logs at /var/log/letsencrypt/letsencrypt.log for debugging
 
-# change working directory to command-line argument to be able to find config files
-os.chdir(sys.argv[1])
-
-credsFile = "credentials.json"
+# command-line argument is the network's workspace directory, so several networks
+# deployed from this server renew independently
+workspace = sys.argv[1]
+credsFile = os.path.join(workspace, "credentials.json")
 
 elasticPath = "/etc/elasticsearch"
 elasticCertsPath = f"{elasticPath}/certs"
 kibanaPath = "/etc/kibana"
 kibanaCertsPath = f"{kibanaPath}/certs"
 dataPath = "/data/elk"
+logstashPath = "/etc/logstash"
 
 with open(credsFile) as f:
     credentials = json.load(f)
     deploymentCreds = credentials["deployment"]
     logCreds = credentials["logging"]
     sensorCreds = credentials["sensors"]
+    relayCreds = credentials.get("relays", [])
 
 loggingHost = logCreds["host"]
 sudoUser = credentials["sudouser"]
+# logging server runs Logstash for Filebeat sensors and relays, whose beats input
+# uses the certs
+centralLogstash = bool(relayCreds) or any(
+    usesFilebeat(sensor) for sensor in sensorCreds
+)
 
 deploymentConf = InvokeConfig()
 deploymentConf.sudo.password = deploymentCreds["sudopass"]
 deploymentConn = Context(config=deploymentConf)
 
-tempCertPath = "tempCerts"
+tempCertPath = os.path.join(workspace, "tempCerts")
 deploymentConn.run(f"mkdir {tempCertPath}", hide="stdout")
 deploymentConn.sudo(
     f"sh -c 'cp /etc/letsencrypt/live/{loggingHost}/* {tempCertPath}/'", hide=True
@@ -45,11 +53,16 @@ deploymentConn.sudo(f"chmod +r {tempCertPath}/privkey.pem", hide=True)
 # can log to stdout because certbot saves logs from it
 print("Created temporary certificates directory on deployment server")
 
-logConn = Connection(
-    host=loggingHost,
-    user=sudoUser,
-    config=Config(overrides={"sudo": {"password": logCreds["sudopass"]}}),
-)
+# logging server comes first, followed by any other logging nodes
+logConns = [
+    Connection(
+        host=node["host"],
+        user=sudoUser,
+        config=Config(overrides={"sudo": {"password": node["sudopass"]}}),
+    )
+    for node in getLoggingNodes(logCreds)
+]
+logConn = logConns[0]
 
 sensorConns = [
     Connection(
@@ -61,33 +74,57 @@ sensorConns = [
     for obj in sensorCreds
 ]
 
+relayConns = [
+    Connection(
+        host=obj["host"],
+        user=sudoUser,
+        config=Config(overrides={"sudo": {"password": obj["sudopass"]}}),
+    )
+    for obj in relayCreds
+]
+
 for conn in sensorConns:
     conn.sudo("systemctl stop tpot", hide=True)
 
 print("Stopped T-Pot on all sensor servers")
 
 logConn.sudo("systemctl stop kibana.service", hide=True)
-logConn.sudo("systemctl stop elasticsearch.service", hide=True)
-
-print("Stopped kibana and elasticsearch on logging server")
-
-transferSSLCerts(
-    logConn,
-    tempCertPath,
-    loggingServer=True,
-    elasticPath=elasticPath,
-    elasticCertsPath=elasticCertsPath,
-    kibanaPath=kibanaPath,
-    kibanaCertsPath=kibanaCertsPath,
-)
 
+if centralLogstash:
+    logConn.sudo("systemctl stop logstash.service", hide=True)
+
+for conn in logConns:
+    conn.sudo("systemctl stop elasticsearch.service", hide=True)
+
+print("Stopped kibana and elasticsearch on all logging nodes")
+
+for conn in logConns:
+    # only the logging server itself runs kibana
+    isLoggingServer = conn is logConn
+
+    transferSSLCerts(
+        conn,
+        tempCertPath,
+        loggingServer=True,
+        elasticPath=elasticPath,
+        elasticCertsPath=elasticCertsPath,
+        kibanaPath=kibanaPath if isLoggingServer else None,
+        kibanaCertsPath=kibanaCertsPath if isLoggingServer else None,
+        logstashPath=logstashPath if isLoggingServer and centralLogstash else None,
+    )
 
-print("Transferred SSL certificates to logging server")
 
-logConn.sudo("systemctl start elasticsearch.service", hide=True)
+print("Transferred SSL certificates to all logging nodes")
+
+for conn in logConns:
+    conn.sudo("systemctl start elasticsearch.service", hide=True)
+
 logConn.sudo("systemctl start kibana.service", hide=True)
 
-print("Restarted elasticsearch and kibana on logging server")
+if centralLogstash:
+    logConn.sudo("systemctl start logstash.service", hide=True)
+
+print("Restarted elasticsearch and kibana on all logging nodes")
 
 for conn in sensorConns:
     transferSSLCerts(conn, tempCertPath, loggingServer=False, dataPath=dataPath)
@@ -95,8 +132,13 @@ for conn in sensorConns:
 
 print("Transferred SSL certificates to all sensor servers and restarted T-Pot")
 
-logConn.close()
-for conn in sensorConns:
+for conn in relayConns:
+    transferRelayCerts(conn, tempCertPath)
+    conn.sudo("systemctl restart logstash.service", hide=True)
+
+print("Transferred SSL certificates to all relays and restarted Logstash")
+
+for conn in logConns + sensorConns + relayConns:
     conn.close()
 
 deploymentConn.run(f"rm -rf {tempCertPath}", hide="stdout")
@@ -1,10 +1,22 @@
+import json
 import re
 import time
 
 import requests
 from requests.exceptions import ConnectionError
 
-from errors import NoSubdomainError, NotFoundError
+from errors import (NoIngestNodeError, NoSubdomainError, NotFoundError,
+                    UnknownSizeError)
+
+# memory of DigitalOcean sizes whose slug doesn't include it (CPU-optimized droplets)
+DROPLET_MEMORY_MB = {
+    "c-2": 4096,
+    "c-4": 8192,
+    "c-8": 16384,
+    "c-16": 32768,
+    "c-32": 65536,
+    "c-48": 98304,
+}
 
 
 def findPassword(passwordText, username):
@@ -26,6 +38,21 @@ def findPassword(passwordText, username):
         raise NotFoundError(f"{username} password not found in text.")
 
 
+def findTPotFlavor(tPotConfText):
+    """Find T-Pot flavor (edition) in T-Pot installer's tpot.conf
+
+    :tPotConfText: text of tpot.conf as a string
+    :returns: flavor as a string (such as SENSOR)
+
+    """
+    flavorMatch = re.search(r"^myCONF_TPOT_FLAVOR='(\w+)'", tPotConfText, re.MULTILINE)
+
+    if flavorMatch is None:
+        raise NotFoundError("myCONF_TPOT_FLAVOR not found in tpot.conf.")
+
+    return flavorMatch.group(1)
+
+
 def waitForService(host, port):
     """Simple function to block until the specified port on host opens up
 
@@ -62,3 +89,359 @@ def splitDomain(fqdnStr):
         )
     else:
         return domainTup
+
+
+def tPotHostname(fqdn):
+    """Get the hostname a sensor's events carry in their t-pot_hostname field, which
+    deploymentHelpers.setTPotHostname sets to the sensor's subdomain in place of the
+    random one T-Pot's install.sh picks
+
+    :fqdn: FQDN of sensor server (of the form subdomain.domain.com)
+    :returns: T-Pot hostname of sensor
+
+    """
+    return splitDomain(fqdn)[0]
+
+
+def privateHost(fqdn):
+    """Get FQDN of the A record pointing to a server's private (VPC) address, which
+    vmManagement.createVM adds next to its public A record
+
+    :fqdn: public FQDN of server (of the form subdomain.domain.com)
+    :returns: private FQDN of the form subdomain-vpc.domain.com
+
+    """
+    subDomain, domainName = splitDomain(fqdn)
+
+    return f"{subDomain}-vpc.{domainName}"
+
+
+def centralLogstashHost(loggingObj):
+    """Get FQDN Filebeat sensors and relays ship to, the central Logstash on the
+    logging server
+
+    :loggingObj: JSON object representing logging server
+    :returns: private FQDN of logging server in a VPC, its public FQDN otherwise
+
+    """
+    if loggingObj.get("vpc", False):
+        return privateHost(loggingObj["host"])
+
+    return loggingObj["host"]
+
+
+def dropletMemoryMb(sizeSlug):
+    """Get amount of memory of a DigitalOcean droplet from its size slug
+
+    :sizeSlug: droplet size slug (such as "s-4vcpu-8gb", "s-1vcpu-512mb-10gb", "c-4"
+    or "2gb")
+    :returns: amount of memory in MB as an int
+
+    """
+    if sizeSlug in DROPLET_MEMORY_MB:
+        return DROPLET_MEMORY_MB[sizeSlug]
+
+    # legacy slugs like 2gb only give the memory
+    memMatch = re.search(r"vcpu-(\d+)(gb|mb)", sizeSlug) or re.fullmatch(
+        r"(\d+)(gb|mb)", sizeSlug
+    )
+
+    if memMatch is None:
+        raise UnknownSizeError(f"Could not find amount of memory in {sizeSlug}")
+
+    amount, unit = memMatch.groups()
+
+    return int(amount) * 1024 if unit == "gb" else int(amount)
+
+
+def getLoggingNodes(loggingObj):
+    """Get all Elasticsearch nodes of the logging tier from the logging server object
+    in credentials.json. The logging server itself always comes first and is followed
+    by any objects in its optional nodes array
+
+    :loggingObj: JSON object representing logging server
+    :returns: list of JSON objects representing logging nodes
+
+    """
+    primary = {key: val for key, val in loggingObj.items() if key != "nodes"}
+
+    return [primary] + loggingObj.get("nodes", [])
+
+
+def nodeHasRole(nodeObj, role):
+    """Check whether a logging node has an Elasticsearch role. Nodes without a roles
+    key in credentials.json have every role
+
+    :nodeObj: JSON object representing logging node
+    :role: role name (master, data, ingest or coordinating)
+    :returns: True if node has role, False otherwise
+
+    """
+    roles = nodeObj.get("roles")
+
+    if roles is None:
+        return role != "coordinating"
+
+    return role in roles
+
+
+def getIngestHosts(loggingNodes, privateNetwork=False):
+    """Get FQDNs of the logging nodes that can index events (data or ingest role),
+    which sensors load-balance their bulk requests over
+
+    :loggingNodes: list of JSON objects representing logging nodes (as returned by
+    getLoggingNodes)
+    :privateNetwork: optional, whether sensors reach the nodes over the VPC (using the
+    names from privateHost). Defaults to False
+    :returns: list of FQDNs
+    :raises NoIngestNodeError: if no node has the data or ingest role
+
+    """
+    ingestHosts = [
+        privateHost(node["host"]) if privateNetwork else node["host"]
+        for node in loggingNodes
+        if nodeHasRole(node, "data") or nodeHasRole(node, "ingest")
+    ]
+
+    # sensors would render hosts => [] and ship nowhere
+    if not ingestHosts:
+        raise NoIngestNodeError(
+            "No logging node has the data or ingest role in credentials.json, so"
+            " sensors would have nowhere to send events"
+        )
+
+    return ingestHosts
+
+
+def findSavedObjectFields(objectsText):
+    """Find fields referenced by Kibana saved objects (visualizations, saved searches,
+    dashboards and lens objects) exported as ndjson, grouped by the honeypot types
+    their type filters or queries limit them to
+
+    :objectsText: text of saved objects export, one JSON object per line
+    :returns: dictionary mapping honeypot types to sets of referenced field names,
+    without any .keyword suffix. Fields of objects limited to no type are under None
+
+    """
+    objectFields = {}
+    objectTypes = {}
+    references = {}
+
+    def walk(value, fields, types, parentKey=None):
+        # saved objects nest JSON documents as strings (visState, searchSourceJSON)
+        if isinstance(value, str) and value[:1] in ["{", "["]:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                return
+
+        if isinstance(value, dict):
+            meta = value.get("meta")
+
+            # filter on the type field, such as type: Cowrie
+            if (
+                isinstance(meta, dict)
+                and meta.get("key") == "type"
+                and not meta.get("negate")
+            ):
+                params = meta.get("params")
+
+                if isinstance(params, dict) and isinstance(params.get("query"), str):
+                    types.add(params["query"])
+                elif isinstance(params, list):
+                    types.update(param for param in params if isinstance(param, str))
+
+            # kuery or lucene query such as type:"Cowrie" OR type:"Dionaea"
+            if isinstance(value.get("query"), str) and "language" in value:
+                types.update(re.findall(r'\btype\s*:\s*"?(\w+)"?', value["query"]))
+
+            for key, subValue in value.items():
+                if key in ["field", "sourceField", "terms_field"] and isinstance(
+                    subValue, str
+                ):
+                    fields.add(subValue)
+                elif key == "key" and parentKey == "meta" and isinstance(subValue, str):
+                    # field of a pinned or dashboard filter, custom filters have none
+                    if value.get("type") != "custom":
+                        fields.add(subValue)
+                else:
+                    walk(subValue, fields, types, key)
+        elif isinstance(value, list):
+            # columns of saved searches are plain lists of field names
+            if parentKey == "columns" and all(isinstance(v, str) for v in value):
+                fields.update(value)
+            else:
+                for subValue in value:
+                    walk(subValue, fields, types, parentKey)
+
+    for index, line in enumerate(objectsText.splitlines()):
+        if not line.strip():
+            continue
+
+        savedObject = json.loads(line)
+
+        # index patterns list every field ever seen, used or not
+        if savedObject.get("type") == "index-pattern":
+            continue
+
+        objectId = savedObject.get("id", index)
+        objectFields[objectId] = set()
+        objectTypes[objectId] = set()
+        references[objectId] = [ref["id"] for ref in savedObject.get("references", [])]
+        walk(
+            savedObject.get("attributes", {}),
+            objectFields[objectId],
+            objectTypes[objectId],
+        )
+
+    # panels without a type of their own show the types of their dashboard
+    inheritedTypes = {}
+
+    for objectId, types in objectTypes.items():
+        for refId in references[objectId]:
+            if types and refId in objectTypes and not objectTypes[refId]:
+                inheritedTypes.setdefault(refId, set()).update(types)
+
+    typeFields = {}
+
+    for objectId, fields in objectFields.items():
+        for honeypotType in objectTypes[objectId] or inheritedTypes.get(
+            objectId, [None]
+        ):
+            typeFields.setdefault(honeypotType, set()).update(
+                re.sub(r"\.keyword$", "", field)
+                for field in fields
+                if field != "_source"
+            )
+
+    return typeFields
+
+
+def replaceIndexPatternTitle(objectsText, oldTitle, newTitle):
+    """Point index pattern(s) of Kibana saved objects exported as ndjson to other
+    indices, keeping their IDs so dashboards and visualizations still reference them
+
+    :objectsText: text of saved objects export, one JSON object per line
+    :oldTitle: title (index pattern) to replace, such as logstash-*
+    :newTitle: title to replace it with
+    :returns: text of saved objects export with index pattern title(s) replaced
+
+    """
+    lines = []
+
+    for line in objectsText.splitlines():
+        if line.strip():
+            savedObject = json.loads(line)
+            attributes = savedObject.get("attributes", {})
+
+            if (
+                savedObject.get("type") == "index-pattern"
+                and attributes.get("title") == oldTitle
+            ):
+                attributes["title"] = newTitle
+                line = json.dumps(savedObject)
+
+        lines.append(line)
+
+    return "\n".join(lines) + "\n"
+
+
+def addSearchFilter(objectsText, query, alias):
+    """Add a filter to every dashboard, visualization and saved search of Kibana
+    saved objects exported as ndjson
+
+    :objectsText: text of saved objects export, one JSON object per line
+    :query: Elasticsearch query documents have to match
+    :alias: label of the filter in Kibana
+    :returns: text of saved objects export with the filter added
+
+    """
+    searchFilter = {
+        "meta": {
+            "alias": alias,
+            "negate": False,
+            "disabled": False,
+            "type": "custom",
+            "key": "query",
+            "value": json.dumps(query),
+        },
+        "query": query,
+        "$state": {"store": "appState"},
+    }
+    lines = []
+
+    for line in objectsText.splitlines():
+        if line.strip():
+            savedObject = json.loads(line)
+
+            if savedObject.get("type") in ["dashboard", "visualization", "search"]:
+                searchMeta = savedObject.setdefault("attributes", {}).setdefault(
+                    "kibanaSavedObjectMeta", {}
+                )
+                searchSource = json.loads(searchMeta.get("searchSourceJSON") or "{}")
+                searchSource["filter"] = searchSource.get("filter", []) + [searchFilter]
+                searchMeta["searchSourceJSON"] = json.dumps(searchSource)
+                line = json.dumps(savedObject)
+
+        lines.append(line)
+
+    return "\n".join(lines) + "\n"
+
+
+def usesFilebeat(sensorObj):
+    """Check whether a sensor server ships raw events with Filebeat instead of
+    parsing them with its own Logstash
+
+    :sensorObj: JSON object representing sensor server
+    :returns: True if sensor's shipper key in credentials.json is filebeat, False
+    otherwise
+
+    """
+    return sensorObj.get("shipper", "logstash") == "filebeat"
+
+
+def findRelay(sensorObj, relayObjs):
+    """Find regional relay in the same region as a sensor server. Sensors without a
+    region key never use a relay, since the default region vmManagement.createVMs
+    puts them in depends on the account's other droplets at deployment time
+
+    :sensorObj: JSON object representing sensor server
+    :relayObjs: array of JSON objects representing regional relays
+    :returns: JSON object representing relay, or None if the sensor's region has none
+    or it has no region key
+
+    """
+    if sensorObj.get("region") is None:
+        return None
+
+    for relayObj in relayObjs:
+        if relayObj.get("region") == sensorObj.get("region"):
+            return relayObj
+
+    return None
+
+
+def replaceComposeService(composeText, serviceName, newServiceText=""):
+    """Replace (or remove) a service of T-Pot's docker-compose file, along with the
+    "# Name service" comment line above it
+
+    :composeText: text of docker-compose file (such as /opt/tpot/etc/tpot.yml)
+    :serviceName: name of service to replace
+    :newServiceText: optional, text of service to put in its place. If left blank,
+    the service is removed
+    :returns: text of docker-compose file with service replaced
+
+    """
+    # service keys are indented by 2 spaces and their settings by 4 or more
+    serviceRegex = re.compile(
+        rf"^(?:#.*\n)?  {re.escape(serviceName)}:\n(?:(?:    .*)?\n)*",
+        flags=re.MULTILINE,
+    )
+
+    if serviceRegex.search(composeText) is None:
+        raise NotFoundError(f"{serviceName} service not found in docker-compose file.")
+
+    if newServiceText:
+        newServiceText = newServiceText.rstrip("\n") + "\n\n"
+
+    return serviceRegex.sub(lambda _: newServiceText, composeText, count=1)
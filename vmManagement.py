@@ -3,10 +3,20 @@ from datetime import datetime
 
 import requests
 
-from utils import splitDomain
+from errors import VPCRegionError
+from utils import getLoggingNodes, splitDomain, usesFilebeat
 
 KEY_BASE_NAME = "T-Pot deployment"
 DEFAULT_REGION = "nyc1"
+LOGGER_SIZE = "s-4vcpu-8gb"
+SENSOR_SIZE = "s-2vcpu-4gb"
+# sensors shipping with Filebeat don't run a JVM
+SHIPPER_SIZE = "s-1vcpu-2gb"
+# regional relays only run Logstash with an input and an output
+RELAY_SIZE = "s-1vcpu-2gb"
+DEFAULT_IMAGE = "debian-10-x64"
+# roles of droplets, each tagged with one (see dropletTags)
+ROLES = ["logging", "sensor", "relay"]
 
 
 def addSSHKey(apiToken, keyName, keyContent):
@@ -49,12 +59,13 @@ def createARecord(apiToken, subDomain, domainName, ipAddress):
     recordReq.raise_for_status()
 
 
-def waitForVM(apiToken, dropletId):
+def waitForVM(apiToken, dropletId, networkType="public"):
     """Block until DigitalOcean droplet (created by createVM) is up and running (until
     it has an IP address associated to it) and return IP address
 
     :apiToken: DigitalOcean API key
     :dropletId: ID of droplet
+    :networkType: optional, public or private (VPC) address. Defaults to public
     :returns: IPv4 address of droplet
 
     """
@@ -66,13 +77,24 @@ def waitForVM(apiToken, dropletId):
         dropletReq = requests.get(endpoint, headers=headers)
         try:
             for ipInfo in dropletReq.json()["droplet"]["networks"]["v4"]:
-                if ipInfo["type"] == "public":
+                if ipInfo["type"] == networkType:
                     return ipInfo["ip_address"]
         except KeyError:
             pass
 
 
-def createVM(apiToken, name, domainName, region, sshKeyId, loggerSize=False):
+def createVM(
+    apiToken,
+    name,
+    domainName,
+    region,
+    sshKeyId,
+    loggerSize=False,
+    size=None,
+    image=DEFAULT_IMAGE,
+    vpcUuid=None,
+    tags=None,
+):
     """Create DigitalOcean droplet with associated DNS A record
 
     :apiToken: DigitalOcean API key
@@ -80,22 +102,37 @@ def createVM(apiToken, name, domainName, region, sshKeyId, loggerSize=False):
     :domainName: top-level domain name for DNS record
     :region: chosen region for droplet (such as "nyc1", etc.)
     :sshKeyId: ID of SSH key to add to droplet (returned by addSSHKey)
-    :loggerSize: size slug of droplet (such as "s-4vcpu-8gb", etc.)
+    :loggerSize: optional, whether to create droplet with LOGGER_SIZE instead of
+    SENSOR_SIZE. Defaults to False
+    :size: optional, size slug of droplet overriding loggerSize (such as
+    SHIPPER_SIZE)
+    :image: optional, image slug of droplet. Defaults to DEFAULT_IMAGE
+    :vpcUuid: optional, ID of VPC to put droplet in (returned by createVPC). If
+    given, also adds an A record of the form name-vpc pointing to its private address
+    :tags: optional, list of droplet tags (as returned by dropletTags)
     :returns: None
 
     """
     endpoint = "https://api.digitalocean.com/v2/droplets"
     headers = {"Authorization": f"Bearer {apiToken}"}
 
-    size = "s-4vcpu-8gb" if loggerSize else "s-2vcpu-4gb"
+    if size is None:
+        size = LOGGER_SIZE if loggerSize else SENSOR_SIZE
 
     dropletData = {
         "name": name,
         "region": region,
         "size": size,
-        "image": "debian-10-x64",
+        "image": image,
         "ssh_keys": [sshKeyId],
     }
+
+    if vpcUuid is not None:
+        dropletData["vpc_uuid"] = vpcUuid
+
+    if tags:
+        dropletData["tags"] = tags
+
     dropletReq = requests.post(endpoint, json=dropletData, headers=headers)
     dropletReq.raise_for_status()
 
@@ -105,6 +142,83 @@ def createVM(apiToken, name, domainName, region, sshKeyId, loggerSize=False):
 
     createARecord(apiToken, name, domainName, ipAddress)
 
+    # same name as utils.privateHost, which the certificate also covers
+    if vpcUuid is not None:
+        privateIp = waitForVM(apiToken, dropletId, "private")
+        createARecord(apiToken, f"{name}-vpc", domainName, privateIp)
+
+
+def vpcName(loggingObj):
+    """Get name of the VPC of a T-Pot network, named after its logging server
+
+    :loggingObj: JSON object representing logging server
+    :returns: VPC name
+
+    """
+    return f"tpot-{splitDomain(loggingObj['host'])[0]}"
+
+
+def dropletTags(loggingObj, role):
+    """Get DigitalOcean tags of a droplet of a T-Pot network, which let
+    reconcileNetwork.py find the droplets of removed servers
+
+    :loggingObj: JSON object representing logging server
+    :role: role of droplet, logging, sensor or relay
+    :returns: list of tags, the network's (same as its VPC name) and the role's
+
+    """
+    return [vpcName(loggingObj), f"tpot-{role}"]
+
+
+def createVPC(apiToken, name, region):
+    """Create DigitalOcean VPC, or reuse the VPC with that name if it already exists
+
+    :apiToken: DigitalOcean API key
+    :name: chosen name for VPC (as returned by vpcName)
+    :region: region of VPC, which all of its droplets have to be in
+    :returns: tuple of the form (VPC ID, VPC private IP range in CIDR notation)
+
+    """
+    endpoint = "https://api.digitalocean.com/v2/vpcs"
+    headers = {"Authorization": f"Bearer {apiToken}"}
+    vpcReq = requests.get(endpoint, headers=headers)
+    vpcReq.raise_for_status()
+
+    # adding sensors to an existing network reuses its VPC
+    for vpc in vpcReq.json()["vpcs"]:
+        if vpc["name"] == name:
+            return vpc["id"], vpc["ip_range"]
+
+    vpcData = {"name": name, "region": region}
+    vpcReq = requests.post(endpoint, json=vpcData, headers=headers)
+    vpcReq.raise_for_status()
+
+    vpc = vpcReq.json()["vpc"]
+
+    return vpc["id"], vpc["ip_range"]
+
+
+def hostSize(hostObj, loggingNode=False, relay=False):
+    """Get droplet size slug of a server from its size key in credentials.json,
+    falling back to the default size for its role
+
+    :hostObj: JSON object representing logging node, relay or sensor server
+    :loggingNode: optional, whether hostObj is a logging node. Defaults to False
+    :relay: optional, whether hostObj is a regional relay. Defaults to False
+    :returns: droplet size slug
+
+    """
+    if "size" in hostObj:
+        return hostObj["size"]
+
+    if loggingNode:
+        return LOGGER_SIZE
+
+    if relay:
+        return RELAY_SIZE
+
+    return SHIPPER_SIZE if usesFilebeat(hostObj) else SENSOR_SIZE
+
 
 def chooseRegion(apiToken, defaultRegion):
     """Return most frequent previous droplet region to use for network servers
@@ -130,28 +244,250 @@ def chooseRegion(apiToken, defaultRegion):
         return defaultRegion
 
 
-def createAllVMs(apiToken, loggingObj, sensorObjs, sshKey):
-    """Create multiple DigitalOcean droplets from JSON objects in credentials.json
+def createVMs(apiToken, loggingObj, hostObjs, sshKeyId, vpc=False):
+    """Create DigitalOcean droplets of servers of a T-Pot network
 
     :apiToken: DigitalOcean API key
     :loggingObj: JSON object representing logging server
+    :hostObjs: list of tuples of the form (JSON object representing server, droplet
+    size slug, role), where role is logging, sensor or relay
+    :sshKeyId: ID of SSH key to add to each droplet (returned by addSSHKey)
+    :vpc: optional, whether to put every droplet in the VPC of the network in the
+    logging server's region. Defaults to False
+    :returns: private IP range of the VPC, or None if vpc is False
+
+    """
+    region = chooseRegion(apiToken, DEFAULT_REGION)
+    vpcUuid = vpcRange = None
+
+    if vpc:
+        region = loggingObj.get("region", region)
+
+        for hostObj, _, _ in hostObjs:
+            if hostObj.get("region", region) != region:
+                raise VPCRegionError(
+                    f"{hostObj['host']} is not in the logging server's region {region}"
+                )
+
+        vpcUuid, vpcRange = createVPC(apiToken, vpcName(loggingObj), region)
+
+    # size, image and region can be set per server in credentials.json
+    for hostObj, size, role in hostObjs:
+        subDomain, domainName = splitDomain(hostObj["host"])
+        createVM(
+            apiToken,
+            subDomain,
+            domainName,
+            hostObj.get("region", region),
+            sshKeyId,
+            size=size,
+            image=hostObj.get("image", DEFAULT_IMAGE),
+            vpcUuid=vpcUuid,
+            tags=dropletTags(loggingObj, role),
+        )
+
+    return vpcRange
+
+
+def createAllVMs(apiToken, loggingObj, sensorObjs, sshKey, vpc=False, relayObjs=None):
+    """Create multiple DigitalOcean droplets from JSON objects in credentials.json
+
+    :apiToken: DigitalOcean API key
+    :loggingObj: JSON object representing logging server (including any other
+    logging nodes in its nodes array)
     :sensorObjs: array of JSON objects representing sensor servers
     :sshKey: contents of SSH public key to add to each server
-    :returns: None
+    :vpc: optional, whether to put every droplet in one VPC in the logging server's
+    region. Defaults to False
+    :relayObjs: optional, array of JSON objects representing regional relays
+    :returns: private IP range of the VPC, or None if vpc is False
+
+    """
+    # networks deployed from the same server share its SSH key
+    sshKeyId = findSSHKeyId(apiToken, sshKey)
+
+    loggingNodes = getLoggingNodes(loggingObj)
+    hostObjs = [
+        *((node, hostSize(node, loggingNode=True), "logging") for node in loggingNodes),
+        *((sensor, hostSize(sensor), "sensor") for sensor in sensorObjs),
+        *((relay, hostSize(relay, relay=True), "relay") for relay in relayObjs or []),
+    ]
+
+    return createVMs(apiToken, loggingObj, hostObjs, sshKeyId, vpc)
+
+
+def listPages(apiToken, endpoint, key, params=None):
+    """Get every item of a paginated DigitalOcean API list, following the links to
+    the next pages
+
+    :apiToken: DigitalOcean API key
+    :endpoint: URL of API list, such as https://api.digitalocean.com/v2/droplets
+    :key: key of the items in each page, such as droplets
+    :params: optional, query parameters of the first page. Defaults to none
+    :returns: list of items (JSON objects)
 
     """
+    headers = {"Authorization": f"Bearer {apiToken}"}
+    params = {"per_page": 200, **(params or {})}
+    items = []
+
+    while endpoint is not None:
+        pageReq = requests.get(endpoint, headers=headers, params=params)
+        pageReq.raise_for_status()
+        page = pageReq.json()
+        items += page[key]
+
+        # next page links already hold the query parameters
+        endpoint = page.get("links", {}).get("pages", {}).get("next")
+        params = None
+
+    return items
+
+
+def findSSHKeyId(apiToken, keyContent):
+    """Find ID of an SSH public key already added to the DigitalOcean account,
+    adding it if it's missing
+
+    :apiToken: DigitalOcean API key
+    :keyContent: content of the public key (copy and paste the .pub file)
+    :returns: the SSH key's ID
+
+    """
+    endpoint = "https://api.digitalocean.com/v2/account/keys"
+
+    for key in listPages(apiToken, endpoint, "ssh_keys"):
+        if key["public_key"].strip() == keyContent.strip():
+            return key["id"]
+
     date = datetime.now().strftime("%m-%d-%Y")
-    sshKeyName = f"{KEY_BASE_NAME} {date}"
-    sshKeyId = addSSHKey(apiToken, sshKeyName, sshKey)
 
-    region = chooseRegion(apiToken, DEFAULT_REGION)
+    return addSSHKey(apiToken, f"{KEY_BASE_NAME} {date}", keyContent)
+
+
+def listDroplets(apiToken, tag=None):
+    """List the droplets of the DigitalOcean account
+
+    :apiToken: DigitalOcean API key
+    :tag: optional, only list droplets with this tag. Defaults to every droplet
+    :returns: list of droplet JSON objects (with name, id, tags and networks keys)
+
+    """
+    endpoint = "https://api.digitalocean.com/v2/droplets"
+    params = {} if tag is None else {"tag_name": tag}
+
+    return listPages(apiToken, endpoint, "droplets", params)
+
+
+def planReconcile(apiToken, loggingObj, sensorObjs):
+    """Compare the sensors in credentials.json with the sensor droplets of the
+    network, which are the droplets tagged with both the network's tag and
+    tpot-sensor (see dropletTags)
+
+    :apiToken: DigitalOcean API key
+    :loggingObj: JSON object representing logging server
+    :sensorObjs: array of JSON objects representing sensor servers
+    :returns: tuple of the form (list of JSON objects of sensors without a droplet,
+    list of JSON objects of sensor droplets of the network missing from sensorObjs)
+
+    """
+    # droplets with the same name in other networks or outside T-Pot don't count
+    networkTag, sensorTag = dropletTags(loggingObj, "sensor")
+    sensorDroplets = [
+        droplet
+        for droplet in listDroplets(apiToken, networkTag)
+        if sensorTag in droplet.get("tags", [])
+    ]
+    existing = {droplet["name"] for droplet in sensorDroplets}
+    # droplets are named after the subdomain of their server
+    wanted = {splitDomain(sensor["host"])[0] for sensor in sensorObjs}
+    missing = [
+        sensor
+        for sensor in sensorObjs
+        if splitDomain(sensor["host"])[0] not in existing
+    ]
+    removed = sorted(
+        (droplet for droplet in sensorDroplets if droplet["name"] not in wanted),
+        key=lambda droplet: droplet["name"],
+    )
+
+    return missing, removed
+
+
+def findUntaggedDroplets(apiToken, loggingObj, hostObjs):
+    """Find droplets of a network deployed before its droplets were tagged (see
+    dropletTags), which tag-based lookups would otherwise miss
+
+    :apiToken: DigitalOcean API key
+    :loggingObj: JSON object representing logging server
+    :hostObjs: array of JSON objects representing servers of the network
+    :returns: list of droplet JSON objects without the network's tag, named after a
+    server's subdomain and with the public address its A record points at
+
+    """
+    networkTag = vpcName(loggingObj)
+    hosts = [splitDomain(hostObj["host"]) for hostObj in hostObjs]
+    candidates = [
+        droplet
+        for droplet in listDroplets(apiToken)
+        if networkTag not in droplet.get("tags", [])
+        and droplet["name"] in {subDomain for subDomain, _ in hosts}
+    ]
+
+    if not candidates:
+        return []
+
+    # other networks and projects can have droplets with the same name, so only
+    # trust the droplets the servers' DNS records point at
+    hostRecords = set()
+
+    for domainName in {domainName for _, domainName in hosts}:
+        domainEndpoint = f"https://api.digitalocean.com/v2/domains/{domainName}/records"
+
+        for record in listPages(apiToken, domainEndpoint, "domain_records"):
+            if record["type"] == "A" and (record["name"], domainName) in hosts:
+                hostRecords.add((record["name"], record["data"]))
+
+    return [
+        droplet
+        for droplet in candidates
+        if any(
+            network["type"] == "public"
+            and (droplet["name"], network["ip_address"]) in hostRecords
+            for network in droplet["networks"]["v4"]
+        )
+    ]
+
 
-    subDomain, domainName = splitDomain(loggingObj["host"])
-    createVM(apiToken, subDomain, domainName, region, sshKeyId, loggerSize=True)
+def tagDroplets(apiToken, tags, dropletIds):
+    """Add tags to existing droplets through DigitalOcean API, creating the tags
+    first
 
-    for sensor in sensorObjs:
-        subDomain, domainName = splitDomain(sensor["host"])
-        createVM(apiToken, subDomain, domainName, region, sshKeyId)
+    :apiToken: DigitalOcean API key
+    :tags: list of tags to add (as returned by dropletTags)
+    :dropletIds: list of IDs of droplets to tag
+    :returns: None
+
+    """
+    endpoint = "https://api.digitalocean.com/v2/tags"
+    headers = {"Authorization": f"Bearer {apiToken}"}
+    resources = [
+        {"resource_id": str(dropletId), "resource_type": "droplet"}
+        for dropletId in dropletIds
+    ]
+
+    for tag in tags:
+        tagReq = requests.post(endpoint, headers=headers, json={"name": tag})
+
+        # 422 means the tag already exists, which is fine
+        if tagReq.status_code != 422:
+            tagReq.raise_for_status()
+
+        resourceReq = requests.post(
+            f"{endpoint}/{tag}/resources",
+            headers=headers,
+            json={"resources": resources},
+        )
+        resourceReq.raise_for_status()
 
 
 def deleteSSHKey(apiToken):
@@ -176,92 +512,131 @@ def deleteSSHKey(apiToken):
             sshDeleteReq.raise_for_status()
 
 
-def deleteDNSRecords(apiToken, tldList, subdomainList):
-    """Delete T-Pot DNS records through DigitalOcean API
+def deleteDropletRecords(apiToken, tldList, droplets):
+    """Delete the A records of droplets (the record of their name with their public
+    address and the -vpc record with their private one), leaving records with the
+    same names that point at other droplets
 
     :apiToken: DigitalOcean API key
-    :tldList: list of all top-level domain names involved in T-Pot network
-    :subdomainList: list of all subdomains involved in T-Pot network
+    :tldList: list of top-level domain names the records can be under
+    :droplets: list of droplet JSON objects (as returned by listDroplets)
     :returns: None
 
     """
     headers = {"Authorization": f"Bearer {apiToken}"}
-    recordsList = []
+    dropletRecords = set()
+
+    for droplet in droplets:
+        for network in droplet["networks"]["v4"]:
+            recordName = droplet["name"]
+
+            if network["type"] == "private":
+                recordName += "-vpc"
+
+            dropletRecords.add((recordName, network["ip_address"]))
 
-    # make list of all records across all domains
     for domainName in tldList:
         domainEndpoint = f"https://api.digitalocean.com/v2/domains/{domainName}/records"
-        recordReq = requests.get(domainEndpoint, headers=headers)
-        recordReq.raise_for_status()
-
-        # add top-level domain to each record to know how to delete it later
-        for record in recordReq.json()["domain_records"]:
-            # "domain" key isn't returned by API, so add it for use in next for loop
-            record["domain"] = domainName
-            recordsList.append(record)
-
-    # delete all T-Pot DNS records
-    for record in recordsList:
-        if record["name"] in subdomainList:
-            domainName = record["domain"]
-            recordId = record["id"]
-            domainEndpoint = (
-                "https://api.digitalocean.com/v2/domains/"
-                f"{domainName}/records/{recordId}"
-            )
-            recordDeleteReq = requests.delete(domainEndpoint, headers=headers)
-            recordDeleteReq.raise_for_status()
 
+        for record in listPages(apiToken, domainEndpoint, "domain_records"):
+            if (
+                record["type"] == "A"
+                and (record["name"], record["data"]) in dropletRecords
+            ):
+                recordDeleteReq = requests.delete(
+                    f"{domainEndpoint}/{record['id']}", headers=headers
+                )
+                recordDeleteReq.raise_for_status()
 
-def deleteDroplets(apiToken, subdomainList):
-    """Delete all T-Pot related droplets through DigitalOcean API
+
+def deleteDropletsById(apiToken, dropletIds):
+    """Delete droplets by ID through DigitalOcean API, so same-named droplets of other
+    networks are never touched
 
     :apiToken: DigitalOcean API key
-    :subdomainList: list of all subdomains involved in T-Pot network
+    :dropletIds: list of IDs of droplets to delete
     :returns: None
 
     """
     headers = {"Authorization": f"Bearer {apiToken}"}
-    dropletEndpoint = "https://api.digitalocean.com/v2/droplets"
-    dropletReq = requests.get(dropletEndpoint, headers=headers)
-    dropletReq.raise_for_status()
 
-    # delete all T-Pot droplets
-    for droplet in dropletReq.json()["droplets"]:
-        # installation scripts automatically name all droplets the subdomain chosen for
-        # each server in credentials.json, so rely on that to identify them
-        if droplet["name"] in subdomainList:
-            dropletId = droplet["id"]
-            dropletDeleteReq = requests.delete(
-                f"{dropletEndpoint}/{dropletId}", headers=headers
-            )
-            dropletDeleteReq.raise_for_status()
+    for dropletId in dropletIds:
+        dropletDeleteReq = requests.delete(
+            f"https://api.digitalocean.com/v2/droplets/{dropletId}", headers=headers
+        )
+        dropletDeleteReq.raise_for_status()
 
 
-def APIRemoveNetwork(apiToken, loggingObj, sensorObjs):
-    """Cleanly tear down all droplets/DNS records/SSH keys associated with T-Pot network
-    through DigitalOcean API
+def deleteVPC(apiToken, name, retries=12):
+    """Delete VPC of T-Pot network through DigitalOcean API, waiting for its droplets
+    to be gone first
 
     :apiToken: DigitalOcean API key
-    :loggingObj: JSON object representing logging server
-    :sensorObjs: array of JSON objects representing sensor servers
+    :name: name of VPC (as returned by vpcName)
+    :retries: optional, number of times to try deleting the VPC 5 seconds apart while
+    it still has droplets. Defaults to 12
     :returns: None
 
     """
-    subdomainList = []
-    tldList = []
+    endpoint = "https://api.digitalocean.com/v2/vpcs"
+    headers = {"Authorization": f"Bearer {apiToken}"}
+    vpcReq = requests.get(endpoint, headers=headers)
+    vpcReq.raise_for_status()
 
-    # get all subdomains and top-level domains involved in T-Pot network
-    for serverObj in [loggingObj] + sensorObjs:
-        subDomain, domainName = splitDomain(serverObj["host"])
-        subdomainList.append(subDomain)
-        tldList.append(domainName)
+    for vpc in vpcReq.json()["vpcs"]:
+        if vpc["name"] != name:
+            continue
 
-    # remove duplicate top-level domains
-    tldList = list(set(tldList))
+        vpcId = vpc["id"]
 
-    deleteSSHKey(apiToken)
+        # droplet deletion is asynchronous, and VPCs with members can't be deleted
+        for _ in range(retries):
+            vpcDeleteReq = requests.delete(f"{endpoint}/{vpcId}", headers=headers)
 
-    deleteDNSRecords(apiToken, tldList, subdomainList)
+            if vpcDeleteReq.status_code not in (403, 409):
+                break
 
-    deleteDroplets(apiToken, subdomainList)
+            time.sleep(5)
+
+        vpcDeleteReq.raise_for_status()
+
+
+def APIRemoveNetwork(apiToken, loggingObj, sensorObjs, relayObjs=None):
+    """Cleanly tear down all droplets/DNS records/SSH keys associated with T-Pot network
+    through DigitalOcean API, leaving other networks of the account untouched
+
+    :apiToken: DigitalOcean API key
+    :loggingObj: JSON object representing logging server
+    :sensorObjs: array of JSON objects representing sensor servers
+    :relayObjs: optional, array of JSON objects representing regional relays
+    :returns: None
+
+    """
+    hostObjs = getLoggingNodes(loggingObj) + sensorObjs + (relayObjs or [])
+    # the network's droplets by tag, same-named droplets of other networks don't
+    # count, plus those of networks deployed before droplets were tagged
+    droplets = listDroplets(apiToken, vpcName(loggingObj)) + findUntaggedDroplets(
+        apiToken, loggingObj, hostObjs
+    )
+    dropletIds = [droplet["id"] for droplet in droplets]
+    tldList = list({splitDomain(hostObj["host"])[1] for hostObj in hostObjs})
+
+    # by address and ID, like reconcileNetwork.py removing sensors
+    deleteDropletRecords(apiToken, tldList, droplets)
+    deleteDropletsById(apiToken, dropletIds)
+
+    # networks deployed from the same server share its SSH key, so keep it while any
+    # other T-Pot droplet is left
+    roleTags = {dropletTags(loggingObj, role)[1] for role in ROLES}
+    otherDroplets = [
+        droplet
+        for droplet in listDroplets(apiToken)
+        if droplet["id"] not in dropletIds
+        and roleTags.intersection(droplet.get("tags", []))
+    ]
+
+    if not otherDroplets:
+        deleteSSHKey(apiToken)
+
+    if loggingObj.get("vpc", False):
+        deleteVPC(apiToken, vpcName(loggingObj))